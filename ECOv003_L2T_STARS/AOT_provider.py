@@ -0,0 +1,198 @@
+import logging
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from os import makedirs
+from os.path import abspath, expanduser, join, exists
+from typing import Iterable, List, Tuple
+
+import numpy as np
+
+import colored_logging as cl
+from rasters import Raster, RasterGeometry
+from GEOS5FP import GEOS5FP
+
+from .atomic_file import temporary_filename
+from .grid_indices import grid_key
+from .process_cache import ProcessCache
+
+logger = logging.getLogger(__name__)
+
+AOT_CACHE_SIZE = 32  # number of AOT fields kept in memory per provider
+AOT_PREFETCH_WORKERS = 4  # number of GEOS-5 FP times fetched concurrently during prefetch
+
+# process-wide AOT providers keyed by GEOS-5 FP download and AOT cache directories
+_AOT_PROVIDERS = ProcessCache()
+
+
+class AOTProvider:
+    """
+    Serves GEOS-5 FP aerosol optical thickness resampled to raster grids,
+    cached in memory and on disk by (time, grid, resampling).
+
+    The cached arrays are shared by every raster served from them, so they are read-only.
+    """
+
+    def __init__(
+            self,
+            GEOS5FP_connection: GEOS5FP = None,
+            GEOS5FP_download: str = None,
+            AOT_directory: str = None,
+            cache_size: int = AOT_CACHE_SIZE):
+        if GEOS5FP_connection is None:
+            GEOS5FP_connection = GEOS5FP(
+                download_directory=GEOS5FP_download,
+            )
+
+        if AOT_directory is not None:
+            AOT_directory = abspath(expanduser(AOT_directory))
+
+        self.GEOS5FP = GEOS5FP_connection
+        self.AOT_directory = AOT_directory
+        self.cache_size = cache_size
+        # concurrent requests for the same field retrieve it once
+        self._cache = ProcessCache(size=cache_size)
+
+    def __repr__(self):
+        return f"AOTProvider(AOT_directory={self.AOT_directory}, cached={len(self._cache)})"
+
+    @staticmethod
+    def key(time_UTC: datetime, geometry: RasterGeometry, resampling: str = None) -> Tuple[str, str, str]:
+        return time_UTC.strftime("%Y%m%dT%H%M"), grid_key(geometry), str(resampling)
+
+    def AOT_filename(self, time_UTC: datetime, geometry: RasterGeometry, resampling: str = None) -> str:
+        if self.AOT_directory is None:
+            return None
+
+        timestamp, grid, resampling = self.key(time_UTC, geometry, resampling)
+
+        return join(
+            self.AOT_directory,
+            time_UTC.strftime("%Y.%m.%d"),
+            f"GEOS5FP_AOT_{timestamp}_{grid}_{resampling}.npy"
+        )
+
+    def _retrieve(self, time_UTC: datetime, geometry: RasterGeometry, resampling: str = None) -> np.ndarray:
+        filename = self.AOT_filename(time_UTC, geometry, resampling)
+
+        if filename is not None and exists(filename):
+            logger.info(f"loading AOT: {cl.file(filename)}")
+            array = np.load(filename)
+        else:
+            logger.info(f"retrieving GEOS-5 FP AOT at {cl.time(time_UTC)}")
+            AOT = self.GEOS5FP.AOT(time_UTC=time_UTC, geometry=geometry, resampling=resampling)
+            array = np.array(AOT.array if isinstance(AOT, Raster) else AOT, dtype=np.float32)
+
+            if filename is not None:
+                makedirs(os.path.dirname(filename), exist_ok=True)
+                temporary_AOT_filename = temporary_filename(filename)
+
+                with open(temporary_AOT_filename, "wb") as file:
+                    np.save(file, array)
+
+                os.replace(temporary_AOT_filename, filename)
+
+        array.flags.writeable = False
+
+        return array
+
+    def AOT(self, time_UTC: datetime, geometry: RasterGeometry, resampling: str = None) -> Raster:
+        """
+        Retrieves AOT for a time on a raster grid.
+
+        Args:
+            time_UTC (datetime): Time of the AOT field in UTC.
+            geometry (RasterGeometry): Target grid.
+            resampling (str, optional): Resampling method used to project GEOS-5 FP onto the grid.
+
+        Returns:
+            Raster: AOT on the target grid, backed by a read-only array.
+
+        Raises:
+            FailedGEOS5FPDownload: If the GEOS-5 FP field cannot be retrieved.
+        """
+        array = self._cache.get(
+            self.key(time_UTC, geometry, resampling),
+            lambda: self._retrieve(time_UTC, geometry, resampling)
+        )
+
+        return Raster(array, geometry=geometry)
+
+    def prefetch(
+            self,
+            requests: Iterable[Tuple[datetime, RasterGeometry]],
+            resampling: str = None,
+            workers: int = AOT_PREFETCH_WORKERS) -> List[Tuple[datetime, RasterGeometry]]:
+        """
+        Retrieves a batch of AOT fields ahead of use, fetching distinct GEOS-5 FP times concurrently.
+
+        Requests for the same time are handled by the same worker, so each GEOS-5 FP file is downloaded once.
+
+        Args:
+            requests: (time, grid) pairs to retrieve.
+            resampling (str, optional): Resampling method used to project GEOS-5 FP onto each grid.
+            workers (int, optional): Number of GEOS-5 FP times retrieved concurrently.
+
+        Returns:
+            List[Tuple[datetime, RasterGeometry]]: Requests that could not be retrieved.
+        """
+        requests_by_time = OrderedDict()
+
+        for time_UTC, geometry in requests:
+            requests_by_time.setdefault(time_UTC, []).append(geometry)
+
+        def retrieve(time_UTC: datetime) -> List[Tuple[datetime, RasterGeometry]]:
+            failed = []
+
+            for geometry in requests_by_time[time_UTC]:
+                filename = self.AOT_filename(time_UTC, geometry, resampling)
+
+                if filename is not None and exists(filename):
+                    continue
+
+                try:
+                    self.AOT(time_UTC=time_UTC, geometry=geometry, resampling=resampling)
+                except Exception as e:
+                    logger.warning(f"unable to prefetch GEOS-5 FP AOT at {cl.time(time_UTC)}: {e}")
+                    failed.append((time_UTC, geometry))
+
+            return failed
+
+        failed = []
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            for time_failed in executor.map(retrieve, list(requests_by_time)):
+                failed.extend(time_failed)
+
+        return failed
+
+
+def get_AOT_provider(
+        GEOS5FP_connection: GEOS5FP = None,
+        GEOS5FP_download: str = None,
+        AOT_directory: str = None) -> AOTProvider:
+    """
+    Retrieves the process-wide AOT provider for a GEOS-5 FP download directory and AOT cache directory.
+
+    Args:
+        GEOS5FP_connection (GEOS5FP, optional): Connection used if the provider does not exist yet.
+        GEOS5FP_download (str, optional): GEOS-5 FP download directory.
+        AOT_directory (str, optional): Directory of resampled AOT fields cached on disk.
+
+    Returns:
+        AOTProvider: The shared AOT provider.
+    """
+    if GEOS5FP_download is None and GEOS5FP_connection is not None:
+        GEOS5FP_download = GEOS5FP_connection.download_directory
+
+    key = (
+        None if GEOS5FP_download is None else abspath(expanduser(GEOS5FP_download)),
+        None if AOT_directory is None else abspath(expanduser(AOT_directory))
+    )
+
+    return _AOT_PROVIDERS.get(key, lambda: AOTProvider(
+        GEOS5FP_connection=GEOS5FP_connection,
+        GEOS5FP_download=GEOS5FP_download,
+        AOT_directory=AOT_directory
+    ))
@@ -1,57 +1,237 @@
+from functools import lru_cache
 from os.path import join, abspath, dirname
+from typing import Union
 import warnings
 import numpy as np
 from numpy import where, isnan, logical_not, nanmean, nan, logical_or, loadtxt, digitize, arange
 
+from rasters import Raster, RasterGeometry
 
-def statistical_radiative_transport(SZA, AOT):
+# narrowband-to-broadband coefficients for VIIRS M-bands
+# https://lpdaac.usgs.gov/documents/194/VNP43_ATBD_V1.pdf
+BROADBAND_ALBEDO_COEFFICIENTS = {
+    1: 0.2418,
+    2: -0.201,
+    3: 0.2093,
+    4: 0.1146,
+    5: 0.1348,
+    7: 0.2251,
+    8: 0.1123,
+    10: 0.0860,
+    11: 0.0803
+}
+
+BROADBAND_ALBEDO_INTERCEPT = -0.0131
+
+SRT_SZA_BINS = arange(0, 90, 1)[:-1]
+SRT_AOT_BINS = arange(0, 1, 0.02)[:-1]
+
+
+@lru_cache(maxsize=1)
+def load_statistical_radiative_transport() -> np.ndarray:
     filename = join(abspath(dirname(__file__)), 'statistical_radiative_transport.txt')
+    table = loadtxt(filename)
+    table.setflags(write=False)
 
-    data = loadtxt(filename)
+    return table
 
-    sza_index = digitize(SZA, arange(0, 90, 1)[:-1])
-    aot_index = digitize(AOT, arange(0, 1, 0.02)[:-1])
+
+def statistical_radiative_transport(SZA, AOT):
+    data = load_statistical_radiative_transport()
+
+    sza_index = digitize(SZA, SRT_SZA_BINS)
+    aot_index = digitize(AOT, SRT_AOT_BINS)
 
     SRT = data[sza_index, aot_index]
 
     return SRT
 
 
-def bidirectional_reflectance(white_sky_albedo, black_sky_albedo, SZA, AOT):
-    warnings.filterwarnings('ignore')
-
+def constrain_AOT(AOT):
     # constrain aerosol optical thickness
     # AOT = where(AOT >= 0.98, 0.97, AOT)
     # AOT = where(AOT < 0.02, 0.02, AOT)
     # AOT = where(isnan(AOT), 0.1, AOT)
-    AOT = np.clip(AOT, 0.1, 0.97)
-    AOT_mean = np.nanmean(AOT)
-    AOT = np.where(np.isnan(AOT), AOT_mean, AOT)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        AOT = np.clip(AOT, 0.1, 0.97)
+        AOT_mean = np.nanmean(AOT)
+        AOT = np.where(np.isnan(AOT), AOT_mean, AOT)
+
+    return AOT
+
 
+def constrain_SZA(SZA):
     # constrain SZA
-    SZA = where(
-        logical_or(SZA <= 0, SZA > 90),
-        nanmean(where(
-            logical_not(logical_or(SZA <= 0, SZA > 90)),
-            SZA,
-            nan
-        )),
-        SZA
-    )
-
-    warnings.resetwarnings()
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        SZA = where(
+            logical_or(SZA <= 0, SZA > 90),
+            nanmean(where(
+                logical_not(logical_or(SZA <= 0, SZA > 90)),
+                SZA,
+                nan
+            )),
+            SZA
+        )
 
     # gap-fill SZA with constant 45 degrees
     SZA = where(isnan(SZA), 45, SZA)
 
+    return SZA
+
+
+def bidirectional_reflectance(white_sky_albedo, black_sky_albedo, SZA, AOT):
+    AOT = constrain_AOT(AOT)
+    SZA = constrain_SZA(SZA)
+
     # lookup statistical radiative transport
     SRT = statistical_radiative_transport(SZA, AOT)
 
-    warnings.filterwarnings('ignore')
+    # cloud filter albedo, with floating point warnings silenced in this thread only
+    with np.errstate(invalid="ignore", over="ignore"):
+        blue_sky_albedo = white_sky_albedo * SRT + black_sky_albedo * (1 - SRT)
 
-    # cloud filter albedo
-    blue_sky_albedo = white_sky_albedo * SRT + black_sky_albedo * (1 - SRT)
+    return blue_sky_albedo
 
-    warnings.resetwarnings()
 
-    return blue_sky_albedo
+def _as_array(image: Union[Raster, np.ndarray]) -> np.ndarray:
+    if isinstance(image, Raster):
+        return image.array
+
+    return np.asarray(image)
+
+
+class BroadbandAlbedo:
+    """
+    Accumulates VIIRS M-band albedo into narrowband-to-broadband blue-sky albedo one band at a time.
+
+    The statistical radiative transport lookup is resolved once from the cleaned SZA and AOT,
+    and each band is blended and weighted into a single float32 output buffer,
+    so only one band has to be held in memory at a time.
+    """
+
+    def __init__(
+            self,
+            SZA: Union[Raster, np.ndarray] = None,
+            AOT: Union[Raster, np.ndarray] = None,
+            geometry: RasterGeometry = None,
+            clip_bands: bool = False,
+            dtype: type = np.float32):
+        """
+        Args:
+            SZA: Solar zenith angle in degrees. Required for blending white-sky and black-sky albedo.
+            AOT: Aerosol optical thickness. Required for blending white-sky and black-sky albedo.
+            geometry: Geometry of the output raster. Defaults to the geometry of the first raster added.
+            clip_bands: Clip each band to 0-1 before weighting.
+            dtype: Data type of the accumulation buffer.
+        """
+        self.dtype = dtype
+        self.clip_bands = clip_bands
+        self.geometry = geometry
+        self.SRT = None
+
+        if SZA is not None and AOT is not None:
+            SZA = constrain_SZA(_as_array(SZA))
+            AOT = constrain_AOT(_as_array(AOT))
+            self.SRT = statistical_radiative_transport(SZA, AOT).astype(dtype)
+
+        self._albedo = None
+        self._band_albedo = None
+        self.bands = []
+
+    def _buffers(self, shape):
+        if self._albedo is None:
+            self._albedo = np.full(shape, BROADBAND_ALBEDO_INTERCEPT, dtype=self.dtype)
+            self._band_albedo = np.empty(shape, dtype=self.dtype)
+
+        return self._albedo, self._band_albedo
+
+    def _accumulate(self, band: int, band_albedo: np.ndarray):
+        if band not in BROADBAND_ALBEDO_COEFFICIENTS:
+            raise ValueError(f"no broadband albedo coefficient for VIIRS band M{band}")
+
+        if band in self.bands:
+            raise ValueError(f"VIIRS band M{band} already added to broadband albedo")
+
+        if self.clip_bands:
+            np.clip(band_albedo, 0, 1, out=band_albedo)
+
+        band_albedo *= self.dtype(BROADBAND_ALBEDO_COEFFICIENTS[band])
+        self._albedo += band_albedo
+        self.bands.append(band)
+
+    def _capture_geometry(self, image: Union[Raster, np.ndarray]):
+        if self.geometry is None and isinstance(image, Raster):
+            self.geometry = image.geometry
+
+    def add(
+            self,
+            band: int,
+            white_sky_albedo: Union[Raster, np.ndarray],
+            black_sky_albedo: Union[Raster, np.ndarray]):
+        """
+        Blends white-sky and black-sky albedo of one M-band into blue-sky albedo and accumulates it.
+
+        Args:
+            band: VIIRS M-band number.
+            white_sky_albedo: White-sky albedo of the band.
+            black_sky_albedo: Black-sky albedo of the band.
+        """
+        if self.SRT is None:
+            raise ValueError("SZA and AOT are required to blend white-sky and black-sky albedo")
+
+        self._capture_geometry(white_sky_albedo)
+        WSA = _as_array(white_sky_albedo)
+        BSA = _as_array(black_sky_albedo)
+        albedo, band_albedo = self._buffers(WSA.shape)
+
+        # WSA * SRT + BSA * (1 - SRT) evaluated in place as BSA + SRT * (WSA - BSA)
+        np.subtract(WSA, BSA, out=band_albedo, casting="unsafe")
+        band_albedo *= self.SRT
+        np.add(band_albedo, BSA, out=band_albedo, casting="unsafe")
+
+        self._accumulate(band, band_albedo)
+
+    def add_reflectance(self, band: int, reflectance: Union[Raster, np.ndarray]):
+        """
+        Accumulates the reflectance of one M-band without BRDF blending.
+
+        Args:
+            band: VIIRS M-band number.
+            reflectance: Surface reflectance of the band.
+        """
+        self._capture_geometry(reflectance)
+        reflectance = _as_array(reflectance)
+        albedo, band_albedo = self._buffers(reflectance.shape)
+        np.copyto(band_albedo, reflectance, casting="unsafe")
+        self._accumulate(band, band_albedo)
+
+    @property
+    def complete(self) -> bool:
+        return set(self.bands) == set(BROADBAND_ALBEDO_COEFFICIENTS)
+
+    def result(self, clip: bool = True) -> Union[Raster, np.ndarray]:
+        """
+        Finalizes the broadband albedo.
+
+        Args:
+            clip: Clip the broadband albedo to 0-1.
+
+        Returns:
+            Broadband albedo as a Raster if a geometry is known, otherwise as an array.
+        """
+        if not self.complete:
+            missing = sorted(set(BROADBAND_ALBEDO_COEFFICIENTS) - set(self.bands))
+            raise ValueError(f"missing VIIRS bands for broadband albedo: {', '.join(f'M{band}' for band in missing)}")
+
+        albedo = self._albedo
+        self._band_albedo = None
+
+        if clip:
+            np.clip(albedo, 0, 1, out=albedo)
+
+        if self.geometry is None:
+            return albedo
+
+        return Raster(albedo, geometry=self.geometry)
@@ -3,6 +3,8 @@ from typing import Union
 import numpy as np
 from rasters import Raster, RasterGeometry
 
+from ..grid_indices import grid_latitude, grid_row_latitude
+
 
 def day_angle_rad_from_doy(doy):
     """
@@ -44,22 +46,44 @@ def SZA_deg_from_lat_dec_hour(latitude, solar_dec_deg, hour):
     return sza_deg
 
 
-def calculate_SZA(day_of_year: Union[Raster, float], hour_of_day: Union[Raster, float], geometry: RasterGeometry) -> Raster:
+def calculate_SZA(
+        day_of_year: Union[Raster, float],
+        hour_of_day: Union[Raster, float],
+        geometry: RasterGeometry,
+        indices_directory: str = None) -> Raster:
     """
     Calculates solar zenith angle at latitude and solar apparent time.
-    :param lat: latitude in degrees
-    :param dec: solar declination in degrees
-    :param hour: hour of day
+
+    When day of year and hour of day are scalars and latitude is constant along rows,
+    as it is on the sinusoidal MODLAND grid, the angle is computed once per row and broadcast.
+
+    :param day_of_year: day of year
+    :param hour_of_day: hour of day
+    :param geometry: raster geometry to calculate solar zenith angle for
+    :param indices_directory: directory of cached per-grid lat/lon indices
     :return: solar zenith angle in degrees
     """
     day_angle = (2 * np.pi * (day_of_year - 1)) / 365
-    lat = np.radians(geometry.lat)
     dec = np.radians((0.006918 - 0.399912 * np.cos(day_angle) + 0.070257 * np.sin(day_angle) - 0.006758 * np.cos(
         2 * day_angle) + 0.000907 * np.sin(2 * day_angle) - 0.002697 * np.cos(3 * day_angle) + 0.00148 * np.sin(
         3 * day_angle)) * (180 / np.pi))
     hour_angle = np.radians(hour_of_day * 15.0 - 180.0)
+
+    if np.ndim(day_of_year) == 0 and np.ndim(hour_of_day) == 0:
+        row_lat = grid_row_latitude(geometry, indices_directory=indices_directory)
+    else:
+        row_lat = None
+
+    if row_lat is None:
+        lat = np.radians(grid_latitude(geometry, indices_directory=indices_directory))
+    else:
+        lat = np.radians(row_lat)[:, np.newaxis]
+
     SZA = np.degrees(np.arccos(np.sin(lat) * np.sin(dec) + np.cos(lat) * np.cos(dec) * np.cos(hour_angle)))
+
+    if row_lat is not None:
+        SZA = np.broadcast_to(SZA, geometry.shape).copy()
+
     SZA = Raster(SZA, geometry=geometry)
 
     return SZA
-
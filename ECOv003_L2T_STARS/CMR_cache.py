@@ -0,0 +1,201 @@
+import hashlib
+import logging
+import threading
+from datetime import date, datetime, timedelta
+from os.path import abspath, expanduser, join
+from typing import Callable, Dict, List, Union
+
+import earthaccess
+
+import colored_logging as cl
+from rasters import Point, Polygon, RasterGeometry
+
+from .atomic_file import read_JSON, write_JSON
+from .constants import VIIRS_GIVEUP_DAYS
+from .daterange import date_range, get_date
+
+logger = logging.getLogger(__name__)
+
+CMR_CACHE_PAST_TTL_DAYS = 90  # lifetime of cached searches for dates whose granules are no longer expected to change
+CMR_CACHE_RECENT_TTL_HOURS = 3  # lifetime of cached searches for dates still within the VIIRS give-up window
+
+
+def granule_date(granule: dict) -> date:
+    return get_date(granule["umm"]["TemporalExtent"]["RangeDateTime"]["BeginningDateTime"])
+
+
+def spatial_key(target_geometry: Union[Point, Polygon, RasterGeometry] = None, tile: str = None) -> str:
+    """
+    Names the spatial extent of a CMR search for use as a cache directory.
+
+    Tile searches are keyed by tile, and geometry searches by a digest of the geometry in well-known text.
+    """
+    if tile is not None:
+        return f"tile_{tile}"
+
+    if target_geometry is None:
+        return "global"
+
+    if isinstance(target_geometry, RasterGeometry):
+        WKT = target_geometry.corner_polygon_latlon.wkt
+    else:
+        WKT = target_geometry.wkt
+
+    return f"geometry_{hashlib.sha256(WKT.encode()).hexdigest()[:16]}"
+
+
+class CMRCache:
+    """
+    Caches CMR granule searches on disk by concept, tile or geometry, and date.
+
+    Each date searched is stored as its own JSON file, including dates without granules,
+    so that overlapping date ranges only query CMR for the dates not already cached.
+    Dates older than the VIIRS give-up window expire after `past_TTL`, and recent dates after `recent_TTL`.
+    In offline mode, searches are served only from the cache regardless of age.
+    """
+
+    def __init__(
+            self,
+            directory: str,
+            concept_id: str,
+            query: Callable[..., List[earthaccess.search.DataGranule]],
+            tile_function: Callable[[earthaccess.search.DataGranule], str] = None,
+            offline: bool = False,
+            past_TTL: timedelta = timedelta(days=CMR_CACHE_PAST_TTL_DAYS),
+            recent_TTL: timedelta = timedelta(hours=CMR_CACHE_RECENT_TTL_HOURS),
+            giveup_days: int = VIIRS_GIVEUP_DAYS):
+        self.directory = abspath(expanduser(directory))
+        self.concept_id = concept_id
+        self.query = query
+        self.tile_function = tile_function
+        self.offline = offline
+        self.past_TTL = past_TTL
+        self.recent_TTL = recent_TTL
+        self.giveup_days = giveup_days
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"CMRCache(directory={self.directory}, concept_id={self.concept_id}, offline={self.offline})"
+
+    def filename(self, key: str, date_UTC: date) -> str:
+        return join(self.directory, self.concept_id, key, f"{date_UTC:%Y.%m.%d}.json")
+
+    def TTL(self, date_UTC: date, now: datetime = None) -> timedelta:
+        if now is None:
+            now = datetime.utcnow()
+
+        if (now.date() - date_UTC).days > self.giveup_days:
+            return self.past_TTL
+        else:
+            return self.recent_TTL
+
+    def _read(self, key: str, date_UTC: date) -> Dict:
+        return read_JSON(self.filename(key, date_UTC), "CMR cache file")
+
+    def _write(self, key: str, date_UTC: date, granules: List[dict], retrieved: datetime):
+        write_JSON(self.filename(key, date_UTC), {
+            "retrieved": retrieved.isoformat(),
+            "granules": [dict(granule) for granule in granules]
+        })
+
+    def _is_fresh(self, entry: Dict, date_UTC: date, now: datetime) -> bool:
+        retrieved = datetime.fromisoformat(entry["retrieved"])
+        return now - retrieved < self.TTL(date_UTC, now)
+
+    @staticmethod
+    def _granules(entry: Dict) -> List[earthaccess.search.DataGranule]:
+        return [earthaccess.search.DataGranule(granule, cloud_hosted=True) for granule in entry["granules"]]
+
+    def search(
+            self,
+            start_date: Union[date, str],
+            end_date: Union[date, str],
+            target_geometry: Union[Point, Polygon, RasterGeometry] = None,
+            tile: str = None) -> List[earthaccess.search.DataGranule]:
+        """
+        Searches for granules in a date range, querying CMR only for the dates missing or expired in the cache.
+
+        Contiguous runs of missing dates are retrieved with one query each.
+        If CMR cannot be reached and every missing date has an expired cache entry, the expired entries are used.
+
+        Raises:
+            CMRServerUnreachable: If CMR cannot be reached for dates that have never been cached.
+        """
+        start_date = get_date(start_date)
+        end_date = get_date(end_date)
+        key = spatial_key(target_geometry=target_geometry, tile=tile)
+        now = datetime.utcnow()
+        entries = {}
+        missing = []
+
+        for date_UTC in date_range(start_date, end_date):
+            entry = self._read(key, date_UTC)
+
+            if entry is not None:
+                entries[date_UTC] = entry
+
+            if entry is None or (not self.offline and not self._is_fresh(entry, date_UTC, now)):
+                missing.append(date_UTC)
+
+        if missing and self.offline:
+            logger.warning(
+                f"offline mode: no cached CMR search for {cl.val(len(missing))} dates "
+                f"from {cl.time(missing[0])} to {cl.time(missing[-1])} for {cl.val(key)}"
+            )
+        elif missing:
+            try:
+                self._retrieve(key, missing, target_geometry, tile, entries, now)
+            except Exception as e:
+                if not all(date_UTC in entries for date_UTC in missing):
+                    raise
+
+                logger.warning(f"using expired CMR search results for {cl.val(key)}: {e}")
+
+        granules = []
+
+        for date_UTC in sorted(entries):
+            granules.extend(self._granules(entries[date_UTC]))
+
+        return granules
+
+    def _retrieve(
+            self,
+            key: str,
+            dates: List[date],
+            target_geometry: Union[Point, Polygon, RasterGeometry],
+            tile: str,
+            entries: Dict,
+            now: datetime):
+        runs = [[dates[0]]]
+
+        for date_UTC in dates[1:]:
+            if date_UTC - runs[-1][-1] == timedelta(days=1):
+                runs[-1].append(date_UTC)
+            else:
+                runs.append([date_UTC])
+
+        for run in runs:
+            logger.info(f"searching CMR for {cl.val(self.concept_id)} from {cl.time(run[0])} to {cl.time(run[-1])}")
+            granules = self.query(run[0], run[-1], target_geometry=target_geometry, tile=tile)
+            granules_by_date = {date_UTC: [] for date_UTC in run}
+
+            for granule in granules:
+                granules_by_date.setdefault(granule_date(granule), []).append(granule)
+
+            with self._lock:
+                for date_UTC, date_granules in granules_by_date.items():
+                    self._write(key, date_UTC, date_granules, now)
+                    entries[date_UTC] = {"retrieved": now.isoformat(), "granules": [dict(g) for g in date_granules]}
+
+                    if tile is None and self.tile_function is not None:
+                        self._write_tiles(date_UTC, date_granules, now)
+
+    def _write_tiles(self, date_UTC: date, granules: List[earthaccess.search.DataGranule], now: datetime):
+        # a geometry search returns every granule of each tile it finds, so those tiles can be cached too
+        granules_by_tile = {}
+
+        for granule in granules:
+            granules_by_tile.setdefault(self.tile_function(granule), []).append(granule)
+
+        for tile, tile_granules in granules_by_tile.items():
+            self._write(spatial_key(tile=tile), date_UTC, tile_granules, now)
@@ -20,6 +20,8 @@ from .constants import *
 from .generate_L2T_STARS_runconfig import generate_L2T_STARS_runconfig
 from .runconfig import ECOSTRESSRunConfig, read_runconfig
 from .L2T_STARS import L2T_STARS
+from .STARS_connections import get_STARS_connections
+from .prefetch_scene_sources import prefetch_scene_sources
 
 # Read the version from the version.txt file
 with open(join(abspath(dirname(__file__)), "version.txt")) as f:
@@ -365,7 +367,7 @@ class ECOv003DLConfig(ECOSTRESSRunConfig):
             raise UnableToParseRunConfig(f"unable to parse run-config file: {filename}")
 
 
-def ECOv003_DL(runconfig_filename: str, tiles: List[str] = None) -> int:
+def ECOv003_DL(runconfig_filename: str, tiles: List[str] = None, batch: bool = False) -> int:
     """
     ECOSTRESS Collection 3 Downloader PGE.
     This function orchestrates the download process for data required for L2T LSTE product generation.
@@ -374,6 +376,9 @@ def ECOv003_DL(runconfig_filename: str, tiles: List[str] = None) -> int:
         runconfig_filename (str): Filename for the XML run-config.
         tiles (List[str], optional): A list of specific Sentinel tile IDs to process. If None, all tiles
                                      listed in the run-config will be considered. Defaults to None.
+        batch (bool, optional): If True, download the HLS and VNP09GA sources of all tiles in the scene
+                                at once before the per-tile runs, so that VIIRS granules shared by
+                                neighbouring tiles are searched and downloaded once. Defaults to False.
 
     Returns:
         int: An exit code indicating the success or failure of the operation.
@@ -414,13 +419,16 @@ def ECOv003_DL(runconfig_filename: str, tiles: List[str] = None) -> int:
         logger.info(
             f"processing {cl.val(len(L2T_LSTE_filenames))} tiles for orbit {cl.val(orbit)} scene {cl.val(scene)}")
 
-        # Iterate through each L2T LSTE filename (representing a tile)
+        # Initialize SentinelTileGrid to check if the tiles are on land
+        sentinel_tiles = SentinelTileGrid(target_resolution=70)
+        # L2T LSTE granules of the tiles to process, keyed by filename
+        L2T_LSTE_granules = {}
+
+        # Select the L2T LSTE filenames (representing tiles) to process
         for L2T_LSTE_filename in L2T_LSTE_filenames:
             # Create an L2TLSTE granule object to extract tile information
             L2T_LSTE_granule = L2TLSTE(L2T_LSTE_filename)
             tile = L2T_LSTE_granule.tile
-            # Initialize SentinelTileGrid to check if the tile is on land
-            sentinel_tiles = SentinelTileGrid(target_resolution=70)
 
             # Check if the Sentinel tile is on land
             if not sentinel_tiles.land(tile):
@@ -432,6 +440,39 @@ def ECOv003_DL(runconfig_filename: str, tiles: List[str] = None) -> int:
                 logger.info(f"Skipping tile {tile} as it's not in the specified --tiles list.")
                 continue
 
+            L2T_LSTE_granules[L2T_LSTE_filename] = L2T_LSTE_granule
+
+        # In batch mode, download the sources of the whole scene once, so the per-tile runs find them on disk
+        if batch:
+            logger.info(f"prefetching sources for {cl.val(len(L2T_LSTE_granules))} tiles in batch")
+
+            try:
+                # the per-tile runs in this process reuse these connections and their granule listings
+                connections = get_STARS_connections(
+                    working_directory=working_directory,
+                    sources_directory=L2T_STARS_sources_directory,
+                    indices_directory=L2T_STARS_indices_directory,
+                )
+
+                prefetch_scene_sources(
+                    tile_geometries={
+                        granule.tile: granule.geometry
+                        for granule in L2T_LSTE_granules.values()
+                    },
+                    tile_dates={
+                        granule.tile: granule.date_UTC
+                        for granule in L2T_LSTE_granules.values()
+                    },
+                    connections=connections,
+                )
+            except Exception as e:
+                logger.exception(e)
+                logger.warning("unable to prefetch scene sources, leaving them to the per-tile runs")
+
+        # Iterate through each selected L2T LSTE granule (representing a tile)
+        for L2T_LSTE_filename, L2T_LSTE_granule in L2T_LSTE_granules.items():
+            tile = L2T_LSTE_granule.tile
+
             logger.info(f"L2T LSTE filename: {cl.file(L2T_LSTE_filename)}")
             logger.info(f"orbit: {cl.val(orbit)} scene: {cl.val(scene)} tile: {cl.val(tile)}")
 
@@ -500,6 +541,12 @@ def main(argv=sys.argv):
         help="Optional: Space-separated list of specific Sentinel tile IDs (e.g., '30SWJ 30SXJ') "
              "to process. If not provided, all tiles in the run-config will be processed."
     )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="Optional: Download the sources of all tiles in the scene at once before the per-tile runs, "
+             "so that VIIRS granules shared by neighbouring tiles are downloaded once."
+    )
     parser.add_argument(
         "--version",
         action="version",
@@ -516,7 +563,7 @@ def main(argv=sys.argv):
 
     logger.info(f"Starting ECOSTRESS Collection 2 Downloader PGE ({cl.val(__version__)})")
     # Call the core ECOv003_DL function with parsed arguments
-    exit_code = ECOv003_DL(runconfig_filename=args.runconfig_filename, tiles=args.tiles)
+    exit_code = ECOv003_DL(runconfig_filename=args.runconfig_filename, tiles=args.tiles, batch=args.batch)
     logger.info(f"ECOSTRESS Collection 2 Downloader PGE finished with exit code: {cl.val(exit_code)}")
 
     return exit_code
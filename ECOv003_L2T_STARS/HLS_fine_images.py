@@ -0,0 +1,110 @@
+from datetime import date
+from typing import Dict, Tuple, Union
+import logging
+
+import numpy as np
+import rasters as rt
+from rasters import Raster
+
+from harmonized_landsat_sentinel import (
+    HLS2Connection,
+    HLSBandNotAcquired,
+    HLSLandsatNotAvailable,
+    HLSNotAvailable,
+    HLSSentinelNotAvailable,
+)
+
+from .daterange import get_date
+
+logger = logging.getLogger(__name__)
+
+
+class HLSFineImages:
+    """
+    Serves fine NDVI and albedo from an HLS connection, opening the Sentinel and Landsat granules
+    of a tile and date once for both products.
+
+    HLS granules cache the bands they decode, so NDVI and albedo derived from the same granule objects
+    share the red and NIR bands and the Fmask instead of reading them again.
+    NDVI and albedo are combined across sensors and resampled as `HLS2Connection.NDVI` and `HLS2Connection.albedo` do.
+    Granules are held until the object is discarded, so one is meant to be used per date.
+    """
+
+    def __init__(self, HLS_connection: HLS2Connection):
+        self.HLS_connection = HLS_connection
+        self._granules: Dict[Tuple[str, date], tuple] = {}
+
+    def __repr__(self):
+        return f"HLSFineImages({self.HLS_connection})"
+
+    def granules(self, tile: str, date_UTC: Union[date, str]) -> tuple:
+        """
+        Retrieves the Sentinel and Landsat granules at a tile on a date, either of which is None if not acquired.
+
+        Raises:
+            HLSSentinelMissing: If Sentinel is expected but not yet published.
+            HLSLandsatMissing: If Landsat is expected but not yet published.
+        """
+        key = (tile[:5], get_date(date_UTC))
+
+        if key not in self._granules:
+            try:
+                sentinel = self.HLS_connection.sentinel(tile=key[0], date_UTC=key[1])
+            except HLSSentinelNotAvailable:
+                sentinel = None
+
+            try:
+                landsat = self.HLS_connection.landsat(tile=key[0], date_UTC=key[1])
+            except HLSLandsatNotAvailable:
+                landsat = None
+
+            self._granules[key] = (sentinel, landsat)
+
+        return self._granules[key]
+
+    def product(self, product: str, tile: str, date_UTC: Union[date, str]) -> Raster:
+        """
+        Derives a product of the HLS granules at a tile on a date, resampled to the connection's target resolution.
+
+        Raises:
+            HLSNotAvailable: If neither sensor acquired the product's bands at the tile on the date.
+        """
+        sentinel, landsat = self.granules(tile, date_UTC)
+        tile = tile[:5]
+
+        if sentinel is None and landsat is None:
+            raise HLSNotAvailable(f"HLS2 is not available at {tile} on {date_UTC}")
+        elif landsat is None:
+            try:
+                image = getattr(sentinel, product)
+            except HLSBandNotAcquired as e:
+                logger.error(e)
+                raise HLSNotAvailable(f"HLS2 S30 is not available at {tile} on {date_UTC}")
+        elif sentinel is None:
+            try:
+                image = getattr(landsat, product)
+            except HLSBandNotAcquired as e:
+                logger.error(e)
+                raise HLSNotAvailable(f"HLS2 L30 is not available at {tile} on {date_UTC}")
+        else:
+            # Average the product from both sensors
+            image = rt.Raster(
+                np.nanmean(np.dstack([getattr(sentinel, product), getattr(landsat, product)]), axis=2),
+                geometry=sentinel.geometry
+            )
+
+        geometry = self.HLS_connection.grid(tile)
+
+        # Resample to target resolution if needed
+        if self.HLS_connection.target_resolution > 30:
+            image = image.to_geometry(geometry, resampling="average")
+        elif self.HLS_connection.target_resolution < 30:
+            image = image.to_geometry(geometry, resampling="cubic")
+
+        return image
+
+    def NDVI(self, tile: str, date_UTC: Union[date, str]) -> Raster:
+        return self.product("NDVI", tile, date_UTC)
+
+    def albedo(self, tile: str, date_UTC: Union[date, str]) -> Raster:
+        return self.product("albedo", tile, date_UTC)
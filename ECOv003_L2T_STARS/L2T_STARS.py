@@ -24,8 +24,6 @@ from harmonized_landsat_sentinel import (
     CMR_SEARCH_URL
 )
 
-from .LPDAAC.LPDAACDataPool import LPDAACServerUnreachable
-
 from ECOv003_exit_codes import *
 
 from ECOv002_granules import L2TLSTE as ECOv002L2TLSTE
@@ -34,12 +32,14 @@ import urllib
 
 from .version import __version__
 from .constants import *
-from .VIIRS.VNP43IA4 import VNP43IA4
-from .VIIRS.VNP43MA3 import VNP43MA3
-from .VNP43NRT import VNP43NRT
+from .STARS_connections import get_STARS_connections
 from .runconfig import ECOSTRESSRunConfig
 from .L2TSTARSConfig import L2TSTARSConfig
 from .load_prior import load_prior
+from .check_VIIRS_availability import check_VIIRS_availability
+from .daterange import date_range
+from .generate_downsampled_filename import generate_downsampled_filename
+from .missing_fine_dates import missing_fine_dates
 from .generate_STARS_inputs import generate_STARS_inputs
 from .process_STARS_product import process_STARS_product
 from .retrieve_STARS_sources import retrieve_STARS_sources
@@ -55,6 +55,7 @@ def L2T_STARS(
     albedo_resolution: int = ALBEDO_RESOLUTION,
     use_VNP43NRT: bool = USE_VNP43NRT,
     calibrate_fine: bool = CALIBRATE_FINE,
+    pooled_calibration: bool = POOLED_CALIBRATION,
     sources_only: bool = SOURCES_ONLY,
     remove_input_staging: bool = REMOVE_INPUT_STAGING,
     remove_prior: bool = REMOVE_PRIOR,
@@ -63,6 +64,8 @@ def L2T_STARS(
     threads: Union[int, str] = THREADS,
     num_workers: int = WORKERS,
     overwrite: bool = OVERWRITE, # New parameter for overwriting existing files
+    offline: bool = OFFLINE,
+    HLS_giveup_days: int = HLS_GIVEUP_DAYS,
 ) -> int:
     """
     ECOSTRESS Collection 3 L2T_STARS PGE (Product Generation Executive).
@@ -89,6 +92,8 @@ def L2T_STARS(
                                        Defaults to DEFAULT_USE_VNP43NRT (True).
         calibrate_fine (bool, optional): If True, calibrate fine resolution HLS data to
                                          coarse resolution VIIRS data. Defaults to DEFAULT_CALIBRATE_FINE (False).
+        pooled_calibration (bool, optional): If True, calibrate the fine images of dates with too few valid
+                                             pixels by a fit pooled over the window. Defaults to POOLED_CALIBRATION (False).
         sources_only (bool, optional): If True, only retrieve source data and exit,
                                        without performing data fusion. Defaults to False.
         remove_input_staging (bool, optional): If True, remove the input staging directory
@@ -103,6 +108,12 @@ def L2T_STARS(
                                      Defaults to 4.
         overwrite (bool, optional): If True, existing output files will be overwritten.
                                     Defaults to False.
+        offline (bool, optional): If True, VIIRS granule searches are served only from the
+                                  local CMR cache and HLS is not searched, so every fine image
+                                  must already be staged. Defaults to False.
+        HLS_giveup_days (int, optional): Days after acquisition when missing HLS data is recorded
+                                         as permanently unavailable instead of being searched again.
+                                         Defaults to HLS_GIVEUP_DAYS (10).
 
     Returns:
         int: An exit code indicating the success or failure of the PGE execution.
@@ -270,68 +281,31 @@ def L2T_STARS(
             )
 
 
-        # Initialize HLS data connection
-        logger.info(f"Connecting to CMR Search server: {CMR_SEARCH_URL}")
-        try:
-            HLS_connection = HLS2Connection(
-                working_directory=working_directory,
-                download_directory=HLS_download_directory,
-                # products_directory=HLS_products_directory,
-                target_resolution=target_resolution,
-            )
-        except CMRServerUnreachable as e:
-            logger.exception(e)
-            raise AuxiliaryServerUnreachable(
-                f"Unable to connect to CMR Search server: {CMR_SEARCH_URL}"
-            )
+        # Retrieve the connection context shared by every run in this process with the same configuration
+        connections = get_STARS_connections(
+            working_directory=working_directory,
+            sources_directory=sources_directory,
+            indices_directory=indices_directory,
+            target_resolution=target_resolution,
+            use_VNP43NRT=use_VNP43NRT,
+            initialize_julia=initialize_julia,
+            offline=offline,
+            HLS_giveup_days=HLS_giveup_days,
+        )
+
+        # Initialize HLS data connection, which connects to the CMR Search server on its first search
+        HLS_connection = connections.HLS_connection
 
         # Check if the tile is on land (HLS tiles cover land and ocean, STARS is for land)
         if not sentinel_tiles.land(tile=tile):
             raise LandFilter(f"Sentinel tile {tile} is not on land. Skipping processing.")
 
-        # Initialize VIIRS data connections based on 'use_VNP43NRT' flag
-        if use_VNP43NRT:
-            try:
-                NDVI_VIIRS_connection = VNP43NRT(
-                    working_directory=working_directory,
-                    download_directory=VIIRS_download_directory,
-                    mosaic_directory=VIIRS_mosaic_directory,
-                    GEOS5FP_download=GEOS5FP_download_directory,
-                    VNP09GA_directory=VNP09GA_products_directory,
-                    VNP43NRT_directory=VNP43NRT_products_directory,
-                    initialize_julia=initialize_julia,
-                )
-
-                albedo_VIIRS_connection = VNP43NRT(
-                    working_directory=working_directory,
-                    download_directory=VIIRS_download_directory,
-                    mosaic_directory=VIIRS_mosaic_directory,
-                    GEOS5FP_download=GEOS5FP_download_directory,
-                    VNP09GA_directory=VNP09GA_products_directory,
-                    VNP43NRT_directory=VNP43NRT_products_directory,
-                    initialize_julia=initialize_julia,
-                )
-            except CMRServerUnreachable as e:
-                logger.exception(e)
-                raise AuxiliaryServerUnreachable(f"Unable to connect to CMR search server for VNP43NRT.")
-        else:
-            try:
-                NDVI_VIIRS_connection = VNP43IA4(
-                    working_directory=working_directory,
-                    download_directory=VIIRS_download_directory,
-                    products_directory=VIIRS_products_directory,
-                    mosaic_directory=VIIRS_mosaic_directory,
-                )
-
-                albedo_VIIRS_connection = VNP43MA3(
-                    working_directory=working_directory,
-                    download_directory=VIIRS_download_directory,
-                    products_directory=VIIRS_products_directory,
-                    mosaic_directory=VIIRS_mosaic_directory,
-                )
-            except LPDAACServerUnreachable as e:
-                logger.exception(e)
-                raise AuxiliaryServerUnreachable(f"Unable to connect to VIIRS LPDAAC server.")
+        # Initialize VIIRS data connections based on 'use_VNP43NRT' flag, which connect on their first search:
+        # CMR login and search failures raise AuxiliaryServerUnreachable,
+        # and LPDAACServerUnreachable is a ConnectionError, mapped to the same exit code below
+        # With VNP43NRT, the NDVI and albedo connections are the same object
+        NDVI_VIIRS_connection = connections.NDVI_VIIRS_connection
+        albedo_VIIRS_connection = connections.albedo_VIIRS_connection
 
         # Define date ranges for data retrieval and fusion
         end_date = date_UTC
@@ -356,53 +330,112 @@ def L2T_STARS(
             f"{cl.time(VIIRS_start_date)} to {cl.time(end_date)}"
         )
 
-        # Get HLS listing to check for data availability
-        try:
-            HLS_listing = HLS_connection.listing(
-                tile=tile, start_UTC=HLS_start_date, end_UTC=HLS_end_date
-            )
-        except HLSTileNotAvailable as e:
-            logger.exception(e)
-            raise LandFilter(f"Sentinel tile {tile} cannot be processed due to HLS tile unavailability.")
-        except Exception as e:
-            logger.exception(e)
+        # Get HLS listing to check for data availability, only when some fine image still has to be produced
+        # In offline mode, HLS cannot be searched, so every fine image must already be staged
+        HLS_missing_dates = missing_fine_dates(
+            tile=tile,
+            HLS_start_date=HLS_start_date,
+            HLS_end_date=HLS_end_date,
+            target_resolution=target_resolution,
+            downsampled_directory=DOWNSAMPLED_products_directory,
+            negative_cache=connections.negative_cache,
+        )
+
+        if len(HLS_missing_dates) == 0:
+            logger.info(f"fine images are staged for every date, skipping HLS availability check for tile {cl.place(tile)}")
+        elif offline:
             raise AuxiliaryServerUnreachable(
-                f"Unable to scan Harmonized Landsat Sentinel server: {CMR_SEARCH_URL}"
+                f"offline: fine images of tile {tile} are not staged for dates: "
+                f"{', '.join([str(d) for d in HLS_missing_dates])}"
             )
+        else:
+            try:
+                HLS_listing = HLS_connection.listing(
+                    tile=tile, start_UTC=HLS_start_date, end_UTC=HLS_end_date
+                )
+            except HLSTileNotAvailable as e:
+                logger.exception(e)
+                raise LandFilter(f"Sentinel tile {tile} cannot be processed due to HLS tile unavailability.")
+            except Exception as e:
+                logger.exception(e)
+                raise AuxiliaryServerUnreachable(
+                    f"Unable to scan Harmonized Landsat Sentinel server: {CMR_SEARCH_URL}"
+                )
 
-        # Check for missing HLS Sentinel data
-        missing_sentinel_dates = HLS_listing[HLS_listing.sentinel == "missing"].date_UTC
-        if len(missing_sentinel_dates) > 0:
-            raise AuxiliaryLatency(
-                f"HLS Sentinel is not yet available at tile {tile} for dates: "
-                f"{', '.join(missing_sentinel_dates)}"
-            )
+            # Check for missing HLS Sentinel data
+            missing_sentinel_dates = HLS_listing[HLS_listing.sentinel == "missing"].date_UTC
+            if len(missing_sentinel_dates) > 0:
+                raise AuxiliaryLatency(
+                    f"HLS Sentinel is not yet available at tile {tile} for dates: "
+                    f"{', '.join(missing_sentinel_dates)}"
+                )
+
+            # Log available HLS Sentinel data
+            sentinel_listing = HLS_listing[~pd.isna(HLS_listing.sentinel)][
+                ["date_UTC", "sentinel"]
+            ]
+            logger.info(f"HLS Sentinel is available on {cl.val(len(sentinel_listing))} dates:")
+            for i, (list_date_utc, sentinel_granule) in sentinel_listing.iterrows():
+                sentinel_filename = sentinel_granule["meta"]["native-id"]
+                logger.info(f"* {cl.time(list_date_utc)}: {cl.file(sentinel_filename)}")
+
+            # Check for missing HLS Landsat data
+            missing_landsat_dates = HLS_listing[HLS_listing.landsat == "missing"].date_UTC
+            if len(missing_landsat_dates) > 0:
+                raise AuxiliaryLatency(
+                    f"HLS Landsat is not yet available at tile {tile} for dates: "
+                    f"{', '.join(missing_landsat_dates)}"
+                )
+
+            # Log available HLS Landsat data
+            landsat_listing = HLS_listing[~pd.isna(HLS_listing.landsat)][
+                ["date_UTC", "landsat"]
+            ]
+            logger.info(f"HLS Landsat is available on {cl.val(len(landsat_listing))} dates:")
+            for i, (list_date_utc, landsat_granule) in landsat_listing.iterrows():
+                landsat_filename = landsat_granule["meta"]["native-id"]
+                logger.info(f"* {cl.time(list_date_utc)}: {cl.file(landsat_filename)}")
 
-        # Log available HLS Sentinel data
-        sentinel_listing = HLS_listing[~pd.isna(HLS_listing.sentinel)][
-            ["date_UTC", "sentinel"]
-        ]
-        logger.info(f"HLS Sentinel is available on {cl.val(len(sentinel_listing))} dates:")
-        for i, (list_date_utc, sentinel_granule) in sentinel_listing.iterrows():
-            sentinel_filename = sentinel_granule["meta"]["native-id"]
-            logger.info(f"* {cl.time(list_date_utc)}: {cl.file(sentinel_filename)}")
-
-        # Check for missing HLS Landsat data
-        missing_landsat_dates = HLS_listing[HLS_listing.landsat == "missing"].date_UTC
-        if len(missing_landsat_dates) > 0:
-            raise AuxiliaryLatency(
-                f"HLS Landsat is not yet available at tile {tile} for dates: "
-                f"{', '.join(missing_landsat_dates)}"
+        # Check from granule metadata that VIIRS is published for the dates that would otherwise cause a retry
+        try:
+            check_VIIRS_availability(
+                tile=tile,
+                geometry=geometry,
+                VIIRS_start_date=VIIRS_start_date,
+                VIIRS_end_date=VIIRS_end_date,
+                NDVI_resolution=NDVI_resolution,
+                albedo_resolution=albedo_resolution,
+                downsampled_directory=DOWNSAMPLED_products_directory,
+                NDVI_VIIRS_connection=NDVI_VIIRS_connection,
+                albedo_VIIRS_connection=albedo_VIIRS_connection,
             )
+        except AuxiliaryLatency as e:
+            raise e
+        except Exception as e:
+            logger.warning(f"unable to check VIIRS availability, proceeding: {e}")
 
-        # Log available HLS Landsat data
-        landsat_listing = HLS_listing[~pd.isna(HLS_listing.landsat)][
-            ["date_UTC", "landsat"]
-        ]
-        logger.info(f"HLS Landsat is available on {cl.val(len(landsat_listing))} dates:")
-        for i, (list_date_utc, landsat_granule) in landsat_listing.iterrows():
-            landsat_filename = landsat_granule["meta"]["native-id"]
-            logger.info(f"* {cl.time(list_date_utc)}: {cl.file(landsat_filename)}")
+        # Prefetch GEOS-5 FP AOT in one batch for the dates of the BRDF-corrected VIIRS albedo window
+        # whose coarse albedo is not yet staged, except offline, where GEOS-5 FP is not contacted
+        if offline:
+            logger.info("offline: skipping GEOS-5 FP AOT prefetch")
+        else:
+            pending_albedo_dates = [
+                processing_date
+                for processing_date in date_range(VIIRS_start_date, VIIRS_end_date)
+                if not exists(generate_downsampled_filename(
+                    directory=DOWNSAMPLED_products_directory,
+                    variable="albedo",
+                    date_UTC=processing_date,
+                    tile=tile,
+                    cell_size=albedo_resolution
+                ))
+            ]
+
+            if len(pending_albedo_dates) > 0:
+                albedo_VIIRS_connection.prefetch_AOT(
+                    dates=pending_albedo_dates,
+                    geometry=geometry,
+                )
 
         # If only sources are requested, retrieve them and exit
         if sources_only:
@@ -416,6 +449,7 @@ def L2T_STARS(
                 VIIRS_end_date=VIIRS_end_date,
                 HLS_connection=HLS_connection,
                 VIIRS_connection=NDVI_VIIRS_connection, # Use NDVI_VIIRS_connection as a general VIIRS connection
+                negative_cache=connections.negative_cache,
             )
             # Regenerate inputs to ensure all files are staged, even if not fused
             NDVI_coarse_geometry = HLS_connection.grid(tile=tile, cell_size=NDVI_resolution)
@@ -438,6 +472,9 @@ def L2T_STARS(
                 NDVI_VIIRS_connection=NDVI_VIIRS_connection,
                 albedo_VIIRS_connection=albedo_VIIRS_connection,
                 calibrate_fine=calibrate_fine,
+                pooled_calibration=pooled_calibration,
+                negative_cache=connections.negative_cache,
+                indices_directory=indices_directory,
             )
         else:
             # Otherwise, proceed with full product processing
@@ -467,12 +504,15 @@ def L2T_STARS(
                 albedo_VIIRS_connection=albedo_VIIRS_connection,
                 using_prior=using_prior,
                 calibrate_fine=calibrate_fine,
+                pooled_calibration=pooled_calibration,
                 remove_input_staging=remove_input_staging,
                 remove_prior=remove_prior,
                 remove_posterior=remove_posterior,
                 initialize_julia=initialize_julia,
                 threads=threads,
                 num_workers=num_workers,
+                negative_cache=connections.negative_cache,
+                indices_directory=indices_directory,
             )
 
     # --- Exception Handling for PGE ---
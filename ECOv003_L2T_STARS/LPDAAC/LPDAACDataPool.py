@@ -1,15 +1,17 @@
-import netrc
 import hashlib
+import netrc
 import logging
 import os
 import posixpath
 import re
-import shutil
+import threading
 import urllib
-from datetime import date
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
 from fnmatch import fnmatch
+from html.parser import HTMLParser
 from http.cookiejar import CookieJar
-from os import makedirs, remove
+from os import makedirs
 from os.path import dirname
 from os.path import exists
 from os.path import getsize
@@ -18,13 +20,16 @@ from os.path import join
 from os.path import abspath
 from os.path import expanduser
 from time import sleep
-from typing import List, OrderedDict
+from typing import Dict, List, OrderedDict
 
 import requests
 import xmltodict
-from bs4 import BeautifulSoup
 from dateutil import parser
-from ..cksum import cksum
+from ..download_scheduler import DOWNLOAD_WORKERS, PARTIAL_EXTENSION, DownloadScheduler, checksum_hasher
+from ..download_scheduler import DownloadFailed as ScheduledDownloadFailed
+from ..atomic_file import read_JSON, write_JSON
+from ..constants import VIIRS_GIVEUP_DAYS
+from ..endpoints import LPDAAC_remote
 
 import colored_logging as cl
 
@@ -43,6 +48,9 @@ XML_RETRIES = RETRIES
 XML_TIMEOUT = WAIT_SECONDS
 DOWNLOAD_RETRIES = RETRIES
 DOWNLOAD_WAIT_SECONDS = WAIT_SECONDS
+LISTING_PAST_TTL_DAYS = 90  # days before re-listing a date directory past the give-up window
+LISTING_RECENT_TTL_HOURS = 3  # hours before re-listing a recent date directory or a product directory
+LISTING_WORKERS = 8  # concurrent directory listing requests
 
 __author__ = "Gregory Halverson"
 
@@ -53,15 +61,66 @@ class LPDAACServerUnreachable(ConnectionError):
     pass
 
 
+class HrefExtractor(HTMLParser):
+    """
+    Collects the targets of the anchors in a data pool directory page.
+    """
+
+    def __init__(self):
+        super(HrefExtractor, self).__init__()
+        self.hrefs = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag != "a":
+            return
+
+        for name, value in attrs:
+            if name == "href" and value is not None:
+                self.hrefs.append(value)
+
+
+def extract_hrefs(text: str) -> List[str]:
+    extractor = HrefExtractor()
+    extractor.feed(text)
+    extractor.close()
+
+    return extractor.hrefs
+
+
+class EarthdataSession(requests.Session):
+    """
+    Session that keeps its credentials when the data pool redirects to Earthdata Login,
+    and drops them for any other host.
+    """
+    AUTH_HOST = "urs.earthdata.nasa.gov"
+
+    def rebuild_auth(self, prepared_request, response):
+        headers = prepared_request.headers
+        original_host = requests.utils.urlparse(response.request.url).hostname
+        redirect_host = requests.utils.urlparse(prepared_request.url).hostname
+
+        if "Authorization" not in headers or original_host == redirect_host:
+            return
+
+        if self.AUTH_HOST not in (original_host, redirect_host):
+            del headers["Authorization"]
+
+
 class LPDAACDataPool:
     logger = logging.getLogger(__name__)
     DEFAULT_CHUNK_SIZE = 2 ** 20
     DATE_REGEX = re.compile(r'^(19|20)\d\d[- /.](0[1-9]|1[012])[- /.](0[1-9]|[12][0-9]|3[01])$')
     DEFAULT_REMOTE = DEFAULT_REMOTE
 
-    def __init__(self, username: str = None, password: str = None, remote: str = None, offline_ok: bool = True):
+    def __init__(
+            self,
+            username: str = None,
+            password: str = None,
+            remote: str = None,
+            offline_ok: bool = True,
+            listing_directory: str = None):
         if remote is None:
-            remote = DEFAULT_REMOTE
+            remote = LPDAAC_remote()
 
         if username is None or password is None:
             try:
@@ -84,17 +143,26 @@ class LPDAACDataPool:
         # if self.offline_ok:
         #     logger.warning("going into offline mode")
 
+        self.listing_directory = None if listing_directory is None else abspath(expanduser(listing_directory))
         self._listings = {}
+        self._listings_lock = threading.Lock()
+        self._download_schedulers = {}
+        self._download_schedulers_lock = threading.Lock()
+        # authentication and the remote check are deferred to the first request to the data pool,
+        # so that runs served entirely from local files need neither credentials nor network
+        self._connected = False
+        self._connect_lock = threading.Lock()
+
+    def _connect(self):
+        with self._connect_lock:
+            if self._connected:
+                return
 
-        if not self.offline_ok:
-            try:
+            if not self.offline_ok:
                 self._authenticate()
                 self._check_remote()
-            except Exception as e:
-                if self.offline_ok:
-                    logger.warning("unable to connect to LP-DAAC data pool")
-                else:
-                    raise e
+
+            self._connected = True
 
     def _authenticate(self):
         try:
@@ -163,6 +231,8 @@ class LPDAACDataPool:
         return self._remote
 
     def get_HTTP_text(self, URL: str) -> str:
+        self._connect()
+
         try:
             request = urllib.request.Request(URL)
             response = urllib.request.urlopen(request)
@@ -173,17 +243,85 @@ class LPDAACDataPool:
 
         return body
 
-    def get_HTTP_listing(self, URL: str, pattern: str = None) -> List[str]:
-        if URL in self._listings:
-            listing = self._listings[URL]
-        else:
+    def listing_TTL(self, URL: str, now: datetime = None) -> timedelta:
+        """
+        Date directories past the give-up window are complete and rarely change,
+        while recent date directories and product directories keep gaining entries.
+        """
+        if now is None:
+            now = datetime.utcnow()
+
+        name = posixpath.basename(URL.rstrip("/"))
+
+        if self.DATE_REGEX.match(name):
+            listing_date = parser.parse(name).date()
+
+            if listing_date < now.date() - timedelta(days=VIIRS_GIVEUP_DAYS):
+                return timedelta(days=LISTING_PAST_TTL_DAYS)
+
+        return timedelta(hours=LISTING_RECENT_TTL_HOURS)
+
+    def listing_filename(self, URL: str) -> str:
+        name = posixpath.basename(URL.rstrip("/"))
+        key = hashlib.sha1(URL.encode()).hexdigest()[:16]
+
+        return join(self.listing_directory, f"{name}.{key}.json")
+
+    def _read_cached_listing(self, URL: str) -> (List[str], datetime):
+        if self.listing_directory is None:
+            return None, None
+
+        filename = self.listing_filename(URL)
+        entry = read_JSON(filename, "listing cache file")
+
+        if entry is None:
+            return None, None
+
+        try:
+            return entry["listing"], datetime.fromisoformat(entry["retrieved"])
+        except (ValueError, KeyError) as e:
+            logger.warning(f"ignoring unreadable listing cache file {filename}: {e}")
+            return None, None
+
+    def _write_cached_listing(self, URL: str, listing: List[str]):
+        if self.listing_directory is None:
+            return
+
+        write_JSON(
+            self.listing_filename(URL),
+            {"URL": URL, "retrieved": datetime.utcnow().isoformat(), "listing": listing}
+        )
+
+    def _fetch_HTTP_listing(self, URL: str) -> List[str]:
+        cached_listing, retrieved = self._read_cached_listing(URL)
+
+        if cached_listing is not None and datetime.utcnow() - retrieved < self.listing_TTL(URL):
+            return cached_listing
+
+        try:
             text = self.get_HTTP_text(URL)
-            soup = BeautifulSoup(text, 'html.parser')
-            links = list(soup.find_all('a', href=True))
+        except ConnectionError as e:
+            if cached_listing is None:
+                raise e
+
+            logger.warning(f"using expired listing retrieved {retrieved:%Y-%m-%d %H:%M} UTC: {cl.URL(URL)}")
+            return cached_listing
+
+        # get directory names from links on http site
+        listing = sorted([href.replace('/', '') for href in extract_hrefs(text)])
+        self._write_cached_listing(URL, listing)
+
+        return listing
+
+    def get_HTTP_listing(self, URL: str, pattern: str = None) -> List[str]:
+        with self._listings_lock:
+            listing = self._listings.get(URL)
 
-            # get directory names from links on http site
-            listing = sorted([link['href'].replace('/', '') for link in links])
-            self._listings[URL] = listing
+        if listing is None:
+            listing = self._fetch_HTTP_listing(URL)
+
+            with self._listings_lock:
+                self._listings[URL] = listing
 
         if pattern is not None:
             listing = sorted([
@@ -195,6 +333,18 @@ class LPDAACDataPool:
 
         return listing
 
+    def get_HTTP_listings(self, URLs: List[str], workers: int = LISTING_WORKERS) -> Dict[str, List[str]]:
+        """
+        Lists several directories concurrently, returning the listings by URL.
+        """
+        URLs = list(dict.fromkeys(URLs))
+
+        if len(URLs) <= 1 or workers <= 1:
+            return {URL: self.get_HTTP_listing(URL) for URL in URLs}
+
+        with ThreadPoolExecutor(max_workers=min(workers, len(URLs))) as executor:
+            return dict(zip(URLs, executor.map(self.get_HTTP_listing, URLs)))
+
     def get_HTTP_date_listing(self, URL: str) -> List[date]:
         return sorted([
             parser.parse(item).date()
@@ -210,6 +360,7 @@ class LPDAACDataPool:
         return f"{URL}.xml"
 
     def get_metadata(self, data_URL: str) -> OrderedDict:
+        self._connect()
         metadata_URL = f"{data_URL}.xml"
         logger.info(f"checking metadata: {cl.URL(metadata_URL)}")
         request = urllib.request.Request(metadata_URL)
@@ -230,11 +381,13 @@ class LPDAACDataPool:
                        "FileSize"])
 
     def get_local_checksum(self, filename: str, checksum_type: str = "CKSUM") -> str:
+        hasher = checksum_hasher(checksum_type)
+
         with open(filename, "rb") as file:
-            if checksum_type == "CKSUM":
-                return str(int(cksum(file)))
-            elif checksum_type == "MD5":
-                return str(hashlib.md5(file.read()).hexdigest())
+            for chunk in iter(lambda: file.read(self.DEFAULT_CHUNK_SIZE), b""):
+                hasher.update(chunk)
+
+        return hasher.hexdigest()
 
     def get_local_filesize(self, filename: str) -> int:
         return getsize(filename)
@@ -282,6 +435,39 @@ class LPDAACDataPool:
 
         return listing
 
+    def _session(self) -> requests.Session:
+        session = EarthdataSession()
+
+        if self._username is not None and self._password is not None:
+            session.auth = (self._username, self._password)
+
+        return session
+
+    def download_scheduler(self, retries: int = None, wait_seconds: float = None) -> DownloadScheduler:
+        """
+        Scheduler downloading over keep-alive sessions authenticated with the data pool credentials.
+
+        Schedulers are shared by every download of this connection with the same retry policy.
+        """
+        if retries is None:
+            retries = DOWNLOAD_RETRIES
+
+        if wait_seconds is None:
+            wait_seconds = DOWNLOAD_WAIT_SECONDS
+
+        self._connect()
+        key = (retries, wait_seconds)
+
+        with self._download_schedulers_lock:
+            if key not in self._download_schedulers:
+                self._download_schedulers[key] = DownloadScheduler(
+                    session_factory=self._session,
+                    retries=retries,
+                    max_backoff_seconds=wait_seconds
+                )
+
+            return self._download_schedulers[key]
+
     def download_URL(
             self,
             URL: str,
@@ -299,7 +485,6 @@ class LPDAACDataPool:
             logger.info(f"file already retrieved: {cl.file(filename)}")
             return filename
 
-        # metadata = self.get_metadata(URL)
         metadata_URL = f"{URL}.xml"
         logger.info(f"checking metadata: {cl.URL(metadata_URL)}")
 
@@ -308,7 +493,8 @@ class LPDAACDataPool:
         else:
             metadata_filename = f"{download_location}.xml"
 
-        makedirs(abspath(dirname(expanduser(metadata_filename))), exist_ok=True)
+        metadata_filename = abspath(expanduser(metadata_filename))
+        makedirs(dirname(metadata_filename), exist_ok=True)
 
         if XML_retries is None:
             XML_retries = XML_RETRIES
@@ -316,47 +502,27 @@ class LPDAACDataPool:
         if XML_timeout_seconds is None:
             XML_timeout_seconds = XML_TIMEOUT
 
-        if download_retries is None:
-            download_retries = DOWNLOAD_RETRIES
-
-        if download_wait_seconds is None:
-            download_wait_seconds = DOWNLOAD_WAIT_SECONDS
-
+        metadata_scheduler = self.download_scheduler(retries=XML_retries, wait_seconds=XML_timeout_seconds)
         metadata = None
 
         while XML_retries > 0:
             XML_retries -= 1
-            command = f"wget -nc -c --user {self._username} --password {self._password} -O {abspath(expanduser(metadata_filename))} {metadata_URL}"
-            # logger.info(command)
-            os.system(command)
-
-            if not exists(metadata_filename):
-                logger.warning(f"download not found for metadata URL: {metadata_URL}")
-                logger.warning(f"waiting {XML_timeout_seconds} for retry")
-                sleep(XML_timeout_seconds)
-                continue
-
-            XML_metadata_filesize = self.get_local_filesize(metadata_filename)
 
-            if XML_metadata_filesize == 0 and exists(metadata_filename):
-                logger.warning(f"removing corrupted zero-size metadata file: {metadata_filename}")
-
-                try:
-                    os.remove(metadata_filename)
-                except (OSError, PermissionError) as e:
-                    logger.warning(f"unable to remove zero-size metadata file: {metadata_filename}: {e}")
-
-                logger.warning(f"waiting {XML_timeout_seconds} for retry")
-                sleep(XML_timeout_seconds)
-                continue
+            try:
+                metadata_scheduler.download(metadata_URL, metadata_filename)
+            except ScheduledDownloadFailed as e:
+                logger.warning(e)
+                break
 
             try:
-                with open(abspath(expanduser(metadata_filename)), "r") as file:
+                with open(metadata_filename, "r") as file:
                     metadata = xmltodict.parse(file.read())
+
+                break
             except Exception as e:
                 logger.warning(e)
                 logger.warning(f"unable to parse metadata file: {metadata_filename}")
-                os.remove(abspath(expanduser(metadata_filename)))
+                os.remove(metadata_filename)
                 logger.warning(f"waiting {XML_timeout_seconds} for retry")
                 sleep(XML_timeout_seconds)
                 continue
@@ -373,73 +539,59 @@ class LPDAACDataPool:
 
         logger.info(
             f"metadata retrieved {checksum_type} checksum: {cl.val(remote_checksum)} size: {cl.val(remote_filesize)} URL: {cl.URL(metadata_URL)}")
-        makedirs(abspath(dirname(expanduser(filename))), exist_ok=True)
+        filename = abspath(expanduser(filename))
         logger.info(f"downloading {cl.URL(URL)} -> {cl.file(filename)}")
 
-        # Use a temporary file for downloading
-        temporary_filename = f"{filename}.download"
+        # resume a partial download left by earlier versions under their temporary filename
+        legacy_temporary_filename = f"{filename}.download"
+        partial_filename = f"{filename}{PARTIAL_EXTENSION}"
+
+        if exists(legacy_temporary_filename) and not exists(partial_filename):
+            os.replace(legacy_temporary_filename, partial_filename)
+
+        # the checksum is computed as the file streams in, and partial files are resumed with Range requests
+        try:
+            self.download_scheduler(retries=download_retries, wait_seconds=download_wait_seconds).download(
+                URL=URL,
+                filename=filename,
+                checksum=remote_checksum,
+                checksum_algorithm=checksum_type,
+                size=remote_filesize
+            )
+        except ScheduledDownloadFailed as e:
+            raise DownloadFailed(f"unable to download URL: {URL}") from e
+
+        logger.info(
+            f"successful download with filesize {cl.val(remote_filesize)} {checksum_type} checksum {cl.val(remote_checksum)}: {cl.file(filename)}")
+
+        return filename
+
+    def download_URLs(self, URLs: List[str], download_location: str = None, workers: int = DOWNLOAD_WORKERS) -> List[str]:
+        """
+        Downloads several URLs concurrently through a bounded pool.
+
+        Returns:
+            List[str]: Filenames in the order of the URLs.
 
-        while download_retries > 0:
-            download_retries -=1
+        Raises:
+            DownloadFailed: If any download fails, after the others have finished.
+        """
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="LPDAAC_download") as executor:
+            futures = [executor.submit(self.download_URL, URL, download_location) for URL in URLs]
 
+        filenames = []
+        download_exception = None
+
+        for URL, future in zip(URLs, futures):
             try:
-                if exists(abspath(expanduser(temporary_filename))):
-                    temporary_filesize = self.get_local_filesize(abspath(expanduser(temporary_filename)))
-
-                    if temporary_filesize > remote_filesize:
-                        logger.warning(
-                            f"removing corrupted file with size {temporary_filesize} greater than remote size {remote_filesize}: {temporary_filename}")
-                        remove(temporary_filename)
-
-                    elif temporary_filesize == remote_filesize:
-                        local_checksum = self.get_local_checksum(abspath(expanduser(temporary_filename)), checksum_type=checksum_type)
-
-                        if local_checksum == remote_checksum:
-                            try:
-                                shutil.move(abspath(expanduser(temporary_filename)), abspath(expanduser(filename)))
-                            except Exception as e:
-                                if exists(filename):
-                                    logger.warning(f"unable to move temporary file: {temporary_filename}")
-                                    return filename
-
-                                logger.exception(e)
-                                raise DownloadFailed(f"unable to move temporary file: {temporary_filename}")
-
-                            return filename
-                        else:
-                            logger.warning(
-                                f"removing corrupted file with local checksum {local_checksum} and remote checksum {remote_checksum}: {temporary_filename}")
-                            remove(abspath(expanduser(temporary_filename)))
-                    else:
-                        logger.info(f"resuming incomplete download: {cl.file(temporary_filename)}")
-
-                command = f"wget -nc -c --user {self._username} --password {self._password} -O {abspath(expanduser(temporary_filename))} {URL}"
-                # logger.info(command)
-                os.system(command)
-
-                if not exists(abspath(expanduser(temporary_filename))):
-                    raise ConnectionError(f"unable to download URL: {URL}")
-
-                local_filesize = self.get_local_filesize(abspath(expanduser(temporary_filename)))
-                local_checksum = self.get_local_checksum(abspath(expanduser(temporary_filename)), checksum_type=checksum_type)
-
-                if local_filesize != remote_filesize or local_checksum != remote_checksum:
-                    os.remove(abspath(expanduser(temporary_filename)))
-                    raise ConnectionError(
-                        f"removing corrupted file with local filesize {local_filesize} remote filesize {remote_filesize} local checksum {local_checksum} remote checksum {remote_checksum}: {temporary_filename}")
-
-                # Download successful, rename the temporary file to its proper name
-                shutil.move(abspath(expanduser(temporary_filename)), abspath(expanduser(filename)))
-
-                logger.info(
-                    f"successful download with filesize {cl.val(local_filesize)} checksum {cl.val(local_checksum)}: {cl.file(filename)}")
-
-                return filename
-            except Exception as e:
-                if download_retries == 0:
-                    raise e
-                else:
-                    logger.warning(e)
-                    logger.warning(f"waiting {download_wait_seconds} seconds to retry download")
-                    sleep(download_wait_seconds)
-                    continue
+                filenames.append(future.result())
+            except DownloadFailed as e:
+                logger.warning(f"unable to download URL: {URL}")
+
+                if download_exception is None:
+                    download_exception = e
+
+        if download_exception is not None:
+            raise download_exception
+
+        return filenames
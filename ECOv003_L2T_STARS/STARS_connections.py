@@ -0,0 +1,273 @@
+import logging
+import threading
+from os.path import abspath, expanduser, join
+from typing import Union
+
+import colored_logging as cl
+
+from harmonized_landsat_sentinel import CMRServerUnreachable, HLS2Connection
+
+from ECOv003_exit_codes import AuxiliaryServerUnreachable
+
+from .constants import *
+from .VIIRS.VNP43IA4 import VNP43IA4
+from .VIIRS.VNP43MA3 import VNP43MA3
+from .VNP43NRT import VNP43NRT
+from .negative_cache import get_negative_cache
+from .process_cache import ProcessCache
+
+logger = logging.getLogger(__name__)
+
+# process-wide connection contexts keyed by their configuration
+_STARS_CONNECTIONS = ProcessCache()
+
+
+class LazyHLS2Connection:
+    """
+    Stands in for an HLS2Connection, which logs in to Earthdata when constructed,
+    until the first operation that needs CMR or the HLS archive.
+
+    Tile grids are computed locally, so runs whose HLS inputs are all cached never connect.
+    """
+
+    def __init__(self, working_directory: str, download_directory: str, target_resolution: int):
+        self.working_directory = working_directory
+        self.download_directory = download_directory
+        self.target_resolution = target_resolution
+        self._connection = None
+        self._tile_grid = None
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"LazyHLS2Connection(download_directory={self.download_directory}, connected={self.connected})"
+
+    @property
+    def connected(self) -> bool:
+        return self._connection is not None
+
+    @property
+    def tile_grid(self):
+        with self._lock:
+            if self._tile_grid is None:
+                from sentinel_tiles import SentinelTileGrid
+                self._tile_grid = SentinelTileGrid(target_resolution=self.target_resolution)
+
+            return self._tile_grid
+
+    def grid(self, tile: str, cell_size: float = None, buffer: int = 0):
+        return self.tile_grid.grid(tile=tile, cell_size=cell_size, buffer=buffer)
+
+    @property
+    def connection(self) -> HLS2Connection:
+        """
+        Raises:
+            AuxiliaryServerUnreachable: If Earthdata login fails.
+        """
+        with self._lock:
+            if self._connection is None:
+                logger.info("connecting to HLS 2.0 through CMR")
+
+                try:
+                    self._connection = HLS2Connection(
+                        working_directory=self.working_directory,
+                        download_directory=self.download_directory,
+                        target_resolution=self.target_resolution,
+                    )
+                except CMRServerUnreachable as e:
+                    logger.exception(e)
+                    raise AuxiliaryServerUnreachable(f"Unable to connect to CMR search server for HLS.")
+
+                if self._tile_grid is not None:
+                    self._connection.tile_grid = self._tile_grid
+
+            return self._connection
+
+    def __getattr__(self, name):
+        # only reached for attributes not defined here
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        return getattr(self.connection, name)
+
+
+class STARSConnections:
+    """
+    Holds the HLS, VIIRS and GEOS-5 FP connections for L2T_STARS runs sharing a working and sources directory.
+
+    With VNP43NRT, a single connection serves both the NDVI and albedo roles,
+    so its VNP09GA granule registry, Earthdata login and AOT cache are shared between them.
+    Connections are created on first use and are safe to request from worker threads.
+    """
+
+    def __init__(
+            self,
+            working_directory: str,
+            sources_directory: str,
+            indices_directory: str = None,
+            target_resolution: int = TARGET_RESOLUTION,
+            use_VNP43NRT: bool = USE_VNP43NRT,
+            initialize_julia: bool = INITIALIZE_JULIA,
+            offline: bool = OFFLINE,
+            HLS_giveup_days: int = HLS_GIVEUP_DAYS):
+        self.working_directory = abspath(expanduser(working_directory))
+        self.sources_directory = abspath(expanduser(sources_directory))
+        self.indices_directory = None if indices_directory is None else abspath(expanduser(indices_directory))
+        self.target_resolution = target_resolution
+        self.use_VNP43NRT = use_VNP43NRT
+        self.initialize_julia = initialize_julia
+        self.offline = offline
+        self.HLS_giveup_days = HLS_giveup_days
+
+        self.HLS_download_directory = join(self.sources_directory, HLS_DOWNLOAD_DIRECTORY)
+        self.VIIRS_download_directory = join(self.sources_directory, VIIRS_DOWNLOAD_DIRECTORY)
+        self.VIIRS_products_directory = join(self.sources_directory, VIIRS_PRODUCTS_DIRECTORY)
+        self.VIIRS_mosaic_directory = join(self.sources_directory, VIIRS_MOSAIC_DIRECTORY)
+        self.GEOS5FP_download_directory = join(self.sources_directory, GEOS5FP_DOWNLOAD_DIRECTORY)
+        self.GEOS5FP_products_directory = join(self.sources_directory, GEOS5FP_PRODUCTS_DIRECTORY)
+        self.VNP09GA_products_directory = join(self.sources_directory, VNP09GA_PRODUCTS_DIRECTORY)
+        self.VNP43NRT_products_directory = join(self.sources_directory, VNP43NRT_PRODUCTS_DIRECTORY)
+
+        # HLS and VIIRS dates found unavailable, shared by every run using this sources directory
+        self.negative_cache = get_negative_cache(
+            join(self.sources_directory, UNAVAILABLE_DIRECTORY),
+            HLS_giveup_days=HLS_giveup_days
+        )
+
+        self._HLS_connection = None
+        self._NDVI_VIIRS_connection = None
+        self._albedo_VIIRS_connection = None
+        self._lock = threading.RLock()
+
+    def __repr__(self):
+        return f"STARSConnections(sources_directory={self.sources_directory}, use_VNP43NRT={self.use_VNP43NRT})"
+
+    @property
+    def HLS_connection(self) -> LazyHLS2Connection:
+        """
+        Connection to HLS 2.0 through CMR, logging in on the first search or download.
+        """
+        with self._lock:
+            if self._HLS_connection is None:
+                self._HLS_connection = LazyHLS2Connection(
+                    working_directory=self.working_directory,
+                    download_directory=self.HLS_download_directory,
+                    target_resolution=self.target_resolution,
+                )
+
+            return self._HLS_connection
+
+    def _build_VNP43NRT(self) -> VNP43NRT:
+        return VNP43NRT(
+            working_directory=self.working_directory,
+            download_directory=self.VIIRS_download_directory,
+            mosaic_directory=self.VIIRS_mosaic_directory,
+            GEOS5FP_download=self.GEOS5FP_download_directory,
+            AOT_directory=self.GEOS5FP_products_directory,
+            VNP09GA_directory=self.VNP09GA_products_directory,
+            VNP43NRT_directory=self.VNP43NRT_products_directory,
+            indices_directory=self.indices_directory,
+            initialize_julia=self.initialize_julia,
+            offline=self.offline,
+            negative_cache=self.negative_cache,
+        )
+
+    @property
+    def NDVI_VIIRS_connection(self) -> Union[VNP43NRT, VNP43IA4]:
+        """
+        Connection serving coarse VIIRS NDVI, which connects to CMR or the LP DAAC data pool on its first search.
+        """
+        with self._lock:
+            if self._NDVI_VIIRS_connection is None:
+                if self.use_VNP43NRT:
+                    if self._albedo_VIIRS_connection is None:
+                        self._albedo_VIIRS_connection = self._build_VNP43NRT()
+
+                    self._NDVI_VIIRS_connection = self._albedo_VIIRS_connection
+                else:
+                    self._NDVI_VIIRS_connection = VNP43IA4(
+                        working_directory=self.working_directory,
+                        download_directory=self.VIIRS_download_directory,
+                        products_directory=self.VIIRS_products_directory,
+                        mosaic_directory=self.VIIRS_mosaic_directory,
+                        negative_cache=self.negative_cache,
+                    )
+
+            return self._NDVI_VIIRS_connection
+
+    @property
+    def albedo_VIIRS_connection(self) -> Union[VNP43NRT, VNP43MA3]:
+        """
+        Connection serving coarse VIIRS albedo, which connects to CMR or the LP DAAC data pool on its first search.
+        """
+        with self._lock:
+            if self._albedo_VIIRS_connection is None:
+                if self.use_VNP43NRT:
+                    self._albedo_VIIRS_connection = self.NDVI_VIIRS_connection
+                else:
+                    self._albedo_VIIRS_connection = VNP43MA3(
+                        working_directory=self.working_directory,
+                        download_directory=self.VIIRS_download_directory,
+                        products_directory=self.VIIRS_products_directory,
+                        mosaic_directory=self.VIIRS_mosaic_directory,
+                        GEOS5FP_download=self.GEOS5FP_download_directory,
+                        AOT_directory=self.GEOS5FP_products_directory,
+                        indices_directory=self.indices_directory,
+                        negative_cache=self.negative_cache,
+                    )
+
+            return self._albedo_VIIRS_connection
+
+
+def get_STARS_connections(
+        working_directory: str,
+        sources_directory: str,
+        indices_directory: str = None,
+        target_resolution: int = TARGET_RESOLUTION,
+        use_VNP43NRT: bool = USE_VNP43NRT,
+        initialize_julia: bool = INITIALIZE_JULIA,
+        offline: bool = OFFLINE,
+        HLS_giveup_days: int = HLS_GIVEUP_DAYS) -> STARSConnections:
+    """
+    Retrieves the connection context for a run configuration, reusing the one built by an earlier run in this process.
+
+    Args:
+        working_directory (str): Working directory of the run.
+        sources_directory (str): Directory of downloaded and derived source data.
+        indices_directory (str, optional): Directory of cached per-grid indices.
+        target_resolution (int, optional): Fine resolution in meters.
+        use_VNP43NRT (bool, optional): Serve VIIRS through VNP43NRT instead of VNP43IA4 and VNP43MA3.
+        initialize_julia (bool, optional): Initialize the Julia environment for the VNP43NRT BRDF solve.
+        offline (bool, optional): Serve VNP09GA searches only from the local CMR cache.
+        HLS_giveup_days (int, optional): Days after acquisition when missing HLS data is recorded as permanently unavailable.
+
+    Returns:
+        STARSConnections: The shared connection context.
+    """
+    key = (
+        abspath(expanduser(working_directory)),
+        abspath(expanduser(sources_directory)),
+        None if indices_directory is None else abspath(expanduser(indices_directory)),
+        target_resolution,
+        use_VNP43NRT,
+        initialize_julia,
+        offline,
+        HLS_giveup_days
+    )
+
+    def build() -> STARSConnections:
+        logger.info(f"creating STARS connections for sources directory: {cl.dir(key[1])}")
+        return STARSConnections(
+            working_directory=working_directory,
+            sources_directory=sources_directory,
+            indices_directory=indices_directory,
+            target_resolution=target_resolution,
+            use_VNP43NRT=use_VNP43NRT,
+            initialize_julia=initialize_julia,
+            offline=offline,
+            HLS_giveup_days=HLS_giveup_days
+        )
+
+    if key in _STARS_CONNECTIONS:
+        logger.info(f"reusing STARS connections for sources directory: {cl.dir(key[1])}")
+
+    return _STARS_CONNECTIONS.get(key, build)
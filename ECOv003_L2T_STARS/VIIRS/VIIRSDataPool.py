@@ -3,6 +3,7 @@ import logging
 import posixpath
 from datetime import date
 from datetime import datetime
+from fnmatch import fnmatch
 from os import makedirs
 from os.path import basename, splitext, abspath, expanduser
 from os.path import join
@@ -17,12 +18,14 @@ import rasters as rt
 from dateutil import parser
 from shapely.geometry import Point, Polygon
 
-from rasters import RasterGrid, Raster
+from rasters import RasterGrid, RasterGeometry, Raster
 
 from modland import find_modland_tiles, generate_modland_grid, parsehv
 
 from ..daterange import date_range
 from ..LPDAAC import LPDAACDataPool
+from ..constants import UNAVAILABLE_DIRECTORY
+from ..negative_cache import NegativeCache, get_negative_cache
 
 
 logger = logging.getLogger(__name__)
@@ -159,6 +162,9 @@ class VIIRSDataPool(LPDAACDataPool):
     DEFAULT_DOWNLOAD_DIRECTORY = "VIIRS_download"
     DEFAULT_PRODUCTS_DIRECTORY = "VIIRS_products"
     DEFAULT_MOSAIC_DIRECTORY = "VIIRS_mosaics"
+    DEFAULT_LISTING_DIRECTORY = "listings"
+    # days of input before each date that its product depends on
+    INPUT_DAYS = 0
 
     def __init__(
             self,
@@ -169,6 +175,7 @@ class VIIRSDataPool(LPDAACDataPool):
             download_directory: str = None,
             products_directory: str = None,
             mosaic_directory: str = None,
+            negative_cache: NegativeCache = None,
             *args,
             **kwargs):
         super(VIIRSDataPool, self).__init__(
@@ -204,6 +211,14 @@ class VIIRSDataPool(LPDAACDataPool):
         self.products_directory = products_directory
         self.mosaic_directory = mosaic_directory
 
+        if negative_cache is None:
+            negative_cache = get_negative_cache(join(download_directory, UNAVAILABLE_DIRECTORY))
+
+        self.negative_cache = negative_cache
+
+        if self.listing_directory is None:
+            self.listing_directory = join(download_directory, self.DEFAULT_LISTING_DIRECTORY)
+
     def __repr__(self):
         display_dict = {
             "download_directory": self.download_directory,
@@ -239,25 +254,28 @@ class VIIRSDataPool(LPDAACDataPool):
         elif isinstance(end_date, str):
             end_date = parser.parse(end_date).date()
 
-        rows = []
+        date_URLs = {
+            acquisition_date: self.date_URL("VIIRS", product, acquisition_date, build)
+            for acquisition_date
+            in date_range(start_date, end_date)
+        }
 
-        for acquisition_date in date_range(start_date, end_date):
-            date_URL = self.date_URL(
-                "VIIRS",
-                product,
-                acquisition_date,
-                build
-            )
+        logger.info(f"scanning LP-DAAC for {cl.val(len(date_URLs))} dates of {cl.name(product)}")
+        listings = self.get_HTTP_listings(list(date_URLs.values()))
+        rows = []
 
-            logger.info(f"scanning LP-DAAC: {date_URL}")
+        for acquisition_date, date_URL in date_URLs.items():
+            listing = listings[date_URL]
 
             if tiles is None:
-                listing = self.get_HTTP_listing(date_URL, pattern="*.h5")
+                listing = [item for item in listing if fnmatch(item, "*.h5")]
             else:
-                listing = []
-
-                for tile in tiles:
-                    listing.extend(self.get_HTTP_listing(date_URL, pattern=f"*.{tile}.*.h5"))
+                listing = [
+                    item
+                    for tile in tiles
+                    for item in listing
+                    if fnmatch(item, f"*.{tile}.*.h5")
+                ]
 
             URLs = sorted([
                 posixpath.join(date_URL, item)
@@ -273,6 +291,55 @@ class VIIRSDataPool(LPDAACDataPool):
 
         return df
 
+    def missing_dates(
+            self,
+            start_date: date or datetime or str,
+            end_date: date or datetime or str,
+            geometry: RasterGeometry) -> List[date]:
+        """
+        Lists the dates of a window on which the product is not published for every MODLAND tile covering a geometry.
+
+        Only the data pool directory listings are retrieved. Subclasses provide `search` for their product.
+        """
+        if isinstance(start_date, str):
+            start_date = parser.parse(start_date).date()
+
+        if isinstance(end_date, str):
+            end_date = parser.parse(end_date).date()
+
+        tiles = sorted(find_modland_tiles(geometry.boundary_latlon.geometry))
+        listing = self.search(start_date=start_date, end_date=end_date, tiles=tiles)
+        available = set(zip(listing.date, listing.tile))
+
+        return [
+            acquisition_date
+            for acquisition_date
+            in date_range(start_date, end_date)
+            if any((acquisition_date, tile) not in available for tile in tiles)
+        ]
+
+    def prefetch_granules(
+            self,
+            start_date: date or datetime or str,
+            end_date: date or datetime or str,
+            tiles: List[str]) -> List[str]:
+        """
+        Downloads the granules of several MODLAND tiles over a window concurrently,
+        from one search of the data pool directory listings covering every tile.
+
+        Subclasses provide `search` for their product.
+
+        Returns:
+            List[str]: The downloaded filenames.
+
+        Raises:
+            DownloadFailed: If any download fails, after the others have finished.
+        """
+        listing = self.search(start_date=start_date, end_date=end_date, tiles=sorted(tiles))
+        logger.info(f"prefetching {cl.val(len(listing))} granules for {cl.val(len(tiles))} MODLAND tiles")
+
+        return self.download_URLs(list(listing.URL))
+
     def download_URL(self, URL: str, download_location: str = None) -> str:
         if download_location is None:
             acquisition_date = parse_VIIRS_date(posixpath.basename(URL))
@@ -1,18 +1,19 @@
 import logging
 import os
+import threading
 import warnings
+from concurrent.futures import Future, as_completed
 from datetime import datetime, date
 from os import remove
-from os.path import exists, join, abspath, expanduser
+from os.path import exists, join, abspath, expanduser, basename
 import re
 from pathlib import Path
-import tempfile
-from typing import List, Union
+from typing import Iterator, List, Union
 
 import earthaccess
 import h5py
+import requests
 import numpy as np
-import pandas as pd
 from matplotlib.colors import LinearSegmentedColormap
 from dateutil import parser
 from skimage.transform import resize
@@ -23,11 +24,18 @@ from rasters import Raster, RasterGrid, RasterGeometry, Point, Polygon
 from modland import generate_modland_grid
 
 from ECOv003_exit_codes import *
+from ECOv003_exit_codes import AuxiliaryServerUnreachable
 
-from ..login import login
+from ..BRDF import BroadbandAlbedo, BROADBAND_ALBEDO_COEFFICIENTS
+from ..login import login, skip_earthdata_login
+from ..endpoints import CMR_search_URL
 from ..daterange import get_date
-from ..LPDAAC.LPDAACDataPool import RETRIES
+from ..download_scheduler import DownloadScheduler
+from ..CMR_cache import CMRCache
+from ..constants import UNAVAILABLE_DIRECTORY
+from ..negative_cache import NegativeCache, get_negative_cache
 from .VIIRSDataPool import VIIRSGranule
+from .granule_registry import GranuleRegistry
 from ..exceptions import *
 
 NDVI_COLORMAP = LinearSegmentedColormap.from_list(
@@ -46,9 +54,6 @@ ALBEDO_COLORMAP = "gray"
 
 logger = logging.getLogger(__name__)
 
-class VIIRSUnavailableError(Exception):
-    pass
-
 
 class VNP09GAGranule(VIIRSGranule):
     CLOUD_DATASET_NAME = "HDFEOS/GRIDS/VIIRS_Grid_1km_2D/Data Fields/SurfReflect_QF1_1"
@@ -888,100 +893,20 @@ class VNP09GAGranule(VIIRSGranule):
             logger.info(f"loading VIIRS albedo: {cl.file(product_filename)}")
             albedo = Raster.open(product_filename)
         else:
-            b1 = self.get_M_band(
-                1,
-                cloud_mask=cloud_mask,
-                apply_cloud_mask=apply_cloud_mask,
-                geometry=geometry,
-                save_data=save_data,
-                save_preview=save_preview
-            )
-
-            b2 = self.get_M_band(
-                2,
-                cloud_mask=cloud_mask,
-                apply_cloud_mask=apply_cloud_mask,
-                geometry=geometry,
-                save_data=save_data,
-                save_preview=save_preview
-            )
-
-            b3 = self.get_M_band(
-                3,
-                cloud_mask=cloud_mask,
-                apply_cloud_mask=apply_cloud_mask,
-                geometry=geometry,
-                save_data=save_data,
-                save_preview=save_preview
-            )
-
-            b4 = self.get_M_band(
-                4,
-                cloud_mask=cloud_mask,
-                apply_cloud_mask=apply_cloud_mask,
-                geometry=geometry,
-                save_data=save_data,
-                save_preview=save_preview
-            )
-
-            b5 = self.get_M_band(
-                5,
-                cloud_mask=cloud_mask,
-                apply_cloud_mask=apply_cloud_mask,
-                geometry=geometry,
-                save_data=save_data,
-                save_preview=save_preview
-            )
-
-            b7 = self.get_M_band(
-                7,
-                cloud_mask=cloud_mask,
-                apply_cloud_mask=apply_cloud_mask,
-                geometry=geometry,
-                save_data=save_data,
-                save_preview=save_preview
-            )
-
-            b8 = self.get_M_band(
-                8,
-                cloud_mask=cloud_mask,
-                apply_cloud_mask=apply_cloud_mask,
-                geometry=geometry,
-                save_data=save_data,
-                save_preview=save_preview
-            )
-
-            b10 = self.get_M_band(
-                10,
-                cloud_mask=cloud_mask,
-                apply_cloud_mask=apply_cloud_mask,
-                geometry=geometry,
-                save_data=save_data,
-                save_preview=save_preview
-            )
+            # https://lpdaac.usgs.gov/documents/194/VNP43_ATBD_V1.pdf
+            broadband_albedo = BroadbandAlbedo()
 
-            b11 = self.get_M_band(
-                11,
-                cloud_mask=cloud_mask,
-                apply_cloud_mask=apply_cloud_mask,
-                geometry=geometry,
-                save_data=save_data,
-                save_preview=save_preview
-            )
+            for m in BROADBAND_ALBEDO_COEFFICIENTS:
+                broadband_albedo.add_reflectance(m, self.get_M_band(
+                    m,
+                    cloud_mask=cloud_mask,
+                    apply_cloud_mask=apply_cloud_mask,
+                    geometry=geometry,
+                    save_data=save_data,
+                    save_preview=save_preview
+                ))
 
-            # https://lpdaac.usgs.gov/documents/194/VNP43_ATBD_V1.pdf
-            albedo = 0.2418 * b1 \
-                     - 0.201 * b2 \
-                     + 0.2093 * b3 \
-                     + 0.1146 * b4 \
-                     + 0.1348 * b5 \
-                     + 0.2251 * b7 \
-                     + 0.1123 * b8 \
-                     + 0.0860 * b10 \
-                     + 0.0803 * b11 \
-                     - 0.0131
-
-            albedo = np.clip(albedo, 0, 1)
+            albedo = broadband_albedo.result(clip=True)
 
         if save_data and not exists(product_filename):
             logger.info(f"writing VIIRS albedo: {cl.file(product_filename)}")
@@ -1030,6 +955,14 @@ def modland_tile_from_filename(filename: str) -> str:
     return match.group(1)
 
 
+def granule_tile(granule: earthaccess.search.DataGranule) -> str:
+    return modland_tile_from_filename(Path(granule.data_links()[0]).name)
+
+
+def granule_date_UTC(granule: earthaccess.search.DataGranule) -> date:
+    return get_date(granule["umm"]["TemporalExtent"]["RangeDateTime"]["BeginningDateTime"])
+
+
 # TODO: Deduplicate between VIIRS and HLS
 def VIIRS_CMR_query(
         start_date: Union[date, str],
@@ -1039,6 +972,7 @@ def VIIRS_CMR_query(
 ) -> List[earthaccess.search.DataGranule]:
     """function to search for VIIRS at tile in date range"""
     query = earthaccess.granule_query() \
+        .mode(CMR_search_URL()) \
         .concept_id(VIIRS_CONCEPT) \
         .temporal(earliest_datetime(start_date), latest_datetime(end_date))
 
@@ -1089,15 +1023,16 @@ class VNP09GA:
             download_directory: str = None,
             products_directory: str = None,
             mosaic_directory: str = None,
-            resampling: str = None):
+            resampling: str = None,
+            CMR_cache_directory: str = None,
+            offline: bool = False,
+            negative_cache: NegativeCache = None):
 
         if resampling is None:
             resampling = self.DEFAULT_RESAMPLING
 
         self.resampling = resampling
 
-        self._granules = pd.DataFrame(columns=["date_UTC", "tile", "granule"])
-
         if working_directory is None:
             working_directory = self.DEFAULT_WORKING_DIRECTORY
 
@@ -1123,121 +1058,235 @@ class VNP09GA:
         self.products_directory = products_directory
         self.mosaic_directory = mosaic_directory
 
-        self.auth = login()
+        if CMR_cache_directory is None:
+            CMR_cache_directory = join(download_directory, "CMR")
+
+        # the granule registry is shared between the NDVI and albedo roles and their worker threads
+        self.granules = GranuleRegistry(
+            directory=join(download_directory, "VNP09GA_registry"),
+            granule_factory=lambda granule: earthaccess.search.DataGranule(granule, cloud_hosted=True)
+        )
+
+        if negative_cache is None:
+            negative_cache = get_negative_cache(join(download_directory, UNAVAILABLE_DIRECTORY))
+
+        self.negative_cache = negative_cache
+        self.offline = offline
+        self.CMR_cache = CMRCache(
+            directory=CMR_cache_directory,
+            concept_id=VIIRS_CONCEPT,
+            query=self._query_CMR,
+            tile_function=granule_tile,
+            offline=offline
+        )
+
+        # Earthdata login is deferred to the first CMR search or download,
+        # so that runs served from the CMR cache and downloaded granules need no credentials
+        self._auth = None
+        self._auth_lock = threading.Lock()
+        self._download_scheduler = None
+        self._download_scheduler_lock = threading.Lock()
+
+    def authenticate(self):
+        """
+        Logs in to Earthdata on first use. Granules are served from disk in offline mode, so no login is needed.
+
+        Raises:
+            AuxiliaryServerUnreachable: If Earthdata login fails.
+        """
+        if self.offline:
+            return None
+
+        with self._auth_lock:
+            if self._auth is None:
+                try:
+                    self._auth = login()
+                except CMRServerUnreachable as e:
+                    logger.exception(e)
+                    raise AuxiliaryServerUnreachable(f"Unable to connect to CMR search server for VNP09GA.")
+
+            return self._auth
+
+    @property
+    def auth(self):
+        return self.authenticate()
+
+    def _query_CMR(self, *args, **kwargs) -> List[earthaccess.search.DataGranule]:
+        self.authenticate()
+
+        try:
+            return VIIRS_CMR_query(*args, **kwargs)
+        except CMRServerUnreachable as e:
+            logger.exception(e)
+            raise AuxiliaryServerUnreachable(f"Unable to search CMR for VNP09GA.")
 
     def add_granules(self, granules: List[earthaccess.search.DataGranule]):
-        data = pd.DataFrame([
-            {
-                "date_UTC": get_date(granule["umm"]["TemporalExtent"]["RangeDateTime"]["BeginningDateTime"]),
-                "tile": modland_tile_from_filename(Path(granule.data_links()[0]).name),
-                "granule": granule,
-            }
-            for granule in granules
-        ])
+        for granule in granules:
+            self.granules.add(granule_date_UTC(granule), granule_tile(granule), granule)
+
+        self.granules.save()
+
+    @property
+    def download_scheduler(self) -> DownloadScheduler:
+        with self._download_scheduler_lock:
+            if self._download_scheduler is None:
+                if skip_earthdata_login():
+                    session_factory = requests.Session
+                else:
+                    self.authenticate()
+                    session_factory = earthaccess.get_requests_https_session
 
-        self._granules = pd.concat([self._granules, data]).drop_duplicates(subset=["date_UTC", "tile"])
+                self._download_scheduler = DownloadScheduler(session_factory=session_factory)
+
+            return self._download_scheduler
+
+    def granule_filename(self, granule: earthaccess.search.DataGranule) -> str:
+        date_UTC = granule_date_UTC(granule)
+
+        return join(
+            self.download_directory,
+            "VNP09GA",
+            f"{date_UTC:%Y.%m.%d}",
+            Path(granule.data_links()[0]).name
+        )
+
+    def submit_granule(self, granule: earthaccess.search.DataGranule) -> Future:
+        """
+        Schedules the download of a granule, verifying the checksum published in its CMR metadata.
+
+        Raises:
+            VIIRSUnavailableError: If the granule is not on disk in offline mode, where nothing is downloaded.
+        """
+        URL = granule.data_links()[0]
+        filename = self.granule_filename(granule)
+
+        if self.offline and not exists(filename):
+            raise VIIRSUnavailableError(f"offline: VNP09GA granule is not downloaded: {filename}")
+        checksum = None
+        checksum_algorithm = None
+        size = None
+
+        for file_information in granule["umm"].get("DataGranule", {}).get("ArchiveAndDistributionInformation", []):
+            if file_information.get("Name") != basename(filename):
+                continue
+
+            if "Checksum" in file_information:
+                checksum = file_information["Checksum"]["Value"]
+                checksum_algorithm = file_information["Checksum"]["Algorithm"]
+
+            if "SizeInBytes" in file_information:
+                size = int(file_information["SizeInBytes"])
+
+        return self.download_scheduler.submit(
+            URL=URL,
+            filename=filename,
+            checksum=checksum,
+            checksum_algorithm=checksum_algorithm,
+            size=size
+        )
 
     def download_granules(self, granules: List[earthaccess.search.DataGranule]) -> List[str]:
-        # Check if any of the granules have already been downloaded, and if so record the file path for that granule.
-        #  Save the granules that haven't been downloaded to download them later.
-        granules_to_download = []
-        output_paths = []
-        for granule in granules:
-            date_UTC = get_date(granule["umm"]["TemporalExtent"]["RangeDateTime"]["BeginningDateTime"])
-            output_file_path = join(
-                self.download_directory,
-                "VNP09GA",
-                f"{date_UTC:%Y.%m.%d}",
-                Path(granule.data_links()[0]).name
-            )
-            if Path(output_file_path).exists():
-                output_paths.append(output_file_path)
-            else:
-                granules_to_download.append(granule)
+        # Downloads already on disk resolve immediately, and granules already in flight share their download.
+        futures = [self.submit_granule(granule) for granule in granules]
 
-        # Early exit
-        if len(granules_to_download) == 0:
+        if all(future.done() and future.exception() is None for future in futures):
             logger.info("All VIIRS granules have already been downloaded")
-            return output_paths
 
-        # Make sure to remove this before we return, so we use try..finally to avoid exceptions causing issues
-        temporary_parent_directory = join(self.download_directory, "tmp")
-        os.makedirs(temporary_parent_directory, exist_ok=True)
-        temporary_download_directory = tempfile.mkdtemp(dir=temporary_parent_directory)
-        
-        try:
-            last_download_exception = None
-            for _ in range(0, RETRIES):
-                download_exception = None
-                downloaded_granules = []
-
-                file_paths = earthaccess.download(granules_to_download, local_path=temporary_download_directory)
-
-                for (granule, download_file_path) in zip(granules_to_download, file_paths):
-                    if isinstance(download_file_path, Exception):
-                        if download_exception is None:
-                            download_exception = download_file_path
-                        continue
-                    date_UTC = get_date(granule["umm"]["TemporalExtent"]["RangeDateTime"]["BeginningDateTime"])
-
-                    download_file_path = Path(download_file_path)
-                    output_file_path = join(
-                        self.download_directory,
-                        "VNP09GA",
-                        f"{date_UTC:%Y.%m.%d}",
-                        download_file_path.name
-                    )
-                    Path(output_file_path).parent.mkdir(parents=True, exist_ok=True)
-                    download_file_path.rename(output_file_path)
-
-                    output_paths.append(output_file_path)
-                    downloaded_granules.append(granule)
-
-                if download_exception is not None:
-                    last_download_exception = download_exception
-                    for granule in downloaded_granules:
-                        granules_to_download.remove(granule)
-                    logger.warning("Encountered an exception while downloading VIIRS files:", exc_info=download_exception)
-                    logger.info(f"Retrying the VIIRS download with the remaining {len(granules_to_download)} granules.")
-                else:
-                    granules_to_download = []
-                    break
+        output_paths = []
+        download_exception = None
+
+        for future in futures:
+            try:
+                output_paths.append(future.result())
+            except DownloadFailed as e:
+                logger.warning("Encountered an exception while downloading VIIRS files:", exc_info=e)
+
+                if download_exception is None:
+                    download_exception = e
 
-            if len(granules_to_download) > 0:
-                raise DownloadFailed("Error when downloading VIIRS files") from last_download_exception
-        finally:
-            Path(temporary_download_directory).rmdir()
+        if download_exception is not None:
+            raise DownloadFailed("Error when downloading VIIRS files") from download_exception
 
         return output_paths
 
-    def prefetch_VNP09GA(
+    def iter_VNP09GA(
             self,
             start_date: Union[date, str],
             end_date: Union[date, str],
-            geometry: Point or Polygon or RasterGeometry = None):
-        # Fetch list of granules to download
-        granules = VIIRS_CMR_query(
-            start_date,
-            end_date,
-            geometry,
-        )
+            geometry: Point or Polygon or RasterGeometry = None,
+            tiles: List[str] = None) -> Iterator[VNP09GAGranule]:
+        """
+        Downloads the granules in a date range, yielding each one as soon as it is on disk.
+
+        Granules are searched by geometry, or by MODLAND tile if `tiles` is given,
+        so that searches shared between runs are cached under the same keys.
+        Granules already downloaded are yielded first. If any download fails, the remaining granules
+        are still yielded before DownloadFailed is raised.
+        """
+        # Fetch list of granules to download, querying CMR only for dates not already cached
+        if tiles is None:
+            granules = self.CMR_cache.search(
+                start_date,
+                end_date,
+                target_geometry=geometry,
+            )
+        else:
+            granules = [
+                granule
+                for tile in sorted(set(tiles))
+                for granule in self.CMR_cache.search(start_date, end_date, tile=tile)
+            ]
 
         self.add_granules(granules)
 
-        self.download_granules(granules)
+        futures = []
+
+        for granule in granules:
+            try:
+                futures.append(self.submit_granule(granule))
+            except VIIRSUnavailableError as e:
+                logger.warning(str(e))
+
+        download_exception = None
+
+        for future in as_completed(futures):
+            try:
+                filename = future.result()
+            except DownloadFailed as e:
+                logger.warning("Encountered an exception while downloading VIIRS files:", exc_info=e)
+
+                if download_exception is None:
+                    download_exception = e
+
+                continue
+
+            yield VNP09GAGranule(
+                filename=filename,
+                products_directory=self.products_directory
+            )
+
+        if download_exception is not None:
+            raise DownloadFailed("Error when downloading VIIRS files") from download_exception
+
+    def prefetch_VNP09GA(
+            self,
+            start_date: Union[date, str],
+            end_date: Union[date, str],
+            geometry: Point or Polygon or RasterGeometry = None,
+            tiles: List[str] = None):
+        for _ in self.iter_VNP09GA(start_date, end_date, geometry, tiles=tiles):
+            pass
 
     def search(
             self,
             date_UTC: date,
             tile: str) -> Union[earthaccess.search.DataGranule, None]:
-        if "date_UTC" not in self._granules.columns:
-            raise ValueError(f"date_UTC column not in granules table")
+        granule = self.granules.get(date_UTC, tile)
 
-        subset = self._granules[(self._granules['date_UTC'] == date_UTC) & (self._granules['tile'] == tile)]
-        if len(subset) > 0:
-            return subset.iloc[0].granule
+        if granule is not None:
+            return granule
 
-        granules = VIIRS_CMR_query(
+        granules = self.CMR_cache.search(
             start_date=date_UTC,
             end_date=date_UTC,
             tile=tile,
@@ -1260,6 +1309,9 @@ class VNP09GA:
         if isinstance(date_UTC, str):
             date_UTC = parser.parse(date_UTC).date()
 
+        if self.negative_cache.unavailable("VIIRS_VNP09GA", tile, date_UTC):
+            raise VIIRSUnavailableError(f"VNP09GA URL not available at tile {tile} on date {date_UTC}")
+
         logger.info(f"searching VNP09GA tile {tile} date {date_UTC}")
         granule = self.search(
             date_UTC=date_UTC,
@@ -1267,7 +1319,9 @@ class VNP09GA:
         )
 
         if granule is None:
-            raise VIIRSUnavailableError(f"VNP09GA URL not available at tile {tile} on date {date_UTC}")
+            message = f"VNP09GA URL not available at tile {tile} on date {date_UTC}"
+            self.negative_cache.record("VIIRS_VNP09GA", tile, date_UTC, message)
+            raise VIIRSUnavailableError(message)
 
         output_path = self.download_granules([granule])[0]
 
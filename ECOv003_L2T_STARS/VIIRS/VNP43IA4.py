@@ -16,6 +16,7 @@ from rasters import Raster, RasterGrid, RasterGeometry
 
 from .VIIRSDownloader import VIIRSDownloaderNDVI
 from .VIIRSDataPool import VIIRSDataPool, VIIRSGranule
+from ..exceptions import VIIRSUnavailableError
 
 NDVI_COLORMAP = "jet_r"
 ALBEDO_COLORMAP = "gray"
@@ -23,10 +24,6 @@ ALBEDO_COLORMAP = "gray"
 logger = logging.getLogger(__name__)
 
 
-class VIIRSUnavailableError(Exception):
-    pass
-
-
 class VNP43IA4Granule(VIIRSGranule):
     def reflectance(
             self,
@@ -193,6 +190,9 @@ class VNP43IA4(VIIRSDataPool, VIIRSDownloaderNDVI):
             tile: str,
             download_location: str = None,
             build: str = None) -> VNP43IA4Granule:
+        if self.negative_cache.unavailable("VIIRS_VNP43IA4", tile, date_UTC):
+            raise VIIRSUnavailableError(f"VNP43IA4 not available at tile {tile} on date {date_UTC}")
+
         listing = self.search(
             start_date=date_UTC,
             end_date=date_UTC,
@@ -200,8 +200,12 @@ class VNP43IA4(VIIRSDataPool, VIIRSDownloaderNDVI):
             tiles=[tile]
         )
 
-        if len(listing) > 0:
-            URL = listing.iloc[0].URL
+        if len(listing) == 0:
+            message = f"VNP43IA4 not available at tile {tile} on date {date_UTC}"
+            self.negative_cache.record("VIIRS_VNP43IA4", tile, date_UTC, message)
+            raise VIIRSUnavailableError(message)
+
+        URL = listing.iloc[0].URL
 
         filename = super(VNP43IA4, self).download_URL(
             URL=URL,
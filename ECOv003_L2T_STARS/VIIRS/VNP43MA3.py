@@ -1,7 +1,8 @@
 import logging
 from datetime import datetime, date
-from os.path import exists
-from typing import List
+from glob import glob
+from os.path import exists, join
+from typing import Iterable, List
 import h5py
 import numpy as np
 import pandas as pd
@@ -13,10 +14,13 @@ from rasters import Raster, RasterGrid, RasterGeometry
 from GEOS5FP import GEOS5FP
 from  modland import find_modland_tiles, generate_modland_grid, parsehv
 
-from ..BRDF import bidirectional_reflectance
+from ..AOT_provider import AOTProvider, get_AOT_provider
+from ..BRDF import BroadbandAlbedo, BROADBAND_ALBEDO_COEFFICIENTS
 from ..BRDF.SZA import calculate_SZA
+from ..daterange import get_date
 from .VIIRSDownloader import VIIRSDownloaderAlbedo
 from .VIIRSDataPool import VIIRSDataPool, VIIRSGranule
+from ..exceptions import VIIRSUnavailableError
 
 NDVI_COLORMAP = "jet_r"
 ALBEDO_COLORMAP = "gray"
@@ -24,10 +28,6 @@ ALBEDO_COLORMAP = "gray"
 logger = logging.getLogger(__name__)
 
 
-class VIIRSUnavailableError(Exception):
-    pass
-
-
 class VNP43MA3Granule(VIIRSGranule):
     def __init__(
             self,
@@ -35,19 +35,24 @@ class VNP43MA3Granule(VIIRSGranule):
             working_directory: str = None,
             products_directory: str = None,
             GEOS5FP_connection: GEOS5FP = None,
-            GEOS5FP_download: str = None):
+            GEOS5FP_download: str = None,
+            AOT_provider: AOTProvider = None,
+            indices_directory: str = None):
         super(VNP43MA3Granule, self).__init__(
             filename=filename,
             working_directory=working_directory,
             products_directory=products_directory
         )
 
-        if GEOS5FP_connection is None:
-            GEOS5FP_connection = GEOS5FP(
-                download_directory=GEOS5FP_download,
+        if AOT_provider is None:
+            AOT_provider = get_AOT_provider(
+                GEOS5FP_connection=GEOS5FP_connection,
+                GEOS5FP_download=GEOS5FP_download
             )
 
-        self.GEOS5FP = GEOS5FP_connection
+        self.AOT_provider = AOT_provider
+        self.GEOS5FP = AOT_provider.GEOS5FP
+        self.indices_directory = indices_directory
 
     def BSA(
             self,
@@ -183,35 +188,16 @@ class VNP43MA3Granule(VIIRSGranule):
         else:
             date_UTC = self.date_UTC
             doy = date_UTC.timetuple().tm_yday
-            SZA = calculate_SZA(doy, 10.5, self.geometry)
+            SZA = calculate_SZA(doy, 10.5, self.geometry, indices_directory=self.indices_directory)
             time_UTC = datetime(date_UTC.year, date_UTC.month, date_UTC.day, 10, 30)
-            AOT = self.GEOS5FP.AOT(time_UTC=time_UTC, geometry=self.geometry, resampling="cubic")
-
-            b = {}
+            AOT = self.AOT_provider.AOT(time_UTC=time_UTC, geometry=self.geometry, resampling="cubic")
 
-            for m in (1, 2, 3, 4, 5, 7, 8, 10, 11):
-                WSA = self.WSA(m)
-                BSA = self.BSA(m)
-
-                band_albedo = bidirectional_reflectance(
-                    white_sky_albedo=WSA,
-                    black_sky_albedo=BSA,
-                    SZA=SZA,
-                    AOT=AOT
-                )
+            broadband_albedo = BroadbandAlbedo(SZA=SZA, AOT=AOT, geometry=self.geometry)
 
-                b[m] = band_albedo
+            for m in BROADBAND_ALBEDO_COEFFICIENTS:
+                broadband_albedo.add(m, white_sky_albedo=self.WSA(m), black_sky_albedo=self.BSA(m))
 
-            image = 0.2418 * b[1] \
-                    - 0.201 * b[2] \
-                    + 0.2093 * b[3] \
-                    + 0.1146 * b[4] \
-                    + 0.1348 * b[5] \
-                    + 0.2251 * b[7] \
-                    + 0.1123 * b[8] \
-                    + 0.0860 * b[10] \
-                    + 0.0803 * b[11] \
-                    - 0.0131
+            image = broadband_albedo.result(clip=False)
 
         if save_data and not exists(product_filename):
             logger.info(f"writing VNP43MA3 albedo: {cl.file(product_filename)}")
@@ -232,6 +218,59 @@ class VNP43MA3(VIIRSDataPool, VIIRSDownloaderAlbedo):
     DEFAULT_PRODUCTS_DIRECTORY = "VNP43MA3_products"
     DEFAULT_MOSAIC_DIRECTORY = "VNP43MA3_mosaics"
 
+    def __init__(
+            self,
+            *args,
+            GEOS5FP_connection: GEOS5FP = None,
+            GEOS5FP_download: str = None,
+            AOT_directory: str = None,
+            indices_directory: str = None,
+            **kwargs):
+        super(VNP43MA3, self).__init__(*args, **kwargs)
+        self.AOT_provider = get_AOT_provider(
+            GEOS5FP_connection=GEOS5FP_connection,
+            GEOS5FP_download=GEOS5FP_download,
+            AOT_directory=AOT_directory
+        )
+        self.indices_directory = indices_directory
+
+    def albedo_product_exists(self, date_UTC: date, tile: str) -> bool:
+        """
+        Checks whether the broadband albedo of a VNP43MA3 granule, which needs AOT, is already in the products directory.
+        """
+        return len(glob(join(
+            self.products_directory,
+            "albedo",
+            f"{date_UTC:%Y.%m.%d}",
+            f"VNP43MA3.A{date_UTC:%Y%j}.{tile}.*_albedo.tif"
+        ))) > 0
+
+    def prefetch_AOT(
+            self,
+            dates: Iterable[date or str],
+            geometry: RasterGeometry):
+        """
+        Retrieves the 10:30 UTC AOT for every MODLAND tile and date in one batch,
+        skipping granules whose albedo is already produced or that are known to be unavailable.
+        """
+        tiles = sorted(find_modland_tiles(geometry.boundary_latlon.geometry))
+        requests = []
+
+        for date_UTC in sorted(get_date(d) for d in dates):
+            for tile in tiles:
+                if self.albedo_product_exists(date_UTC, tile) or \
+                        self.negative_cache.unavailable("VIIRS_VNP43MA3", tile, date_UTC):
+                    continue
+
+                time_UTC = datetime(date_UTC.year, date_UTC.month, date_UTC.day, 10, 30)
+                requests.append((time_UTC, generate_modland_grid(*parsehv(tile), 1200)))
+
+        logger.info(f"prefetching GEOS-5 FP AOT for {cl.val(len(requests))} VNP43MA3 tile-dates")
+        failed = self.AOT_provider.prefetch(requests, resampling="cubic")
+
+        if len(failed) > 0:
+            logger.warning(f"unable to prefetch GEOS-5 FP AOT for {len(failed)} VNP43MA3 tile-dates")
+
     def search(
             self,
             start_date: date or datetime or str,
@@ -258,6 +297,9 @@ class VNP43MA3(VIIRSDataPool, VIIRSDownloaderAlbedo):
             tile: str,
             download_location: str = None,
             build: str = None) -> VNP43MA3Granule:
+        if self.negative_cache.unavailable("VIIRS_VNP43MA3", tile, date_UTC):
+            raise VIIRSUnavailableError(f"VNP43MA3 not available at tile {tile} on date {date_UTC}")
+
         listing = self.search(
             start_date=date_UTC,
             end_date=date_UTC,
@@ -265,8 +307,12 @@ class VNP43MA3(VIIRSDataPool, VIIRSDownloaderAlbedo):
             tiles=[tile]
         )
 
-        if len(listing) > 0:
-            URL = listing.iloc[0].URL
+        if len(listing) == 0:
+            message = f"VNP43MA3 not available at tile {tile} on date {date_UTC}"
+            self.negative_cache.record("VIIRS_VNP43MA3", tile, date_UTC, message)
+            raise VIIRSUnavailableError(message)
+
+        URL = listing.iloc[0].URL
 
         filename = super(VNP43MA3, self).download_URL(
             URL=URL,
@@ -275,7 +321,9 @@ class VNP43MA3(VIIRSDataPool, VIIRSDownloaderAlbedo):
 
         granule = VNP43MA3Granule(
             filename=filename,
-            products_directory=self.products_directory
+            products_directory=self.products_directory,
+            AOT_provider=self.AOT_provider,
+            indices_directory=self.indices_directory
         )
 
         return granule
@@ -0,0 +1,125 @@
+import logging
+import threading
+from datetime import date
+from os.path import abspath, expanduser, join
+from typing import Callable, Dict, Iterator, Tuple
+
+import colored_logging as cl
+
+from ..atomic_file import read_JSON, update_JSON
+from ..daterange import get_date
+
+logger = logging.getLogger(__name__)
+
+
+class GranuleRegistry:
+    """
+    Indexes granule metadata by (date, tile) for constant-time lookup.
+
+    With a directory, the registry is stored as one JSON file per date mapping tiles to granule metadata.
+    Dates are loaded on first lookup, and saving merges each changed date with the file on disk,
+    so registries in concurrent searches and processes accumulate each other's granules.
+    """
+
+    def __init__(self, directory: str = None, granule_factory: Callable[[dict], dict] = None):
+        self.directory = None if directory is None else abspath(expanduser(directory))
+        self.granule_factory = granule_factory
+        # granules by date, then by tile
+        self._granules: Dict[date, Dict[str, dict]] = {}
+        self._loaded_dates = set()
+        self._dirty_dates = set()
+        self._lock = threading.RLock()
+
+    def __repr__(self):
+        return f"GranuleRegistry(directory={self.directory}, granules={len(self)})"
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(len(tiles) for tiles in self._granules.values())
+
+    def __contains__(self, key: Tuple[date, str]) -> bool:
+        return self.get(*key) is not None
+
+    def __iter__(self) -> Iterator[Tuple[date, str]]:
+        with self._lock:
+            return iter([(date_UTC, tile) for date_UTC, tiles in self._granules.items() for tile in tiles])
+
+    def filename(self, date_UTC: date) -> str:
+        return join(self.directory, f"{date_UTC:%Y.%m.%d}.json")
+
+    def _read(self, date_UTC: date) -> Dict[str, dict]:
+        if self.directory is None:
+            return {}
+
+        granules = read_JSON(self.filename(date_UTC), "granule registry file")
+        return {} if granules is None else granules
+
+    def _absorb(self, date_UTC: date, granules: Dict[str, dict]):
+        tiles = self._granules.setdefault(date_UTC, {})
+
+        for tile, granule in granules.items():
+            if tile not in tiles:
+                if self.granule_factory is not None:
+                    granule = self.granule_factory(granule)
+
+                tiles[tile] = granule
+
+    def _merge(self, date_UTC: date, granules: Dict[str, dict]):
+        # absorbs the granules written by other registries and replaces them with the merged granules of the date
+        self._absorb(date_UTC, granules)
+        granules.clear()
+        granules.update({tile: dict(granule) for tile, granule in self._granules[date_UTC].items()})
+
+    def _load(self, date_UTC: date):
+        if date_UTC in self._loaded_dates:
+            return
+
+        self._absorb(date_UTC, self._read(date_UTC))
+        self._loaded_dates.add(date_UTC)
+
+    def get(self, date_UTC: date, tile: str) -> dict:
+        """
+        Looks up the granule for a date and tile, or returns None if it has not been registered.
+        """
+        date_UTC = get_date(date_UTC)
+
+        with self._lock:
+            self._load(date_UTC)
+            return self._granules.get(date_UTC, {}).get(tile)
+
+    def add(self, date_UTC: date, tile: str, granule: dict):
+        date_UTC = get_date(date_UTC)
+
+        with self._lock:
+            self._load(date_UTC)
+
+            tiles = self._granules.setdefault(date_UTC, {})
+
+            if tile not in tiles:
+                tiles[tile] = granule
+                self._dirty_dates.add(date_UTC)
+
+    def save(self):
+        """
+        Writes the dates changed since the last save, merged with any granules written by other registries.
+        """
+        if self.directory is None:
+            return
+
+        with self._lock:
+            dirty_dates = sorted(self._dirty_dates)
+
+            if not dirty_dates:
+                return
+
+            for date_UTC in dirty_dates:
+                # the merge reads and replaces the file, so concurrent processes take turns
+                update_JSON(
+                    self.filename(date_UTC),
+                    lambda granules: self._merge(date_UTC, granules),
+                    "granule registry file"
+                )
+
+            self._dirty_dates.clear()
+
+        logger.info(f"saved granule registry for {cl.val(len(dirty_dates))} dates: {cl.dir(self.directory)}")
@@ -4,11 +4,12 @@ import logging
 import shutil
 import subprocess
 import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import date, timedelta, datetime
 from glob import glob
 from os.path import abspath, expanduser, join, basename, splitext, exists, dirname
 import os
-from typing import Union, List
+from typing import Iterable, Union, List
 import dateutil
 import numpy as np
 from dateutil import parser
@@ -21,16 +22,25 @@ from rasters import Raster, RasterGeometry, Point, Polygon
 from GEOS5FP import GEOS5FP, FailedGEOS5FPDownload
 from modland import find_modland_tiles, parsehv, generate_modland_grid
 
-from ..BRDF import bidirectional_reflectance
+from ..AOT_provider import get_AOT_provider
+from ..atomic_file import temporary_filename
+from ..BRDF import BroadbandAlbedo, BROADBAND_ALBEDO_COEFFICIENTS
 from ..BRDF.SZA import calculate_SZA
 from ..VIIRS import VIIRSDownloaderAlbedo, VIIRSDownloaderNDVI
-from ..VIIRS.VNP09GA import VNP09GA, VNP09GAGranule, ALBEDO_COLORMAP, NDVI_COLORMAP, VIIRSUnavailableError
-from ..daterange import date_range
+from ..VIIRS.VNP09GA import VNP09GA, VNP09GAGranule, granule_date_UTC, ALBEDO_COLORMAP, NDVI_COLORMAP
+from ..exceptions import VIIRSUnavailableError
+from ..daterange import date_range, get_date
+from ..file_lock import FileLock
+from ..negative_cache import NegativeCache
 from ..timer import Timer
 
 DEFAULT_WEIGHTED = True
 DEFAULT_SCALE = 1.87
 
+# bands solved for NBAR, NDVI and broadband albedo
+VNP43NRT_BANDS = ["I1", "I2"] + [f"M{m}" for m in BROADBAND_ALBEDO_COEFFICIENTS]
+STAGING_WORKERS = 4  # number of VNP09GA granules staged concurrently while downloads continue
+
 with open(join(abspath(dirname(__file__)), "version.txt")) as f:
     version = f.read()
 
@@ -282,6 +292,8 @@ class AuxiliaryDownloadFailed(ConnectionError):
 class VNP43NRT(VIIRSDownloaderAlbedo, VIIRSDownloaderNDVI):
     DEFAULT_VNP09GA_DIRECTORY = "VNP09GA_products"
     DEFAULT_VNP43NRT_DIRECTORY = "VNP43NRT_products"
+    # days of VNP09GA before each date that feed its BRDF solve
+    INPUT_DAYS = 16
 
     def __init__(
             self,
@@ -293,7 +305,11 @@ class VNP43NRT(VIIRSDownloaderAlbedo, VIIRSDownloaderNDVI):
             VNP43NRT_staging_directory: str = None,
             GEOS5FP_connection: GEOS5FP = None,
             GEOS5FP_download: str = None,
-            initialize_julia: bool = False):
+            AOT_directory: str = None,
+            indices_directory: str = None,
+            initialize_julia: bool = False,
+            offline: bool = False,
+            negative_cache: NegativeCache = None):
         if working_directory is None:
             working_directory = VNP09GA.DEFAULT_WORKING_DIRECTORY
 
@@ -316,18 +332,22 @@ class VNP43NRT(VIIRSDownloaderAlbedo, VIIRSDownloaderNDVI):
             working_directory=working_directory,
             download_directory=download_directory,
             products_directory=VNP09GA_directory,
-            mosaic_directory=mosaic_directory
+            mosaic_directory=mosaic_directory,
+            offline=offline,
+            negative_cache=negative_cache
         )
 
-        if GEOS5FP_connection is None:
-            GEOS5FP_connection = GEOS5FP(
-                download_directory=GEOS5FP_download,
-            )
+        self.AOT_provider = get_AOT_provider(
+            GEOS5FP_connection=GEOS5FP_connection,
+            GEOS5FP_download=GEOS5FP_download,
+            AOT_directory=AOT_directory
+        )
 
         self.VNP09GA_directory = VNP09GA_directory
         self.VNP43NRT_directory = VNP43NRT_directory
-        self.GEOS5FP = GEOS5FP_connection
+        self.GEOS5FP = self.AOT_provider.GEOS5FP
         self.VNP43NRT_staging_directory = VNP43NRT_staging_directory
+        self.indices_directory = indices_directory
         self.initialize_julia = initialize_julia
 
     def __repr__(self):
@@ -351,16 +371,77 @@ class VNP43NRT(VIIRSDownloaderAlbedo, VIIRSDownloaderNDVI):
             tile=tile,
         )
 
+    def stage_granule(self, granule: VNP09GAGranule, bands: List[str] = None):
+        if bands is None:
+            bands = VNP43NRT_BANDS
+
+        for band in bands:
+            self.stage_VNP09GA(granule, granule.tile, granule.date_UTC, band)
+
+    def missing_dates(
+            self,
+            start_date: Union[date, str],
+            end_date: Union[date, str],
+            geometry: RasterGeometry) -> List[date]:
+        """
+        Lists the dates of a window on which VNP09GA is not published for every MODLAND tile covering a geometry.
+
+        Only granule metadata is retrieved, through the CMR cache, and the granules found are registered for download.
+        """
+        if isinstance(start_date, str):
+            start_date = parser.parse(start_date).date()
+
+        if isinstance(end_date, str):
+            end_date = parser.parse(end_date).date()
+
+        tiles = sorted(find_modland_tiles(geometry.boundary_latlon.geometry))
+        missing_dates = set()
+
+        for tile in tiles:
+            granules = self.vnp09ga.CMR_cache.search(start_date=start_date, end_date=end_date, tile=tile)
+            self.vnp09ga.add_granules(granules)
+            available_dates = {granule_date_UTC(granule) for granule in granules}
+            missing_dates.update(set(date_range(start_date, end_date)) - available_dates)
+
+        return sorted(missing_dates)
+
     def prefetch_VNP09GA(
             self,
             start_date: Union[date, str],
             end_date: Union[date, str],
-            geometry: Point or Polygon or RasterGeometry = None):
-        self.vnp09ga.prefetch_VNP09GA(
-            start_date,
-            end_date,
-            geometry,
-        )
+            geometry: Point or Polygon or RasterGeometry = None,
+            stage: bool = True,
+            workers: int = STAGING_WORKERS,
+            tiles: List[str] = None):
+        """
+        Downloads the VNP09GA granules of a window, staging each granule for the BRDF solve as soon as it arrives.
+
+        Granules are searched by the MODLAND tiles covering a raster geometry, or by `tiles` if given,
+        which are the searches `missing_dates` makes, so that runs over neighbouring tiles share them.
+        Staging runs in a thread pool while later granules are still downloading.
+        Granules that fail to stage here are staged again when their BRDF parameters are solved.
+        """
+        if tiles is None and isinstance(geometry, RasterGeometry):
+            tiles = sorted(find_modland_tiles(geometry.boundary_latlon.geometry))
+
+        if not stage:
+            self.vnp09ga.prefetch_VNP09GA(start_date, end_date, geometry, tiles=tiles)
+            return
+
+        futures = {}
+
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="VNP43NRT_staging") as executor:
+            for granule in self.vnp09ga.iter_VNP09GA(start_date, end_date, geometry, tiles=tiles):
+                logger.info(f"staging VNP09GA for VNP43NRT at {cl.place(granule.tile)} on {cl.time(granule.date_UTC)}")
+                futures[executor.submit(self.stage_granule, granule)] = granule
+
+            for future in as_completed(futures):
+                granule = futures[future]
+
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.warning(f"unable to stage VNP09GA at {granule.tile} on {granule.date_UTC}: {e}")
 
     def generate_staging_directory(self, tile: str, variable: str) -> str:
         return join(self.VNP43NRT_staging_directory, tile, variable)
@@ -368,6 +449,47 @@ class VNP43NRT(VIIRSDownloaderAlbedo, VIIRSDownloaderNDVI):
     def generate_staging_filename(self, tile: str, processing_date, variable: str) -> str:
         return join(self.generate_staging_directory(tile, variable), f"{processing_date:%Y-%m-%d}_{variable}.tif")
 
+    def stage_VNP09GA(
+            self,
+            granule: VNP09GAGranule,
+            tile: str,
+            processing_date: date,
+            band: str):
+        """
+        Writes the reflectance and viewing geometry of a VNP09GA granule in one band to the VNP43NRT staging directories.
+        """
+        band_type = band[0]
+
+        def relative_azimuth() -> Raster:
+            solar_azimuth = granule.solar_azimuth(band)
+            sensor_azimuth = granule.sensor_azimuth(band)
+            return Raster(np.abs(solar_azimuth - sensor_azimuth), geometry=sensor_azimuth.geometry)
+
+        for variable, description, generate in (
+                (band, f"{band} reflectance", lambda: granule.band(band)),
+                (f"{band_type}_solar_zenith", "solar zenith", lambda: granule.solar_zenith(band)),
+                (f"{band_type}_sensor_zenith", "sensor zenith", lambda: granule.sensor_zenith(band)),
+                (f"{band_type}_relative_azimuth", "relative azimuth", relative_azimuth)):
+            filename = self.generate_staging_filename(tile, processing_date, variable)
+
+            if exists(filename):
+                logger.info(f"previously generated {description} on {processing_date}: {filename}")
+                continue
+
+            logger.info(f"generating {description} on {processing_date}")
+            raster = generate()
+            logger.info(f"writing {description} on {processing_date}: {filename}")
+            # write to a temporary file first so that concurrent runs never read or skip a partial staging file,
+            # named so that the BRDF inversion does not pick it up from the staging directory
+            temporary_staging_filename = temporary_filename(filename)
+
+            try:
+                raster.to_geotiff(temporary_staging_filename, include_preview=False)
+                os.replace(temporary_staging_filename, filename)
+            finally:
+                if exists(temporary_staging_filename):
+                    os.remove(temporary_staging_filename)
+
     def BRDF_parameters(
             self,
             date_UTC: Union[date, str],
@@ -381,7 +503,7 @@ class VNP43NRT(VIIRSDownloaderAlbedo, VIIRSDownloaderNDVI):
         logger.info(f"processing BRDF for band {band} at tile {tile} on date {cl.time(date_UTC)}")
 
         end_date = date_UTC
-        start_date = date_UTC - timedelta(days=16)
+        start_date = date_UTC - timedelta(days=self.INPUT_DAYS)
 
         band_type = band[0]
 
@@ -411,60 +533,7 @@ class VNP43NRT(VIIRSDownloaderAlbedo, VIIRSDownloaderNDVI):
             # TODO replace the lists with directories of GeoTIFFs staged for VNP43NRT_jl
             try:
                 granule = self.VNP09GA(processing_date, tile)
-
-                reflectance_filename = self.generate_staging_filename(tile, processing_date, band)
-
-                if exists(reflectance_filename):
-                    logger.info(f"previously generated {band} reflectance on {processing_date}: {reflectance_filename}")
-                    # reflectance_raster = Raster.open(reflectance_filename)
-                else:
-                    logger.info(f"generating {band} reflectance on {processing_date}")
-                    reflectance_raster = granule.band(band)
-                    logger.info(f"writing {band} reflectance on {processing_date}: {reflectance_filename}")
-                    reflectance_raster.to_geotiff(reflectance_filename)
-
-                # reflectance_list.append(np.array(reflectance_raster).flatten())
-
-                solar_zenith_filename = self.generate_staging_filename(tile, processing_date, f"{band_type}_solar_zenith")
-
-                if exists(solar_zenith_filename):
-                    logger.info(f"previously generated solar zenith on {processing_date}: {solar_zenith_filename}")
-                    # solar_zenith_raster = Raster.open(solar_zenith_filename)
-                else:
-                    logger.info(f"generating solar zenith on {processing_date}")
-                    solar_zenith_raster = granule.solar_zenith(band)
-                    logger.info(f"writing solar zenith on {processing_date}: {solar_zenith_filename}")
-                    solar_zenith_raster.to_geotiff(solar_zenith_filename)
-
-                # solar_zenith_list.append(np.array(solar_zenith_raster).flatten())
-
-                sensor_zenith_filename = self.generate_staging_filename(tile, processing_date, f"{band_type}_sensor_zenith")
-
-                if exists(sensor_zenith_filename):
-                    logger.info(f"previously generated sensor zenith on {processing_date}: {sensor_zenith_filename}")
-                    # sensor_zenith_raster = Raster.open(sensor_zenith_filename)
-                else:
-                    logger.info(f"generating sensor zenith on {processing_date}")
-                    sensor_zenith_raster = granule.sensor_zenith(band)
-                    logger.info(f"writing sensor zenith on {processing_date}: {sensor_zenith_filename}")
-                    sensor_zenith_raster.to_geotiff(sensor_zenith_filename)
-
-                # sensor_zenith_list.append(np.array(sensor_zenith_raster).flatten())
-
-                relative_azimuth_filename = self.generate_staging_filename(tile, processing_date, f"{band_type}_relative_azimuth")
-
-                if exists(relative_azimuth_filename):
-                    logger.info(f"previously generated sensor zenith on {processing_date}: {relative_azimuth_filename}")
-                    # relative_azimuth_raster = Raster.open(relative_azimuth_filename)
-                else:
-                    logger.info(f"generating sensor zenith on {processing_date}")
-                    solar_azimuth = granule.solar_azimuth(band)
-                    sensor_azimuth = granule.sensor_azimuth(band)
-                    relative_azimuth_raster = Raster(np.abs(solar_azimuth - sensor_azimuth), geometry=sensor_azimuth.geometry)
-                    logger.info(f"writing sensor zenith on {processing_date}: {relative_azimuth_filename}")
-                    relative_azimuth_raster.to_geotiff(relative_azimuth_filename)
-
-                # relative_azimuth_list.append(np.array(relative_azimuth_raster).flatten())
+                self.stage_VNP09GA(granule, tile, processing_date, band)
             except VIIRSUnavailableError as e:
                 if (datetime.utcnow().date() - processing_date).days > 4:
                     logger.warning(e)
@@ -484,7 +553,7 @@ class VNP43NRT(VIIRSDownloaderAlbedo, VIIRSDownloaderNDVI):
             logger.info(f"solar zenith noon file already exists: {SZA_filename}")
         else:
             doy = date_UTC.timetuple().tm_yday
-            SZA = calculate_SZA(doy, 12, grid)
+            SZA = calculate_SZA(doy, 12, grid, indices_directory=self.indices_directory)
             logger.info(f"writing solar zenith noon: {SZA_filename}")
             SZA.to_geotiff(SZA_filename)
 
@@ -613,10 +682,35 @@ class VNP43NRT(VIIRSDownloaderAlbedo, VIIRSDownloaderNDVI):
 
     def AOT(self, time_UTC: datetime, geometry: RasterGeometry = None, resampling: str = None) -> Raster:
         try:
-            return self.GEOS5FP.AOT(time_UTC=time_UTC, geometry=geometry, resampling=resampling)
+            return self.AOT_provider.AOT(time_UTC=time_UTC, geometry=geometry, resampling=resampling)
         except FailedGEOS5FPDownload as e:
             raise AuxiliaryDownloadFailed("unable to retrieve AOT from GEOS5-FP for VNP43NRT")
 
+    def prefetch_AOT(
+            self,
+            dates: Iterable[Union[date, str]],
+            geometry: RasterGeometry):
+        """
+        Retrieves the 10:30 UTC AOT for every MODLAND tile and date in one batch,
+        skipping VNP43NRT granules that are already complete.
+        """
+        tiles = sorted(find_modland_tiles(geometry.boundary_latlon.geometry))
+        requests = []
+
+        for date_UTC in sorted(get_date(d) for d in dates):
+            for tile in tiles:
+                if VNP43NRTGranule(self.granule_directory(date_UTC=date_UTC, tile=tile)).complete:
+                    continue
+
+                time_UTC = datetime(date_UTC.year, date_UTC.month, date_UTC.day, 10, 30)
+                requests.append((time_UTC, generate_modland_grid(*parsehv(tile), 1200)))
+
+        logger.info(f"prefetching GEOS-5 FP AOT for {cl.val(len(requests))} VNP43NRT tile-dates")
+        failed = self.AOT_provider.prefetch(requests, resampling="cubic")
+
+        if len(failed) > 0:
+            logger.warning(f"unable to prefetch GEOS-5 FP AOT for {len(failed)} VNP43NRT tile-dates")
+
     def VNP43NRT(
             self,
             date_UTC: Union[date, str],
@@ -635,88 +729,72 @@ class VNP43NRT(VIIRSDownloaderAlbedo, VIIRSDownloaderNDVI):
 
         granule = VNP43NRTGranule(directory)
 
-        if granule.complete:
-            return granule
-
-        for i in (1, 2):
-            BRDF_parameters = self.BRDF_parameters(
-                date_UTC=date_UTC,
-                tile=tile,
-                band=f"I{i}"
-            )
-
-            granule.add_layer(f"NBAR_I{i}", BRDF_parameters.NBAR)
+        # neighbouring Sentinel tiles processed concurrently need the same VNP43NRT granules
+        with FileLock(directory):
+            if granule.complete:
+                return granule
+
+            for i in (1, 2):
+                BRDF_parameters = self.BRDF_parameters(
+                    date_UTC=date_UTC,
+                    tile=tile,
+                    band=f"I{i}"
+                )
+
+                granule.add_layer(f"NBAR_I{i}", BRDF_parameters.NBAR)
+
+                if diagnostics:
+                    granule.add_layer(f"NBARSE_I{i}", BRDF_parameters.NBAR_SE)
+                    granule.add_layer(f"WSA_I{i}", BRDF_parameters.WSA)
+                    granule.add_layer(f"WSASE_I{i}", BRDF_parameters.WSA_SE)
+                    granule.add_layer(f"BSA_I{i}", BRDF_parameters.BSA)
+                    granule.add_layer(f"BSASE_I{i}", BRDF_parameters.BSA_SE)
+                    granule.add_layer(f"BRDFSE_I{i}", BRDF_parameters.BRDF_SE)
+                    granule.add_layer(f"count_I{i}", BRDF_parameters.count)
+
+            NIR = granule.variable("NBAR_I2")
+            red = granule.variable("NBAR_I1")
+            NDVI = rasters.clip((NIR - red) / (NIR + red), -1, 1)
+            granule.add_layer("NDVI", NDVI)
+
+            time_UTC = datetime(date_UTC.year, date_UTC.month, date_UTC.day, 10, 30)
+            geometry = generate_modland_grid(*parsehv(tile), 1200)
+            AOT = self.AOT(time_UTC=time_UTC, geometry=geometry, resampling="cubic")
 
             if diagnostics:
-                granule.add_layer(f"NBARSE_I{i}", BRDF_parameters.NBAR_SE)
-                granule.add_layer(f"WSA_I{i}", BRDF_parameters.WSA)
-                granule.add_layer(f"WSASE_I{i}", BRDF_parameters.WSA_SE)
-                granule.add_layer(f"BSA_I{i}", BRDF_parameters.BSA)
-                granule.add_layer(f"BSASE_I{i}", BRDF_parameters.BSA_SE)
-                granule.add_layer(f"BRDFSE_I{i}", BRDF_parameters.BRDF_SE)
-                granule.add_layer(f"count_I{i}", BRDF_parameters.count)
-
-        NIR = granule.variable("NBAR_I2")
-        red = granule.variable("NBAR_I1")
-        NDVI = rasters.clip((NIR - red) / (NIR + red), -1, 1)
-        granule.add_layer("NDVI", NDVI)
-
-        time_UTC = datetime(date_UTC.year, date_UTC.month, date_UTC.day, 10, 30)
-        geometry = generate_modland_grid(*parsehv(tile), 1200)
-        AOT = self.AOT(time_UTC=time_UTC, geometry=geometry, resampling="cubic")
-
-        if diagnostics:
-            granule.add_layer("AOT", AOT)
-
-        doy = date_UTC.timetuple().tm_yday
-        SZA = calculate_SZA(doy, 10.5, geometry)
-
-        if diagnostics:
-            granule.add_layer("SZA", SZA)
-
-        b = {}
-
-        for m in (1, 2, 3, 4, 5, 7, 8, 10, 11):
-            BRDF_parameters = self.BRDF_parameters(
-                date_UTC=date_UTC,
-                tile=tile,
-                band=f"M{m}"
-            )
-            WSA = BRDF_parameters.WSA
-            granule.add_layer(f"WSA_M{m}", WSA)
-            BSA = BRDF_parameters.BSA
-            granule.add_layer(f"BSA_M{m}", BSA)
-
-            band_albedo = bidirectional_reflectance(
-                white_sky_albedo=WSA,
-                black_sky_albedo=BSA,
-                SZA=SZA,
-                AOT=AOT
-            )
+                granule.add_layer("AOT", AOT)
 
-            b[m] = rasters.clip(band_albedo, 0, 1)
+            doy = date_UTC.timetuple().tm_yday
+            SZA = calculate_SZA(doy, 10.5, geometry, indices_directory=self.indices_directory)
 
             if diagnostics:
-                granule.add_layer(f"WSASE_M{m}", BRDF_parameters.WSA_SE)
-                granule.add_layer(f"BSASE_M{m}", BRDF_parameters.BSA_SE)
-                granule.add_layer(f"BRDFSE_M{m}", BRDF_parameters.BRDF_SE)
-                granule.add_layer(f"NBAR_M{m}", BRDF_parameters.NBAR)
-                granule.add_layer(f"NBARSE_M{m}", BRDF_parameters.NBAR_SE)
-                granule.add_layer(f"count_M{m}", BRDF_parameters.count)
-
-        albedo = 0.2418 * b[1] \
-                 - 0.201 * b[2] \
-                 + 0.2093 * b[3] \
-                 + 0.1146 * b[4] \
-                 + 0.1348 * b[5] \
-                 + 0.2251 * b[7] \
-                 + 0.1123 * b[8] \
-                 + 0.0860 * b[10] \
-                 + 0.0803 * b[11] \
-                 - 0.0131
-
-        albedo = rasters.clip(albedo, 0, 1)
-        granule.add_layer("albedo", albedo)
+                granule.add_layer("SZA", SZA)
+
+            broadband_albedo = BroadbandAlbedo(SZA=SZA, AOT=AOT, geometry=geometry, clip_bands=True)
+
+            for m in BROADBAND_ALBEDO_COEFFICIENTS:
+                BRDF_parameters = self.BRDF_parameters(
+                    date_UTC=date_UTC,
+                    tile=tile,
+                    band=f"M{m}"
+                )
+                WSA = BRDF_parameters.WSA
+                granule.add_layer(f"WSA_M{m}", WSA)
+                BSA = BRDF_parameters.BSA
+                granule.add_layer(f"BSA_M{m}", BSA)
+
+                broadband_albedo.add(m, white_sky_albedo=WSA, black_sky_albedo=BSA)
+
+                if diagnostics:
+                    granule.add_layer(f"WSASE_M{m}", BRDF_parameters.WSA_SE)
+                    granule.add_layer(f"BSASE_M{m}", BRDF_parameters.BSA_SE)
+                    granule.add_layer(f"BRDFSE_M{m}", BRDF_parameters.BRDF_SE)
+                    granule.add_layer(f"NBAR_M{m}", BRDF_parameters.NBAR)
+                    granule.add_layer(f"NBARSE_M{m}", BRDF_parameters.NBAR_SE)
+                    granule.add_layer(f"count_M{m}", BRDF_parameters.count)
+
+            albedo = broadband_albedo.result(clip=True)
+            granule.add_layer("albedo", albedo)
         logger.info(f"finished processing VNP43NRT at {cl.place(tile)} on {cl.time(date_UTC)} ({cl.time(timer)})")
 
         return granule
@@ -0,0 +1,86 @@
+import json
+import logging
+import os
+import threading
+from os import makedirs
+from os.path import dirname, exists
+from typing import Any, Callable
+
+from .file_lock import FileLock
+
+logger = logging.getLogger(__name__)
+
+
+def temporary_filename(filename: str) -> str:
+    """
+    Names the temporary file a file is written to before replacing it, unique to the writing process and thread,
+    so that concurrent readers never see a partial file.
+    """
+    return f"{filename}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+def read_JSON(filename: str, description: str = "JSON file") -> Any:
+    """
+    Reads a JSON file, or returns None if it does not exist or cannot be read.
+
+    Args:
+        filename (str): The JSON file to read.
+        description (str, optional): What the file holds, for the warning logged when it cannot be read.
+    """
+    if not exists(filename):
+        return None
+
+    try:
+        with open(filename, "r") as file:
+            return json.load(file)
+    except (IOError, ValueError) as e:
+        logger.warning(f"ignoring unreadable {description} {filename}: {e}")
+        return None
+
+
+def write_JSON(filename: str, data: Any, indent: int = None):
+    """
+    Writes a JSON file through a temporary file that replaces it once complete.
+
+    Args:
+        filename (str): The JSON file to write.
+        data (Any): The JSON-serializable data to write.
+        indent (int, optional): Indentation of the JSON.
+    """
+    makedirs(dirname(filename), exist_ok=True)
+    temporary_JSON_filename = temporary_filename(filename)
+
+    with open(temporary_JSON_filename, "w") as file:
+        json.dump(data, file, indent=indent)
+
+    os.replace(temporary_JSON_filename, filename)
+
+
+def update_JSON(
+        filename: str,
+        update: Callable[[dict], None],
+        description: str = "JSON file",
+        indent: int = None) -> dict:
+    """
+    Reads, updates and replaces a JSON object file while holding its lock,
+    so that processes updating the same file take turns and none of their updates is lost.
+
+    Args:
+        filename (str): The JSON file to update, holding an object.
+        update (Callable[[dict], None]): Updates the object read from the file, or an empty one, in place.
+        description (str, optional): What the file holds, for the warning logged when it cannot be read.
+        indent (int, optional): Indentation of the JSON.
+
+    Returns:
+        dict: The updated object as written.
+    """
+    with FileLock(filename):
+        data = read_JSON(filename, description)
+
+        if data is None:
+            data = {}
+
+        update(data)
+        write_JSON(filename, data, indent=indent)
+
+    return data
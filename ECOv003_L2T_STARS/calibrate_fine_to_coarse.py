@@ -1,13 +1,96 @@
+from typing import Tuple
 import logging
 
 import numpy as np
-from scipy import stats
 
 from rasters import Raster
 
+from .constants import CALIBRATION_MIN_PIXELS
+from .grid_indices import get_aggregation_operator
+
 logger = logging.getLogger(__name__)
 
-def calibrate_fine_to_coarse(fine_image: Raster, coarse_image: Raster) -> Raster:
+
+def aggregate_fine_to_coarse(fine_image: Raster, coarse_image: Raster, indices_directory: str = None) -> np.ndarray:
+    """
+    Aggregates a fine-resolution raster image to the geometry of a coarse-resolution raster image
+    with the tile's cached aggregation operator, falling back to average resampling
+    for grids that are not nested, where the coarse resolution is not an integral multiple
+    of the fine resolution or the grid origins are not aligned.
+
+    Args:
+        fine_image (Raster): The higher-resolution raster image to aggregate.
+        coarse_image (Raster): The lower-resolution raster image whose geometry is aggregated to.
+        indices_directory (str, optional): Directory holding the per-grid index files.
+
+    Returns:
+        np.ndarray: The mean of the valid fine pixels within each coarse pixel.
+    """
+    try:
+        operator = get_aggregation_operator(fine_image.geometry, coarse_image.geometry, indices_directory)
+        return operator.aggregate(np.array(fine_image))
+    except ValueError:
+        return np.array(fine_image.to_geometry(coarse_image.geometry, resampling="average"))
+
+
+def fit_calibrations(
+        x: np.ndarray,
+        y: np.ndarray,
+        min_pixels: int = CALIBRATION_MIN_PIXELS) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Fits the least-squares lines of coarse on aggregated fine values of each row of stacked arrays in one pass.
+
+    Args:
+        x (np.ndarray): Aggregated fine values, one row of coarse pixels per date.
+        y (np.ndarray): Coarse values of the same shape.
+        min_pixels (int, optional): Minimum number of valid pixel pairs for a row to be fitted.
+
+    Returns:
+        Tuple: The slope, intercept, R-squared and number of valid pixel pairs of each row.
+               Rows with fewer than `min_pixels` valid pairs have NaN coefficients.
+    """
+    x = np.atleast_2d(np.asarray(x, dtype=np.float64))
+    y = np.atleast_2d(np.asarray(y, dtype=np.float64))
+    mask = np.isfinite(x) & np.isfinite(y)
+    pixels = np.count_nonzero(mask, axis=1)
+    fitted = pixels >= min_pixels
+    count = np.where(fitted, pixels, 1)
+
+    x = np.where(mask, x, 0)
+    y = np.where(mask, y, 0)
+    mean_x = x.sum(axis=1) / count
+    mean_y = y.sum(axis=1) / count
+    dx = np.where(mask, x - mean_x[:, None], 0)
+    dy = np.where(mask, y - mean_y[:, None], 0)
+    sxx = (dx * dx).sum(axis=1)
+    syy = (dy * dy).sum(axis=1)
+    sxy = (dx * dy).sum(axis=1)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = np.where(fitted, sxy / sxx, np.nan)
+        intercept = np.where(fitted, mean_y - slope * mean_x, np.nan)
+        r_squared = np.where(fitted, sxy * sxy / (sxx * syy), np.nan)
+
+    return slope, intercept, r_squared, pixels
+
+
+def fit_pooled_calibration(
+        x: np.ndarray,
+        y: np.ndarray,
+        min_pixels: int = CALIBRATION_MIN_PIXELS) -> Tuple[float, float, float, int]:
+    """
+    Fits one least-squares line of coarse on aggregated fine values over all the rows of stacked arrays,
+    for dates with too few valid pixel pairs to be fitted on their own.
+
+    Returns:
+        Tuple: The slope, intercept, R-squared and number of valid pixel pairs of the pooled fit.
+    """
+    slope, intercept, r_squared, pixels = fit_calibrations(np.ravel(x), np.ravel(y), min_pixels)
+
+    return float(slope[0]), float(intercept[0]), float(r_squared[0]), int(pixels[0])
+
+
+def calibrate_fine_to_coarse(fine_image: Raster, coarse_image: Raster, indices_directory: str = None) -> Raster:
     """
     Calibrates a fine-resolution raster image to a coarse-resolution raster image
     using linear regression.
@@ -21,37 +104,28 @@ def calibrate_fine_to_coarse(fine_image: Raster, coarse_image: Raster) -> Raster
         fine_image (Raster): The higher-resolution raster image to be calibrated.
         coarse_image (Raster): The lower-resolution raster image used as the reference
                                 for calibration.
+        indices_directory (str, optional): Directory holding the per-grid index files.
 
     Returns:
         Raster: The calibrated fine-resolution raster image. If too few valid
                 data points are available for regression (less than 30), the
                 original fine_image is returned.
     """
-    # Aggregate the fine image to the coarse image's geometry for comparison
-    aggregated_image = fine_image.to_geometry(coarse_image.geometry, resampling="average")
-    x = np.array(aggregated_image).flatten()  # Independent variable (aggregated fine)
-    y = np.array(coarse_image).flatten()  # Dependent variable (coarse)
-
-    # Create a mask to remove NaN values from both arrays, ensuring valid data points for regression
-    mask = ~np.isnan(x) & ~np.isnan(y)
+    x = aggregate_fine_to_coarse(fine_image, coarse_image, indices_directory).ravel()  # Independent variable
+    y = np.array(coarse_image).ravel()  # Dependent variable (coarse)
+    slope, intercept, r_squared, pixels = (value[0] for value in fit_calibrations(x, y))
 
     # Check if there are enough valid data points for a meaningful linear regression
-    if np.count_nonzero(mask) < 30:
+    if np.isnan(slope):
         logger.warning(
-            f"Insufficient valid data points ({np.count_nonzero(mask)}) for calibration. "
+            f"Insufficient valid data points ({pixels}) for calibration. "
             "Returning original fine image."
         )
         return fine_image
 
-    # Apply the mask to get only valid data points
-    x = x[mask]
-    y = y[mask]
-
-    # Perform linear regression
-    slope, intercept, r_value, p_value, std_err = stats.linregress(x, y)
     logger.info(
         f"Linear regression for calibration: slope={slope:.4f}, intercept={intercept:.4f}, "
-        f"R-squared={r_value**2:.4f}"
+        f"R-squared={r_squared:.4f}"
     )
 
     # Apply the derived calibration to the original fine image
@@ -0,0 +1,139 @@
+import logging
+import os
+import threading
+from datetime import date, datetime
+from os import makedirs
+from os.path import abspath, exists, expanduser, join
+from typing import Dict, Tuple, Union
+
+import colored_logging as cl
+import numpy as np
+
+from .atomic_file import read_JSON, temporary_filename, update_JSON
+from .daterange import get_date
+from .process_cache import ProcessCache
+
+logger = logging.getLogger(__name__)
+
+# process-wide calibration stores keyed by directory
+_CALIBRATION_STORES = ProcessCache()
+
+
+class CalibrationStore:
+    """
+    Persistent record of the fine-to-coarse calibration coefficients fitted for each tile, date and product,
+    so that the dates of a sliding window are fitted once rather than by every run covering them.
+
+    Each record holds the slope and intercept applied to the fine image, the R-squared and number of
+    coarse pixel pairs of the fit, and whether the fit was pooled over a window.
+    Records are stored as one JSON file per tile and product, alongside the aggregated fine and coarse values
+    each date was fitted on, so that a fit pooled over a window covers the dates fitted by earlier runs.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = abspath(expanduser(directory))
+        # records by (tile, product), then by ISO date
+        self._records: Dict[Tuple[str, str], Dict[str, dict]] = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"CalibrationStore({self.directory})"
+
+    def filename(self, tile: str, product: str) -> str:
+        return join(self.directory, tile, f"{product}.json")
+
+    def samples_filename(self, tile: str, product: str, date_UTC: Union[date, str]) -> str:
+        return join(self.directory, tile, f"{product}_{get_date(date_UTC).isoformat()}.npz")
+
+    def _read(self, tile: str, product: str) -> Dict[str, dict]:
+        records = read_JSON(self.filename(tile, product), "calibration records")
+        return {} if records is None else records
+
+    def get(self, tile: str, product: str, date_UTC: Union[date, str]) -> Union[dict, None]:
+        """
+        Retrieves the calibration coefficients fitted for a product at a tile on a date, or None if not yet fitted.
+        """
+        key = (tile, product)
+
+        with self._lock:
+            if key not in self._records:
+                self._records[key] = self._read(tile, product)
+
+            return self._records[key].get(get_date(date_UTC).isoformat())
+
+    def record(
+            self,
+            tile: str,
+            product: str,
+            date_UTC: Union[date, str],
+            slope: float,
+            intercept: float,
+            r_squared: float,
+            pixels: int,
+            pooled: bool = False) -> dict:
+        """
+        Records the calibration coefficients fitted for a product at a tile on a date.
+        """
+        date_UTC = get_date(date_UTC)
+        entry = {
+            "slope": float(slope),
+            "intercept": float(intercept),
+            "r_squared": float(r_squared),
+            "pixels": int(pixels),
+            "pooled": bool(pooled),
+            "recorded": datetime.utcnow().isoformat()
+        }
+
+        logger.info(
+            f"{'pooled ' if pooled else ''}calibration for {cl.name(product)} at {cl.place(tile)} "
+            f"on {cl.time(date_UTC)}: slope={slope:.4f}, intercept={intercept:.4f}, "
+            f"R-squared={r_squared:.4f} from {pixels} pixels"
+        )
+
+        with self._lock:
+            self._records[(tile, product)] = update_JSON(
+                self.filename(tile, product),
+                lambda records: records.update({date_UTC.isoformat(): entry}),
+                "calibration records",
+                indent=1
+            )
+
+        return entry
+
+    def record_samples(self, tile: str, product: str, date_UTC: Union[date, str], x: np.ndarray, y: np.ndarray):
+        """
+        Keeps the aggregated fine values and coarse values a product at a tile was fitted on for a date.
+        """
+        filename = self.samples_filename(tile, product, date_UTC)
+        makedirs(join(self.directory, tile), exist_ok=True)
+        temporary_samples_filename = temporary_filename(filename)
+
+        with open(temporary_samples_filename, "wb") as file:
+            np.savez(file, x=np.asarray(x, dtype=np.float32), y=np.asarray(y, dtype=np.float32))
+
+        os.replace(temporary_samples_filename, filename)
+
+    def samples(self, tile: str, product: str, date_UTC: Union[date, str]) -> Union[Tuple[np.ndarray, np.ndarray], None]:
+        """
+        Retrieves the aggregated fine values and coarse values a product at a tile was fitted on for a date,
+        or None if they were not kept.
+        """
+        filename = self.samples_filename(tile, product, date_UTC)
+
+        if not exists(filename):
+            return None
+
+        try:
+            with np.load(filename) as samples:
+                return samples["x"], samples["y"]
+        except (IOError, ValueError, KeyError) as e:
+            logger.warning(f"ignoring unreadable calibration samples {filename}: {e}")
+            return None
+
+
+def get_calibration_store(directory: str) -> CalibrationStore:
+    """
+    Retrieves the process-wide calibration store for a directory.
+    """
+    directory = abspath(expanduser(directory))
+    return _CALIBRATION_STORES.get(directory, lambda: CalibrationStore(directory))
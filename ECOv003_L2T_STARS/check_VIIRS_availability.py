@@ -0,0 +1,94 @@
+from datetime import date, datetime, timedelta
+from os.path import exists
+import logging
+
+import colored_logging as cl
+from rasters import RasterGeometry
+
+from ECOv003_exit_codes import AuxiliaryLatency
+
+from .constants import VIIRS_GIVEUP_DAYS
+from .daterange import date_range
+from .generate_downsampled_filename import generate_downsampled_filename
+from .VIIRS.VIIRSDownloader import VIIRSDownloaderAlbedo, VIIRSDownloaderNDVI
+
+logger = logging.getLogger(__name__)
+
+
+def check_VIIRS_availability(
+    tile: str,
+    geometry: RasterGeometry,
+    VIIRS_start_date: date,
+    VIIRS_end_date: date,
+    NDVI_resolution: int,
+    albedo_resolution: int,
+    downsampled_directory: str,
+    NDVI_VIIRS_connection: VIIRSDownloaderNDVI,
+    albedo_VIIRS_connection: VIIRSDownloaderAlbedo,
+    giveup_days: int = VIIRS_GIVEUP_DAYS,
+    today: date = None,
+):
+    """
+    Checks from granule metadata alone whether the coarse VIIRS images of a run can be produced,
+    before any download, staging, BRDF or fusion work starts.
+
+    Only coarse dates within the give-up window whose downsampled images are not yet staged are checked,
+    because `generate_STARS_inputs` raises `AuxiliaryLatency` only for those.
+    Each of these dates needs the VIIRS inputs from `INPUT_DAYS` before it,
+    and any of those inputs still within the give-up window must already be published.
+
+    Args:
+        tile (str): The HLS tile ID.
+        geometry (RasterGeometry): The geometry of the tile.
+        VIIRS_start_date (date): The first coarse VIIRS date of the run.
+        VIIRS_end_date (date): The last coarse VIIRS date of the run.
+        NDVI_resolution (int): The resolution of the coarse NDVI images.
+        albedo_resolution (int): The resolution of the coarse albedo images.
+        downsampled_directory (str): Directory of staged coarse and fine images.
+        NDVI_VIIRS_connection (VIIRSDownloaderNDVI): The VIIRS NDVI connection.
+        albedo_VIIRS_connection (VIIRSDownloaderAlbedo): The VIIRS albedo connection.
+        giveup_days (int, optional): Days after which missing VIIRS data is assumed never to arrive.
+        today (date, optional): The current UTC date. Defaults to today.
+
+    Raises:
+        AuxiliaryLatency: If VIIRS inputs within the give-up window are not yet published.
+    """
+    if today is None:
+        today = datetime.utcnow().date()
+
+    earliest_pending_input = today - timedelta(days=giveup_days)
+    missing_dates = set()
+
+    for variable, resolution, connection in (
+            ("NDVI", NDVI_resolution, NDVI_VIIRS_connection),
+            ("albedo", albedo_resolution, albedo_VIIRS_connection)):
+        pending_dates = [
+            processing_date
+            for processing_date in date_range(max(VIIRS_start_date, earliest_pending_input), VIIRS_end_date)
+            if not exists(generate_downsampled_filename(
+                directory=downsampled_directory,
+                variable=variable,
+                date_UTC=processing_date,
+                tile=tile,
+                cell_size=resolution
+            ))
+        ]
+
+        if len(pending_dates) == 0:
+            continue
+
+        start_date = max(min(pending_dates) - timedelta(days=connection.INPUT_DAYS), earliest_pending_input)
+        end_date = max(pending_dates)
+
+        logger.info(
+            f"checking VIIRS availability for coarse {variable} at {cl.place(tile)} "
+            f"from {cl.time(start_date)} to {cl.time(end_date)}"
+        )
+
+        missing_dates.update(connection.missing_dates(start_date, end_date, geometry))
+
+    if len(missing_dates) > 0:
+        raise AuxiliaryLatency(
+            f"VIIRS is not yet available within {giveup_days}-day window at tile {tile} for dates: "
+            f"{', '.join([str(d) for d in sorted(missing_dates)])}"
+        )
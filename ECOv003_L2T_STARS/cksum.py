@@ -3,64 +3,139 @@ Pure Python implementation of POSIX cksum algorithm.
 
 This module provides a replacement for the pycksum package that is compatible
 with Python 3.12 and later versions.
+
+The CRC is the unreflected CRC-32 of the data followed by its length. Data is processed in chunks through
+zlib's CRC-32 on bit-reversed bytes, which is the same polynomial with reflected input and output,
+so checksumming runs at C speed. A byte-table implementation processes the length suffix and serves
+as the reference in the tests.
 """
 
+import zlib
+
+CKSUM_POLYNOMIAL = 0x04c11db7
+CKSUM_CHUNK_SIZE = 2 ** 20  # bytes read per chunk from file-like objects
+
+
+def _generate_table():
+    table = []
+
+    for byte in range(256):
+        crc = byte << 24
 
-def cksum(data_or_file):
-    """
-    Calculate POSIX cksum checksum for data or file-like object.
-    
-    Args:
-        data_or_file: Either bytes data or a file-like object opened in binary mode
-        
-    Returns:
-        int: The POSIX cksum checksum value
-    """
-    # Handle file-like objects
-    if hasattr(data_or_file, 'read'):
-        data = data_or_file.read()
-    else:
-        data = data_or_file
-    
-    # Ensure we have bytes
-    if isinstance(data, str):
-        data = data.encode('utf-8')
-    
-    # Initialize CRC with 0
-    crc = 0
-    
-    # Process each byte of data
-    for byte in data:
-        # XOR the byte with the current CRC (shifted left 8 bits) 
-        crc ^= byte << 24
-        
-        # Process 8 bits
         for _ in range(8):
             if crc & 0x80000000:  # If MSB is set
-                crc = (crc << 1) ^ 0x04c11db7  # CRC-32 polynomial
+                crc = (crc << 1) ^ CKSUM_POLYNOMIAL
             else:
                 crc = crc << 1
+
             crc &= 0xffffffff  # Keep it 32-bit
-    
-    # Append the length in bytes as a big-endian value
-    length = len(data)
+
+        table.append(crc)
+
+    return table
+
+
+# CRC of each byte value shifted into an empty register
+CKSUM_TABLE = _generate_table()
+
+# each byte value with its bits in reverse order
+BIT_REVERSED_BYTES = bytes(int(f"{byte:08b}"[::-1], 2) for byte in range(256))
+
+
+def _reflect32(value):
+    return (
+        BIT_REVERSED_BYTES[value & 0xff] << 24 |
+        BIT_REVERSED_BYTES[(value >> 8) & 0xff] << 16 |
+        BIT_REVERSED_BYTES[(value >> 16) & 0xff] << 8 |
+        BIT_REVERSED_BYTES[value >> 24]
+    )
+
+
+def _update_crc_table(crc, data):
+    for byte in data:
+        crc = ((crc << 8) & 0xffffffff) ^ CKSUM_TABLE[(crc >> 24) ^ byte]
+
+    return crc
+
+
+def _update_crc(crc, data):
+    # zlib keeps the reflected register complemented, so the unreflected register is converted on entry and exit
+    reflected = zlib.crc32(bytes(data).translate(BIT_REVERSED_BYTES), _reflect32(crc) ^ 0xffffffff)
+    return _reflect32(reflected ^ 0xffffffff)
+
+
+def _length_suffix(length):
+    # the length in bytes, least significant byte first, in as few bytes as needed
     length_bytes = []
+
     while length > 0:
-        length_bytes.insert(0, length & 0xff)
+        length_bytes.append(length & 0xff)
         length >>= 8
-    
-    # Process the length bytes
-    for byte in length_bytes:
-        crc ^= byte << 24
-        for _ in range(8):
-            if crc & 0x80000000:
-                crc = (crc << 1) ^ 0x04c11db7
-            else:
-                crc = crc << 1
-            crc &= 0xffffffff
-    
-    # Final XOR and return as signed 32-bit integer equivalent
-    result = crc ^ 0xffffffff
-    
-    # Convert to match expected return type (unsigned 32-bit integer)
-    return result
\ No newline at end of file
+
+    return bytes(length_bytes)
+
+
+class CKSUM:
+    """
+    Incremental POSIX cksum with the `update`/`hexdigest` interface of hashlib,
+    so that a checksum can be computed while a file is downloaded.
+
+    `hexdigest` returns the checksum as a decimal string, the form published in LP DAAC granule metadata.
+    """
+
+    name = "cksum"
+
+    def __init__(self, data=b""):
+        self._crc = 0
+        self._length = 0
+        self.update(data)
+
+    def update(self, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+
+        if len(data) == 0:
+            return
+
+        self._crc = _update_crc(self._crc, data)
+        self._length += len(data)
+
+    def value(self):
+        """
+        Returns:
+            int: The POSIX cksum checksum of the data so far
+        """
+        crc = _update_crc_table(self._crc, _length_suffix(self._length))
+
+        # Final XOR and return as unsigned 32-bit integer
+        return crc ^ 0xffffffff
+
+    def hexdigest(self):
+        return str(self.value())
+
+
+def cksum(data_or_file, chunk_size=CKSUM_CHUNK_SIZE):
+    """
+    Calculate POSIX cksum checksum for data or file-like object.
+
+    Args:
+        data_or_file: Either bytes data or a file-like object opened in binary mode,
+            which is read in chunks of `chunk_size` bytes
+
+    Returns:
+        int: The POSIX cksum checksum value
+    """
+    checksum = CKSUM()
+
+    if hasattr(data_or_file, 'read'):
+        while True:
+            chunk = data_or_file.read(chunk_size)
+
+            if not chunk:
+                break
+
+            checksum.update(chunk)
+    else:
+        checksum.update(data_or_file)
+
+    return checksum.value()
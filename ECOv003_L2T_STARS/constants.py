@@ -23,12 +23,17 @@ GEOS5FP_PRODUCTS_DIRECTORY = "GEOS5FP_products"
 VNP09GA_PRODUCTS_DIRECTORY = "VNP09GA_products"
 VNP43NRT_PRODUCTS_DIRECTORY = "VNP43NRT_products"
 STARS_DOWNSAMPLED_DIRECTORY = "DOWNSAMPLED_products"
+UNAVAILABLE_DIRECTORY = "unavailable"  # Records of source data found to be unavailable
+CALIBRATION_DIRECTORY = "calibration"  # Fine-to-coarse calibration coefficients of staged fine images
+MODEL_STATE_DIRECTORY = "latest"  # Latest posterior of each tile, read as the prior of the next run
 
 # environment behavior
 INITIALIZE_JULIA = False  # Flag to initialize Julia environment
 
 # Processing parameters
 VIIRS_GIVEUP_DAYS = 4  # Number of days to give up waiting for VIIRS data
+HLS_GIVEUP_DAYS = 10  # Number of days to give up waiting for HLS data
+UNAVAILABLE_RECENT_TTL_HOURS = 6  # Hours before re-checking source data found unavailable within its give-up window
 SPINUP_DAYS = 7  # Spin-up period for time-series analysis
 TARGET_RESOLUTION = 70  # Target output resolution in meters
 NDVI_RESOLUTION = 490  # NDVI coarse resolution in meters
@@ -36,10 +41,17 @@ ALBEDO_RESOLUTION = 980  # Albedo coarse resolution in meters
 USE_SPATIAL = False  # Flag for using spatial interpolation (currently unused)
 USE_VNP43NRT = True  # Flag for using VNP43NRT VIIRS product
 CALIBRATE_FINE = False  # Flag for calibrating fine resolution data to coarse
+POOLED_CALIBRATION = False  # Flag for calibrating dates with too few pixels by a fit pooled over the window
+CALIBRATION_MIN_PIXELS = 30  # Minimum number of valid coarse pixel pairs for a calibration fit
 THREADS = "auto"  # Number of threads to use, 'auto' for automatic detection
 WORKERS = 4  # Number of worker processes for parallel processing
+HLS_DOWNLOAD_WORKERS = 4  # Number of HLS granules downloaded concurrently
+LAYER_ENCODING_WORKERS = 4  # Number of product layers encoded concurrently
+BROWSE_OVERVIEW_FACTOR = 8  # Largest block-average reduction of the NDVI layer rendered as the browse image
+GRID_INDICES_CACHE_SIZE = 32  # Grids whose indices and aggregation operators are kept in memory per process
 OVERWRITE = False  # Flag to overwrite existing files
 SOURCES_ONLY = False  # Flag to only process sources without further analysis
+OFFLINE = False  # Flag to serve VIIRS searches from the local CMR cache without network access
 REMOVE_INPUT_STAGING = True  # Flag to remove input staging files after processing
 
 # Product short and long names
@@ -0,0 +1,330 @@
+import hashlib
+import logging
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from os import makedirs, remove
+from os.path import abspath, dirname, exists, expanduser, getsize
+from time import sleep
+from typing import Callable, Dict
+from urllib.parse import urlparse
+
+import requests
+
+import colored_logging as cl
+
+from ECOv003_exit_codes import DownloadFailed
+
+from .cksum import CKSUM
+from .file_lock import FileLock
+
+logger = logging.getLogger(__name__)
+
+DOWNLOAD_WORKERS = 8  # number of files downloaded concurrently
+DOWNLOAD_HOST_LIMIT = 4  # number of concurrent connections to any one host
+DOWNLOAD_RETRIES = 6  # number of attempts per file
+DOWNLOAD_BACKOFF_SECONDS = 5  # wait before the first retry, doubling with every attempt
+DOWNLOAD_MAX_BACKOFF_SECONDS = 360  # longest wait between retries
+DOWNLOAD_TIMEOUT_SECONDS = 120  # connect and read timeout per request
+DOWNLOAD_CHUNK_SIZE = 2 ** 20  # bytes written per chunk
+RETRIED_CLIENT_ERRORS = (408, 429)  # client error statuses that may succeed on a later attempt
+
+PARTIAL_EXTENSION = ".part"
+
+# files currently being downloaded by any scheduler in this process, keyed by destination filename
+_IN_FLIGHT: Dict[str, Future] = {}
+_IN_FLIGHT_LOCK = threading.Lock()
+
+# connection limits per host shared by every scheduler in this process
+_HOST_SEMAPHORES: Dict[str, threading.BoundedSemaphore] = {}
+_HOST_SEMAPHORES_LOCK = threading.Lock()
+
+# checksum algorithm names of CMR UMM-G metadata that differ from the names of their implementations
+CHECKSUM_ALGORITHMS = {
+    "posix": "cksum",
+    "sha3-224": "sha3_224",
+    "sha3-256": "sha3_256",
+    "sha3-384": "sha3_384",
+    "sha3-512": "sha3_512",
+}
+
+
+class ChecksumMismatch(IOError):
+    pass
+
+
+def checksum_hasher(algorithm: str):
+    """
+    Creates an incremental hasher for a checksum algorithm named in CMR UMM or LP DAAC metadata,
+    such as "SHA-256", "MD5", "POSIX" or "CKSUM".
+
+    Args:
+        algorithm (str): Checksum algorithm name.
+
+    Returns:
+        An object with `update(bytes)` and `hexdigest()` methods.
+
+    Raises:
+        ValueError: If the algorithm is not given or not supported.
+    """
+    if algorithm is None:
+        raise ValueError("no checksum algorithm given")
+
+    name = algorithm.strip().lower()
+    name = CHECKSUM_ALGORITHMS.get(name, name.replace("-", ""))
+
+    if name == "cksum":
+        return CKSUM()
+
+    try:
+        return hashlib.new(name)
+    except ValueError:
+        raise ValueError(f"unsupported checksum algorithm: {algorithm}")
+
+
+class DownloadScheduler:
+    """
+    Downloads files concurrently over pooled HTTP sessions with a per-host connection limit.
+
+    Each file is streamed into a `.part` file next to its destination and resumed with a Range request after
+    an interrupted attempt. The checksum is computed while streaming, and failed attempts are retried with
+    exponential backoff, except for client errors that will not succeed on a later attempt.
+    Checksums in algorithms that cannot be computed here are not verified.
+    A process-wide in-flight registry makes concurrent requests for the same destination share one download,
+    and every scheduler in the process shares the limit of `DOWNLOAD_HOST_LIMIT` connections to each host.
+    """
+
+    def __init__(
+            self,
+            session_factory: Callable[[], requests.Session] = None,
+            workers: int = DOWNLOAD_WORKERS,
+            retries: int = DOWNLOAD_RETRIES,
+            backoff_seconds: float = DOWNLOAD_BACKOFF_SECONDS,
+            max_backoff_seconds: float = DOWNLOAD_MAX_BACKOFF_SECONDS,
+            timeout_seconds: float = DOWNLOAD_TIMEOUT_SECONDS,
+            chunk_size: int = DOWNLOAD_CHUNK_SIZE):
+        if session_factory is None:
+            session_factory = requests.Session
+
+        self.session_factory = session_factory
+        self.workers = workers
+        self.retries = retries
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.timeout_seconds = timeout_seconds
+        self.chunk_size = chunk_size
+
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="download")
+        # one keep-alive session per worker thread
+        self._local = threading.local()
+
+    def __repr__(self):
+        return f"DownloadScheduler(workers={self.workers}, retries={self.retries})"
+
+    @property
+    def session(self) -> requests.Session:
+        if getattr(self._local, "session", None) is None:
+            self._local.session = self.session_factory()
+
+        return self._local.session
+
+    def _host_semaphore(self, URL: str) -> threading.BoundedSemaphore:
+        host = urlparse(URL).netloc
+
+        with _HOST_SEMAPHORES_LOCK:
+            if host not in _HOST_SEMAPHORES:
+                _HOST_SEMAPHORES[host] = threading.BoundedSemaphore(DOWNLOAD_HOST_LIMIT)
+
+            return _HOST_SEMAPHORES[host]
+
+    def submit(
+            self,
+            URL: str,
+            filename: str,
+            checksum: str = None,
+            checksum_algorithm: str = None,
+            size: int = None) -> Future:
+        """
+        Schedules a download, or returns the download already in flight for the same destination.
+
+        Args:
+            URL (str): Remote URL.
+            filename (str): Destination filename.
+            checksum (str, optional): Expected checksum as a hexadecimal string.
+            checksum_algorithm (str, optional): Checksum algorithm name, such as "SHA-256" or "MD5".
+            size (int, optional): Expected size in bytes.
+
+        Returns:
+            Future: Resolves to the destination filename, or raises DownloadFailed.
+        """
+        filename = abspath(expanduser(filename))
+
+        with _IN_FLIGHT_LOCK:
+            if filename in _IN_FLIGHT:
+                logger.info(f"download already in flight: {cl.file(filename)}")
+                return _IN_FLIGHT[filename]
+
+            if exists(filename):
+                future = Future()
+                future.set_result(filename)
+                return future
+
+            future = self._executor.submit(self._download, URL, filename, checksum, checksum_algorithm, size)
+            _IN_FLIGHT[filename] = future
+
+        def release(completed: Future):
+            with _IN_FLIGHT_LOCK:
+                if _IN_FLIGHT.get(filename) is completed:
+                    del _IN_FLIGHT[filename]
+
+        future.add_done_callback(release)
+
+        return future
+
+    def download(
+            self,
+            URL: str,
+            filename: str,
+            checksum: str = None,
+            checksum_algorithm: str = None,
+            size: int = None) -> str:
+        """
+        Downloads a file and blocks until it is complete.
+
+        Returns:
+            str: The destination filename.
+
+        Raises:
+            DownloadFailed: If the download fails after all retries.
+        """
+        return self.submit(
+            URL=URL,
+            filename=filename,
+            checksum=checksum,
+            checksum_algorithm=checksum_algorithm,
+            size=size
+        ).result()
+
+    def _download(
+            self,
+            URL: str,
+            filename: str,
+            checksum: str = None,
+            checksum_algorithm: str = None,
+            size: int = None) -> str:
+        # another process sharing the download directory may be retrieving the same file
+        with FileLock(filename):
+            if exists(filename):
+                logger.info(f"file downloaded by another process: {cl.file(filename)}")
+                return filename
+
+            return self._download_with_retries(URL, filename, checksum, checksum_algorithm, size)
+
+    def _download_with_retries(
+            self,
+            URL: str,
+            filename: str,
+            checksum: str = None,
+            checksum_algorithm: str = None,
+            size: int = None) -> str:
+        if checksum is not None:
+            try:
+                checksum_hasher(checksum_algorithm)
+            except ValueError as e:
+                logger.warning(f"downloading without verifying the checksum of {URL}: {e}")
+                checksum = None
+
+        last_exception = None
+
+        for attempt in range(self.retries):
+            if attempt > 0:
+                wait_seconds = min(self.backoff_seconds * 2 ** (attempt - 1), self.max_backoff_seconds)
+                logger.warning(f"retrying download in {wait_seconds} seconds ({attempt + 1}/{self.retries}): {URL}")
+                sleep(wait_seconds)
+
+            try:
+                with self._host_semaphore(URL):
+                    self._attempt(URL, filename, checksum, checksum_algorithm, size)
+
+                return filename
+            except ChecksumMismatch as e:
+                logger.warning(str(e))
+                last_exception = e
+            except requests.HTTPError as e:
+                status = None if e.response is None else e.response.status_code
+
+                # a missing file or a refused login fails the same way on every attempt
+                if status is not None and 400 <= status < 500 and status not in RETRIED_CLIENT_ERRORS:
+                    raise DownloadFailed(f"unable to download {URL}: {e}") from e
+
+                logger.warning(f"download attempt {attempt + 1} failed for {URL}: {e}")
+                last_exception = e
+            except (requests.RequestException, IOError) as e:
+                logger.warning(f"download attempt {attempt + 1} failed for {URL}: {e}")
+                last_exception = e
+
+        raise DownloadFailed(f"unable to download {URL} after {self.retries} attempts") from last_exception
+
+    def _attempt(
+            self,
+            URL: str,
+            filename: str,
+            checksum: str = None,
+            checksum_algorithm: str = None,
+            size: int = None):
+        partial_filename = f"{filename}{PARTIAL_EXTENSION}"
+        makedirs(dirname(filename), exist_ok=True)
+        hasher = None if checksum is None else checksum_hasher(checksum_algorithm)
+        offset = getsize(partial_filename) if exists(partial_filename) else 0
+        headers = {"Range": f"bytes={offset}-"} if offset > 0 else {}
+
+        with self.session.get(URL, headers=headers, stream=True, timeout=self.timeout_seconds) as response:
+            if offset > 0 and response.status_code == 416:
+                # the partial file already holds the whole remote file
+                logger.info(f"partial download already complete: {cl.file(partial_filename)}")
+                self._hash_existing(partial_filename, hasher)
+            else:
+                response.raise_for_status()
+
+                if offset > 0 and response.status_code == 206:
+                    logger.info(f"resuming download at byte {cl.val(offset)}: {cl.URL(URL)}")
+                    self._hash_existing(partial_filename, hasher)
+                    mode = "ab"
+                else:
+                    logger.info(f"downloading: {cl.URL(URL)}")
+                    mode = "wb"
+
+                with open(partial_filename, mode) as file:
+                    for chunk in response.iter_content(chunk_size=self.chunk_size):
+                        if not chunk:
+                            continue
+
+                        file.write(chunk)
+
+                        if hasher is not None:
+                            hasher.update(chunk)
+
+        actual_size = getsize(partial_filename)
+
+        if size is not None and actual_size != int(size):
+            if actual_size > int(size):
+                remove(partial_filename)
+
+            raise IOError(f"downloaded {actual_size} of {size} bytes from {URL}")
+
+        if hasher is not None and hasher.hexdigest().lower() != checksum.lower():
+            remove(partial_filename)
+            raise ChecksumMismatch(
+                f"{checksum_algorithm} checksum mismatch for {URL}: expected {checksum} got {hasher.hexdigest()}")
+
+        os.replace(partial_filename, filename)
+        logger.info(f"download complete: {cl.file(filename)}")
+
+    def _hash_existing(self, filename: str, hasher):
+        if hasher is None:
+            return
+
+        with open(filename, "rb") as file:
+            for chunk in iter(lambda: file.read(self.chunk_size), b""):
+                hasher.update(chunk)
+
@@ -0,0 +1,27 @@
+import os
+
+DEFAULT_CMR_SEARCH_URL = "https://cmr.earthdata.nasa.gov/search/"
+DEFAULT_LPDAAC_REMOTE = "https://e4ftl01.cr.usgs.gov"
+
+# environment variables that redirect searches and downloads, for example to a stand-in server
+CMR_SEARCH_URL_VARIABLE = "ECOV003_CMR_SEARCH_URL"
+LPDAAC_REMOTE_VARIABLE = "ECOV003_LPDAAC_REMOTE"
+
+
+def CMR_search_URL() -> str:
+    """
+    Base URL of the CMR search API, ending in a slash.
+    """
+    URL = os.environ.get(CMR_SEARCH_URL_VARIABLE, DEFAULT_CMR_SEARCH_URL)
+
+    if not URL.endswith("/"):
+        URL = f"{URL}/"
+
+    return URL
+
+
+def LPDAAC_remote() -> str:
+    """
+    Root URL of the LP DAAC data pool.
+    """
+    return os.environ.get(LPDAAC_REMOTE_VARIABLE, DEFAULT_LPDAAC_REMOTE).rstrip("/")
@@ -1,2 +1,6 @@
 class CMRServerUnreachable(Exception):
     pass
+
+
+class VIIRSUnavailableError(Exception):
+    pass
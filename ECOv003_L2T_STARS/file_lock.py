@@ -0,0 +1,148 @@
+import fcntl
+import json
+import logging
+import os
+import socket
+import threading
+from os import makedirs
+from os.path import abspath, dirname, expanduser
+from time import sleep, time
+from typing import Union
+
+import colored_logging as cl
+
+logger = logging.getLogger(__name__)
+
+LOCK_EXTENSION = ".lock"
+LOCK_POLL_SECONDS = 1  # interval at which a waiting process checks the lock file
+
+
+class LockTimeout(TimeoutError):
+    pass
+
+
+class FileLock:
+    """
+    Advisory lock on a file or directory shared by processes working in the same sources directory.
+
+    The lock is an `flock` held on a file created next to the target, which records the host and process holding it.
+    The operating system releases the lock when its holder exits, however it exits,
+    so a lock is never left behind by a crashed process and no waiter has to break it.
+    The lock file is opened separately by every acquisition, so threads of one process exclude each other too,
+    and it is not inherited by subprocesses.
+
+    Work done under the lock should check for its result first,
+    so that a process which waited on another reuses what that process produced.
+    """
+
+    def __init__(
+            self,
+            filename: str,
+            timeout_seconds: float = None,
+            poll_seconds: float = LOCK_POLL_SECONDS):
+        self.filename = abspath(expanduser(filename))
+        self.lock_filename = f"{self.filename}{LOCK_EXTENSION}"
+        self.timeout_seconds = timeout_seconds
+        self.poll_seconds = poll_seconds
+        self._descriptor = None
+
+    def __repr__(self):
+        return f"FileLock({self.lock_filename})"
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+    @property
+    def owner(self) -> dict:
+        """
+        Host, process and thread recorded in the lock file, or None if there is no lock file.
+        """
+        try:
+            with open(self.lock_filename, "r") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+        except (IOError, ValueError):
+            # the lock file is being written by its holder
+            return {}
+
+    def _lock(self) -> Union[int, None]:
+        while True:
+            descriptor = os.open(self.lock_filename, os.O_CREAT | os.O_RDWR)
+
+            try:
+                fcntl.flock(descriptor, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(descriptor)
+                return None
+
+            # a holder removes the lock file before releasing it, so a lock taken on a removed file is taken again
+            try:
+                if os.fstat(descriptor).st_ino == os.stat(self.lock_filename).st_ino:
+                    return descriptor
+            except FileNotFoundError:
+                pass
+
+            os.close(descriptor)
+
+    def _record_owner(self, descriptor: int):
+        os.ftruncate(descriptor, 0)
+        os.write(descriptor, json.dumps({
+            "host": socket.gethostname(),
+            "pid": os.getpid(),
+            "thread": threading.get_ident(),
+            "acquired": time()
+        }).encode())
+
+    def acquire(self) -> bool:
+        """
+        Blocks until the lock is held.
+
+        Returns:
+            bool: True if another process or thread held the lock while this one waited.
+
+        Raises:
+            LockTimeout: If the lock is not acquired within `timeout_seconds`.
+        """
+        makedirs(dirname(self.lock_filename), exist_ok=True)
+        start_time = time()
+        waited = False
+
+        while True:
+            descriptor = self._lock()
+
+            if descriptor is not None:
+                break
+
+            if not waited:
+                logger.info(f"waiting for work in flight: {cl.file(self.filename)}")
+                waited = True
+
+            if self.timeout_seconds is not None and time() - start_time > self.timeout_seconds:
+                raise LockTimeout(f"unable to lock {self.filename} within {self.timeout_seconds} seconds")
+
+            sleep(self.poll_seconds)
+
+        self._record_owner(descriptor)
+        self._descriptor = descriptor
+
+        return waited
+
+    def release(self):
+        if self._descriptor is None:
+            return
+
+        descriptor = self._descriptor
+        self._descriptor = None
+
+        # the lock file is removed while still locked, so no waiter locks a file that is about to disappear
+        try:
+            os.remove(self.lock_filename)
+        except FileNotFoundError:
+            logger.warning(f"lock file already removed: {cl.file(self.lock_filename)}")
+        finally:
+            os.close(descriptor)
@@ -1,24 +1,30 @@
 from typing import Union
 from datetime import date, datetime
 from dateutil.rrule import rrule, DAILY
-from os.path import exists
+from os.path import exists, join
 import logging
 
+import numpy as np
+
 import colored_logging as cl
 from rasters import Raster, RasterGeometry
-from harmonized_landsat_sentinel import HLS2Connection
+from harmonized_landsat_sentinel import HLS2Connection, HLSNotAvailable
 
 from ECOv003_exit_codes import AuxiliaryLatency
 
-from .constants import VIIRS_GIVEUP_DAYS
+from .constants import CALIBRATION_DIRECTORY, VIIRS_GIVEUP_DAYS
 from .generate_filename import generate_filename
 from .daterange import get_date
+from .file_lock import FileLock
+from .negative_cache import NegativeCache
+from .HLS_fine_images import HLSFineImages
 from .generate_NDVI_coarse_image import generate_NDVI_coarse_image
 from .generate_NDVI_fine_image import generate_NDVI_fine_image
 from .generate_albedo_coarse_image import generate_albedo_coarse_image
 from .generate_albedo_fine_image import generate_albedo_fine_image
 from .generate_downsampled_filename import generate_downsampled_filename
-from .calibrate_fine_to_coarse import calibrate_fine_to_coarse
+from .calibrate_fine_to_coarse import aggregate_fine_to_coarse, fit_calibrations, fit_pooled_calibration
+from .calibration_store import get_calibration_store
 from .VIIRS.VIIRSDownloader import VIIRSDownloaderAlbedo, VIIRSDownloaderNDVI
 
 logger = logging.getLogger(__name__)
@@ -40,6 +46,9 @@ def generate_STARS_inputs(
     NDVI_VIIRS_connection: VIIRSDownloaderNDVI,
     albedo_VIIRS_connection: VIIRSDownloaderAlbedo,
     calibrate_fine: bool = False,
+    negative_cache: NegativeCache = None,
+    indices_directory: str = None,
+    pooled_calibration: bool = False,
 ):
     """
     Generates and stages the necessary coarse and fine resolution input images
@@ -50,6 +59,11 @@ def generate_STARS_inputs(
     retrieves and saves fine NDVI and albedo images. It can optionally
     calibrate the fine images to the coarse images.
 
+    Calibration coefficients are recorded per tile, date and product beside the staged images,
+    with the aggregated images they were fitted on, so a date is fitted once. Dates with too few valid pixel pairs
+    are left uncalibrated, or, with `pooled_calibration`, calibrated by one fit pooled over the aggregated images
+    of every date of the window, including those fitted by earlier runs.
+
     Args:
         tile (str): The HLS tile ID.
         date_UTC (date): The target UTC date for the L2T_STARS product.
@@ -72,12 +86,59 @@ def generate_STARS_inputs(
         albedo_VIIRS_connection (VIIRSDownloaderAlbedo): An initialized VIIRS albedo downloader.
         calibrate_fine (bool, optional): If True, calibrate fine images to coarse images.
                                          Defaults to False.
+        negative_cache (NegativeCache, optional): Record of HLS dates found unavailable, which are skipped
+                                                  and to which newly unavailable dates are added.
+        indices_directory (str, optional): Directory holding the per-grid index files,
+                                           including the fine-to-coarse aggregation indices used in calibration.
+        pooled_calibration (bool, optional): If True, calibrate the fine images of dates with too few valid
+                                             pixel pairs by a fit pooled over the window. Defaults to False.
 
     Raises:
         AuxiliaryLatency: If coarse VIIRS data is missing within the VIIRS_GIVEUP_DAYS window.
     """
     missing_coarse_dates = set()  # Track dates where coarse data could not be generated
 
+    def HLS_unavailable(source: str, processing_date: date) -> bool:
+        return negative_cache is not None and negative_cache.unavailable(source, tile, processing_date)
+
+    calibration_store = get_calibration_store(join(downsampled_directory, CALIBRATION_DIRECTORY))
+    # fine images of the dates too sparse to fit alone, held until the pooled fit
+    deferred_calibrations = {"NDVI": [], "albedo": []}
+
+    def calibrate(
+            variable: str,
+            processing_date: date,
+            fine_image: Raster,
+            coarse_image: Raster,
+            fine_filename: str) -> Union[Raster, None]:
+        coefficients = calibration_store.get(tile, variable, processing_date)
+
+        if coefficients is None:
+            x = aggregate_fine_to_coarse(fine_image, coarse_image, indices_directory).ravel()
+            y = np.array(coarse_image).ravel()
+            # kept for the fits pooled over the windows covering this date
+            calibration_store.record_samples(tile, variable, processing_date, x, y)
+            slope, intercept, r_squared, pixels = (value[0] for value in fit_calibrations(x, y))
+
+            if np.isnan(slope):
+                if pooled_calibration:
+                    logger.info(
+                        f"deferring calibration of {variable} at {cl.place(tile)} on {cl.time(processing_date)} "
+                        f"with {pixels} valid pixels to the pooled fit")
+                    deferred_calibrations[variable].append((processing_date, fine_image, fine_filename))
+                    return None
+
+                logger.warning(
+                    f"Insufficient valid data points ({pixels}) for calibration of {variable} "
+                    f"on {processing_date}. Returning original fine image."
+                )
+                return fine_image
+
+            coefficients = calibration_store.record(
+                tile, variable, processing_date, slope, intercept, r_squared, pixels)
+
+        return fine_image * coefficients["slope"] + coefficients["intercept"]
+
     logger.info(f"preparing coarse and fine images for STARS at {cl.place(tile)}")
 
     # Process each day within the VIIRS data fusion window
@@ -116,45 +177,62 @@ def generate_STARS_inputs(
             cell_size=target_resolution
         )
 
+        # Fine NDVI and albedo on this date are derived from the same HLS granules, read once
+        HLS_fine_images = HLSFineImages(HLS_connection)
+
         try:
-            # Cache whether the NDVI coarse exists to avoid ToCToU
-            NDVI_coarse_exists = exists(NDVI_coarse_filename)
-            if not NDVI_coarse_exists:
-                logger.info(f"preparing coarse image for STARS NDVI at {cl.place(tile)} on {cl.time(processing_date)}")
-
-                NDVI_coarse_image = generate_NDVI_coarse_image(
-                    date_UTC=processing_date,
-                    VIIRS_connection=NDVI_VIIRS_connection,
-                    geometry=NDVI_coarse_geometry
-                )
+            with FileLock(NDVI_coarse_filename):
+                # Cache whether the NDVI coarse exists to avoid ToCToU
+                NDVI_coarse_exists = exists(NDVI_coarse_filename)
+                if not NDVI_coarse_exists:
+                    logger.info(f"preparing coarse image for STARS NDVI at {cl.place(tile)} on {cl.time(processing_date)}")
+
+                    NDVI_coarse_image = generate_NDVI_coarse_image(
+                        date_UTC=processing_date,
+                        VIIRS_connection=NDVI_VIIRS_connection,
+                        geometry=NDVI_coarse_geometry
+                    )
 
-                logger.info(
-                    f"saving coarse image for STARS NDVI at {cl.place(tile)} on {cl.time(processing_date)}: {NDVI_coarse_filename}")
-                NDVI_coarse_image.to_geotiff(NDVI_coarse_filename)
+                    logger.info(
+                        f"saving coarse image for STARS NDVI at {cl.place(tile)} on {cl.time(processing_date)}: {NDVI_coarse_filename}")
+                    NDVI_coarse_image.to_geotiff(NDVI_coarse_filename)
 
             if processing_date >= HLS_start_date:
                 try:
-                    if not exists(NDVI_fine_filename):
-                        logger.info(
-                            f"preparing fine image for STARS NDVI at {cl.place(tile)} on {cl.time(processing_date)}")
-
-                        NDVI_fine_image = generate_NDVI_fine_image(
-                            date_UTC=processing_date,
-                            tile=tile,
-                            HLS_connection=HLS_connection
-                        )
-
-                        if calibrate_fine:
-                            # Ensure that the NDVI_coarse_image variable is set
-                            if NDVI_coarse_exists:
-                                NDVI_coarse_image = Raster.open(NDVI_coarse_filename)
+                    with FileLock(NDVI_fine_filename):
+                        if not exists(NDVI_fine_filename) and not HLS_unavailable("HLS_NDVI", processing_date):
                             logger.info(
-                                f"calibrating fine image for STARS NDVI at {cl.place(tile)} on {cl.time(processing_date)}")
-                            NDVI_fine_image = calibrate_fine_to_coarse(NDVI_fine_image, NDVI_coarse_image)
+                                f"preparing fine image for STARS NDVI at {cl.place(tile)} on {cl.time(processing_date)}")
+
+                            NDVI_fine_image = generate_NDVI_fine_image(
+                                date_UTC=processing_date,
+                                tile=tile,
+                                HLS_connection=HLS_fine_images
+                            )
+
+                            if calibrate_fine:
+                                # Ensure that the NDVI_coarse_image variable is set
+                                if NDVI_coarse_exists:
+                                    NDVI_coarse_image = Raster.open(NDVI_coarse_filename)
+                                logger.info(
+                                    f"calibrating fine image for STARS NDVI at {cl.place(tile)} on {cl.time(processing_date)}")
+                                NDVI_fine_image = calibrate(
+                                    "NDVI",
+                                    processing_date,
+                                    NDVI_fine_image,
+                                    NDVI_coarse_image,
+                                    NDVI_fine_filename
+                                )
+
+                            if NDVI_fine_image is not None:
+                                logger.info(
+                                    f"saving fine image for STARS NDVI at {cl.place(tile)} on {cl.time(processing_date)}: {NDVI_fine_filename}")
+                                NDVI_fine_image.to_geotiff(NDVI_fine_filename)
+                except HLSNotAvailable as e:
+                    logger.warning(f"HLS NDVI is not available on {processing_date}: {e}")
 
-                        logger.info(
-                            f"saving fine image for STARS NDVI at {cl.place(tile)} on {cl.time(processing_date)}: {NDVI_fine_filename}")
-                        NDVI_fine_image.to_geotiff(NDVI_fine_filename)
+                    if negative_cache is not None:
+                        negative_cache.record("HLS_NDVI", tile, processing_date, e)
                 except Exception as e:
                     logger.warning(f"HLS NDVI is not available on {processing_date}: {e}")
                     logger.debug(f"Exception details: ", exc_info=True)
@@ -166,46 +244,60 @@ def generate_STARS_inputs(
             missing_coarse_dates.add(processing_date)  # Add date to missing set
 
         try:
-            # Cache whether the albedo coarse exists to avoid ToCToU
-            albedo_coarse_exists = exists(albedo_coarse_filename)
-            if not albedo_coarse_exists:
-                logger.info(
-                    f"preparing coarse image for STARS albedo at {cl.place(tile)} on {cl.time(processing_date)}")
-
-                albedo_coarse_image = generate_albedo_coarse_image(
-                    date_UTC=processing_date,
-                    VIIRS_connection=albedo_VIIRS_connection,
-                    geometry=albedo_coarse_geometry
-                )
+            with FileLock(albedo_coarse_filename):
+                # Cache whether the albedo coarse exists to avoid ToCToU
+                albedo_coarse_exists = exists(albedo_coarse_filename)
+                if not albedo_coarse_exists:
+                    logger.info(
+                        f"preparing coarse image for STARS albedo at {cl.place(tile)} on {cl.time(processing_date)}")
+
+                    albedo_coarse_image = generate_albedo_coarse_image(
+                        date_UTC=processing_date,
+                        VIIRS_connection=albedo_VIIRS_connection,
+                        geometry=albedo_coarse_geometry
+                    )
 
-                logger.info(
-                    f"saving coarse image for STARS albedo at {cl.place(tile)} on {cl.time(processing_date)}: {albedo_coarse_filename}")
-                albedo_coarse_image.to_geotiff(albedo_coarse_filename)
+                    logger.info(
+                        f"saving coarse image for STARS albedo at {cl.place(tile)} on {cl.time(processing_date)}: {albedo_coarse_filename}")
+                    albedo_coarse_image.to_geotiff(albedo_coarse_filename)
 
             if processing_date >= HLS_start_date:
                 try:
-                    if not exists(albedo_fine_filename):
-                        logger.info(
-                            f"preparing fine image for STARS albedo at {cl.place(tile)} on {cl.time(processing_date)}")
+                    with FileLock(albedo_fine_filename):
+                        if not exists(albedo_fine_filename) and not HLS_unavailable("HLS_albedo", processing_date):
+                            logger.info(
+                                f"preparing fine image for STARS albedo at {cl.place(tile)} on {cl.time(processing_date)}")
 
-                        albedo_fine_image = generate_albedo_fine_image(
-                            date_UTC=processing_date,
-                            tile=tile,
-                            HLS_connection=HLS_connection
-                        )
+                            albedo_fine_image = generate_albedo_fine_image(
+                                date_UTC=processing_date,
+                                tile=tile,
+                                HLS_connection=HLS_fine_images
+                            )
 
-                        if calibrate_fine:
-                            # Ensure that the albedo_coarse_image variable is set
-                            if albedo_coarse_exists:
-                                albedo_coarse_image = Raster.open(albedo_coarse_filename)
+                            if calibrate_fine:
+                                # Ensure that the albedo_coarse_image variable is set
+                                if albedo_coarse_exists:
+                                    albedo_coarse_image = Raster.open(albedo_coarse_filename)
 
-                            logger.info(
-                                f"calibrating fine image for STARS albedo at {cl.place(tile)} on {cl.time(processing_date)}")
-                            albedo_fine_image = calibrate_fine_to_coarse(albedo_fine_image, albedo_coarse_image)
+                                logger.info(
+                                    f"calibrating fine image for STARS albedo at {cl.place(tile)} on {cl.time(processing_date)}")
+                                albedo_fine_image = calibrate(
+                                    "albedo",
+                                    processing_date,
+                                    albedo_fine_image,
+                                    albedo_coarse_image,
+                                    albedo_fine_filename
+                                )
 
-                        logger.info(
-                            f"saving fine image for STARS albedo at {cl.place(tile)} on {cl.time(processing_date)}: {albedo_fine_filename}")
-                        albedo_fine_image.to_geotiff(albedo_fine_filename)
+                            if albedo_fine_image is not None:
+                                logger.info(
+                                    f"saving fine image for STARS albedo at {cl.place(tile)} on {cl.time(processing_date)}: {albedo_fine_filename}")
+                                albedo_fine_image.to_geotiff(albedo_fine_filename)
+                except HLSNotAvailable as e:
+                    logger.warning(f"HLS albedo is not available on {processing_date}: {e}")
+
+                    if negative_cache is not None:
+                        negative_cache.record("HLS_albedo", tile, processing_date, e)
                 except Exception as e:
                     logger.warning(f"HLS albedo is not available on {processing_date}: {e}")
                     logger.debug(f"Exception details: ", exc_info=True)
@@ -216,6 +308,49 @@ def generate_STARS_inputs(
             )
             missing_coarse_dates.add(processing_date)  # Add date to missing set
 
+    for variable, deferred in deferred_calibrations.items():
+        if len(deferred) == 0:
+            continue
+
+        # one fit over the aggregated images of every date of the window fitted by this or an earlier run
+        window_samples = [
+            samples for samples in (
+                calibration_store.samples(tile, variable, get_date(dt))
+                for dt in rrule(DAILY, dtstart=HLS_start_date, until=VIIRS_end_date)
+            )
+            if samples is not None
+        ]
+
+        if len(window_samples) == 0:
+            logger.warning(
+                f"No stored samples for pooled calibration of {variable} "
+                f"at {cl.place(tile)}. Saving original fine images."
+            )
+            slope = np.nan
+        else:
+            slope, intercept, r_squared, pixels = fit_pooled_calibration(
+                np.concatenate([x.ravel() for x, y in window_samples]),
+                np.concatenate([y.ravel() for x, y in window_samples])
+            )
+
+            if np.isnan(slope):
+                logger.warning(
+                    f"Insufficient valid data points ({pixels}) for pooled calibration of {variable} "
+                    f"at {cl.place(tile)}. Saving original fine images."
+                )
+
+        for processing_date, fine_image, fine_filename in deferred:
+            if not np.isnan(slope):
+                calibration_store.record(
+                    tile, variable, processing_date, slope, intercept, r_squared, pixels, pooled=True)
+                fine_image = fine_image * slope + intercept
+
+            with FileLock(fine_filename):
+                if not exists(fine_filename):
+                    logger.info(
+                        f"saving fine image for STARS {variable} at {cl.place(tile)} on {cl.time(processing_date)}: {fine_filename}")
+                    fine_image.to_geotiff(fine_filename)
+
     # We need to deal with the possibility that VIIRS has not yet published their data yet.
     #  VIIRS_GIVEUP_DAYS is the number of days before we assume that missing observations aren't coming.
     #  If any missing days are closer to now than VIIRS_GIVEUP_DAYS, we want to retry this run later, when VIIRS
@@ -8,17 +8,20 @@ from rasters import Raster
 
 from harmonized_landsat_sentinel import HLS2Connection
 
+from .HLS_fine_images import HLSFineImages
+
 def generate_albedo_fine_image(
         date_UTC: Union[date, str], 
         tile: str, 
-        HLS_connection: HLS2Connection) -> Raster:
+        HLS_connection: Union[HLS2Connection, HLSFineImages]) -> Raster:
     """
     Generates a fine-resolution albedo image from HLS data.
 
     Args:
         date_UTC (Union[date, str]): The UTC date for which to retrieve albedo data.
         tile (str): The HLS tile ID.
-        HLS_connection (HLS): An initialized HLS data connection object.
+        HLS_connection (HLS): An initialized HLS data connection object, or the HLSFineImages
+                              sharing granule reads with the other fine image of the date.
 
     Returns:
         Raster: A Raster object representing the fine-resolution albedo image.
@@ -0,0 +1,320 @@
+import hashlib
+import logging
+import os
+from os import makedirs
+from os.path import abspath, expanduser, join, exists
+from typing import Tuple, Union
+
+import numpy as np
+from scipy import sparse
+
+import colored_logging as cl
+from rasters import RasterGeometry, RasterGrid
+
+from .atomic_file import temporary_filename
+from .constants import GRID_INDICES_CACHE_SIZE
+from .process_cache import ProcessCache
+
+logger = logging.getLogger(__name__)
+
+# memory-mapped lat/lon arrays and row-latitude vectors already resolved in this process
+_GRID_INDICES = ProcessCache(GRID_INDICES_CACHE_SIZE)
+
+# fine-to-coarse aggregation operators already resolved in this process
+_AGGREGATION_OPERATORS = ProcessCache(GRID_INDICES_CACHE_SIZE)
+
+
+def grid_key(geometry: RasterGrid) -> str:
+    """
+    Generates a stable identifier for a raster grid from its projection, affine transform and shape.
+
+    Args:
+        geometry (RasterGrid): The raster grid to identify.
+
+    Returns:
+        str: A hexadecimal digest uniquely identifying the grid.
+    """
+    affine = geometry.affine
+    grid_string = "|".join([
+        str(geometry.proj4),
+        ",".join(f"{coefficient:.6f}" for coefficient in (affine.a, affine.b, affine.c, affine.d, affine.e, affine.f)),
+        f"{geometry.rows}x{geometry.cols}"
+    ])
+
+    return hashlib.sha256(grid_string.encode()).hexdigest()[:16]
+
+
+def _save_array(array: np.ndarray, filename: str):
+    # write to a temporary file first so that concurrent readers never see a partial array
+    temporary_array_filename = temporary_filename(filename)
+
+    with open(temporary_array_filename, "wb") as file:
+        np.save(file, array)
+
+    os.replace(temporary_array_filename, filename)
+
+
+def _build_grid_indices(geometry: RasterGrid, key: str, indices_directory: str = None) -> dict:
+    if indices_directory is None:
+        lat, lon = geometry.latlon_matrices
+    else:
+        grid_directory = join(abspath(expanduser(indices_directory)), key)
+        lat_filename = join(grid_directory, "lat.npy")
+        lon_filename = join(grid_directory, "lon.npy")
+
+        if not (exists(lat_filename) and exists(lon_filename)):
+            logger.info(f"generating lat/lon indices for grid {cl.val(key)}: {cl.dir(grid_directory)}")
+            makedirs(grid_directory, exist_ok=True)
+            lat, lon = geometry.latlon_matrices
+            _save_array(lat, lat_filename)
+            _save_array(lon, lon_filename)
+
+        lat = np.load(lat_filename, mmap_mode="r")
+        lon = np.load(lon_filename, mmap_mode="r")
+
+    # latitude of a sinusoidal or geographic grid depends only on the row
+    if np.all(np.isfinite(lat)) and np.all(lat == lat[:, :1]):
+        row_lat = np.array(lat[:, 0])
+    else:
+        row_lat = None
+
+    # arrays computed in memory are only kept as the row vector to bound memory use
+    if indices_directory is None:
+        return {
+            "lat": None if row_lat is not None else lat,
+            "lon": None,
+            "row_lat": row_lat
+        }
+
+    return {
+        "lat": lat,
+        "lon": lon,
+        "row_lat": row_lat
+    }
+
+
+def _load_grid_indices(geometry: RasterGrid, indices_directory: str = None) -> dict:
+    key = grid_key(geometry)
+
+    # grids are projected outside the cache lock, so one projection does not hold up lookups of other grids
+    return _GRID_INDICES.get(
+        (key, indices_directory),
+        lambda: _build_grid_indices(geometry, key, indices_directory)
+    )
+
+
+def grid_latlon(geometry: RasterGeometry, indices_directory: str = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Retrieves the latitude and longitude arrays of a raster grid, memory-mapped from the indices directory.
+
+    The arrays are projected once per grid and stored as `.npy` files under `indices_directory`,
+    so every later call for the same grid opens them without re-projecting.
+
+    Args:
+        geometry (RasterGeometry): The raster geometry to retrieve coordinates for.
+        indices_directory (str, optional): Directory holding the per-grid index files.
+            If None, the coordinates are computed in memory.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Latitude and longitude arrays in degrees.
+    """
+    if indices_directory is None or not isinstance(geometry, RasterGrid):
+        return geometry.latlon_matrices
+
+    indices = _load_grid_indices(geometry, indices_directory)
+
+    return indices["lat"], indices["lon"]
+
+
+def grid_row_latitude(geometry: RasterGeometry, indices_directory: str = None) -> Union[np.ndarray, None]:
+    """
+    Retrieves the latitude of each row of a raster grid whose latitude is constant along rows.
+
+    Args:
+        geometry (RasterGeometry): The raster geometry to retrieve row latitudes for.
+        indices_directory (str, optional): Directory holding the per-grid index files.
+
+    Returns:
+        Union[np.ndarray, None]: One latitude per row in degrees, or None if latitude varies within rows.
+    """
+    if not isinstance(geometry, RasterGrid):
+        return None
+
+    return _load_grid_indices(geometry, indices_directory)["row_lat"]
+
+
+def grid_latitude(geometry: RasterGeometry, indices_directory: str = None) -> np.ndarray:
+    """
+    Retrieves the full latitude array of a raster grid, reusing cached indices where available.
+
+    Args:
+        geometry (RasterGeometry): The raster geometry to retrieve latitude for.
+        indices_directory (str, optional): Directory holding the per-grid index files.
+
+    Returns:
+        np.ndarray: Latitude array in degrees.
+    """
+    if not isinstance(geometry, RasterGrid):
+        return geometry.lat
+
+    indices = _load_grid_indices(geometry, indices_directory)
+
+    if indices["lat"] is not None:
+        return indices["lat"]
+
+    return np.broadcast_to(indices["row_lat"][:, np.newaxis], geometry.shape)
+
+
+class AggregationOperator:
+    """
+    Sparse operator relating a fine grid to a coarse grid nested in the same projection.
+
+    Each fine pixel is assigned to the coarse cell containing its center.
+    Aggregation averages the valid fine pixels of each coarse cell, as an average resampling does.
+    Only calibration aggregates through it: the fusion script still maps coarse observation counts
+    onto the fine grid for its flags with its own nearest-neighbour resampling.
+    """
+
+    def __init__(self, coarse_index: np.ndarray, fine_shape: Tuple[int, int], coarse_shape: Tuple[int, int]):
+        self.coarse_index = coarse_index  # flat coarse cell of each fine pixel, -1 outside the coarse grid
+        self.fine_shape = tuple(fine_shape)
+        self.coarse_shape = tuple(coarse_shape)
+
+        inside = np.flatnonzero(coarse_index >= 0)
+        self.matrix = sparse.csr_matrix(
+            (np.ones(len(inside)), (coarse_index[inside], inside)),
+            shape=(int(np.prod(self.coarse_shape)), int(np.prod(self.fine_shape)))
+        )
+
+    def __repr__(self):
+        return f"AggregationOperator({self.fine_shape} -> {self.coarse_shape})"
+
+    def aggregate(self, fine: np.ndarray) -> np.ndarray:
+        """
+        Averages the finite values of a fine array within each coarse cell, leaving cells without any as NaN.
+        """
+        fine = np.asarray(fine, dtype=np.float64).ravel()
+        valid = np.isfinite(fine)
+        sums = self.matrix @ np.where(valid, fine, 0)
+        counts = self.matrix @ valid.astype(np.float64)
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(counts > 0, sums / counts, np.nan)
+
+        return mean.reshape(self.coarse_shape)
+
+
+def check_nested(fine_geometry: RasterGrid, coarse_geometry: RasterGrid, tolerance: float = 1e-3):
+    """
+    Checks that every coarse cell covers a whole block of fine pixels,
+    so that assigning fine pixels by their centers matches an average resampling.
+
+    Args:
+        fine_geometry (RasterGrid): The fine raster grid.
+        coarse_geometry (RasterGrid): The coarse raster grid.
+        tolerance (float, optional): Allowed deviation from whole fine pixels, in fine pixels.
+
+    Raises:
+        ValueError: If the grids are not in the same projection, are rotated,
+            have a non-integral resolution ratio or have misaligned origins.
+    """
+    if fine_geometry.proj4 != coarse_geometry.proj4:
+        raise ValueError("fine and coarse grids are not in the same projection")
+
+    fine_affine = fine_geometry.affine
+    coarse_affine = coarse_geometry.affine
+
+    if fine_affine.b != 0 or fine_affine.d != 0 or coarse_affine.b != 0 or coarse_affine.d != 0:
+        raise ValueError("fine and coarse grids are rotated")
+
+    ratios = np.array([coarse_affine.a / fine_affine.a, coarse_affine.e / fine_affine.e])
+
+    if np.any(ratios < 1) or not np.allclose(ratios, np.round(ratios), rtol=0, atol=tolerance):
+        raise ValueError(f"coarse grid resolution is not an integral multiple of fine grid resolution: {ratios}")
+
+    offsets = np.array([
+        (coarse_affine.c - fine_affine.c) / fine_affine.a,
+        (coarse_affine.f - fine_affine.f) / fine_affine.e
+    ])
+
+    if not np.allclose(offsets, np.round(offsets), rtol=0, atol=tolerance):
+        raise ValueError(f"coarse grid origin is not aligned with fine grid pixels: {offsets}")
+
+
+def aggregation_index(fine_geometry: RasterGrid, coarse_geometry: RasterGrid) -> np.ndarray:
+    """
+    Computes the flat coarse cell containing the center of each fine pixel, or -1 outside the coarse grid.
+
+    Raises:
+        ValueError: If the fine grid is not nested in the coarse grid.
+    """
+    check_nested(fine_geometry, coarse_geometry)
+
+    rows, cols = np.indices((fine_geometry.rows, fine_geometry.cols), dtype=np.float64)
+    x, y = fine_geometry.affine * (cols + 0.5, rows + 0.5)
+    coarse_cols, coarse_rows = ~coarse_geometry.affine * (x, y)
+    coarse_rows = np.floor(coarse_rows).astype(np.int64)
+    coarse_cols = np.floor(coarse_cols).astype(np.int64)
+    inside = (
+        (coarse_rows >= 0) & (coarse_rows < coarse_geometry.rows) &
+        (coarse_cols >= 0) & (coarse_cols < coarse_geometry.cols)
+    )
+
+    return np.where(inside, coarse_rows * coarse_geometry.cols + coarse_cols, -1).astype(np.int32).ravel()
+
+
+def get_aggregation_operator(
+        fine_geometry: RasterGeometry,
+        coarse_geometry: RasterGeometry,
+        indices_directory: str = None) -> AggregationOperator:
+    """
+    Retrieves the aggregation operator between a fine and a coarse grid, built once per pair of grids.
+
+    The coarse cell of each fine pixel is stored as a `.npy` file under the fine grid's directory in `indices_directory`,
+    so later runs over the same tile and resolutions load it instead of comparing the grids again.
+
+    Args:
+        fine_geometry (RasterGeometry): The fine raster grid.
+        coarse_geometry (RasterGeometry): The coarse raster grid.
+        indices_directory (str, optional): Directory holding the per-grid index files.
+            If None, the operator is only kept in memory.
+
+    Returns:
+        AggregationOperator: The operator relating the two grids.
+
+    Raises:
+        ValueError: If either geometry is not a raster grid or the fine grid is not nested in the coarse grid.
+    """
+    if not isinstance(fine_geometry, RasterGrid) or not isinstance(coarse_geometry, RasterGrid):
+        raise ValueError("aggregation operators require raster grids")
+
+    # checked before the cache, so an index stored by an earlier release is never used for grids that are not nested
+    check_nested(fine_geometry, coarse_geometry)
+
+    fine_key = grid_key(fine_geometry)
+    coarse_key = grid_key(coarse_geometry)
+
+    def build() -> AggregationOperator:
+        if indices_directory is None:
+            coarse_index = aggregation_index(fine_geometry, coarse_geometry)
+        else:
+            grid_directory = join(abspath(expanduser(indices_directory)), fine_key)
+            index_filename = join(grid_directory, f"aggregation_{coarse_key}.npy")
+
+            if not exists(index_filename):
+                logger.info(
+                    f"generating aggregation index from grid {cl.val(fine_key)} to grid {cl.val(coarse_key)}: "
+                    f"{cl.file(index_filename)}"
+                )
+                makedirs(grid_directory, exist_ok=True)
+                _save_array(aggregation_index(fine_geometry, coarse_geometry), index_filename)
+
+            coarse_index = np.load(index_filename)
+
+        return AggregationOperator(
+            coarse_index=coarse_index,
+            fine_shape=(fine_geometry.rows, fine_geometry.cols),
+            coarse_shape=(coarse_geometry.rows, coarse_geometry.cols)
+        )
+
+    return _AGGREGATION_OPERATORS.get((fine_key, coarse_key, indices_directory), build)
@@ -8,6 +8,7 @@ from ECOv003_granules import L2TSTARS
 from .prior import Prior
 from .generate_filename import generate_filename
 from .generate_model_state_tile_date_directory import generate_model_state_tile_date_directory
+from .model_state_store import get_model_state_store
 
 logger = logging.getLogger(__name__)
 
@@ -23,6 +24,9 @@ def load_prior(
     to use its NDVI and albedo mean, uncertainty, and bias as prior information
     for the current data fusion run.
 
+    If the model state store of the tile holds the posterior the prior product was made from,
+    the prior files are linked from it, and the product zip is only unpacked otherwise.
+
     Args:
         tile (str): The HLS tile ID.
         target_resolution (int): The target resolution of the L2T_STARS product.
@@ -46,8 +50,33 @@ def load_prior(
     prior_albedo_bias_filename = None
     prior_albedo_bias_UQ_filename = None
 
-    # Check if a prior L2T_STARS product is specified and exists
-    if L2T_STARS_prior_filename is not None and exists(L2T_STARS_prior_filename):
+    model_state = None
+
+    if L2T_STARS_prior_filename is not None:
+        model_state = get_model_state_store(model_directory).load(
+            tile=tile,
+            L2T_STARS_filename=L2T_STARS_prior_filename,
+            cell_size=target_resolution
+        )
+
+    if model_state is not None:
+        # The posterior of the prior product is still in the model state store
+        prior_date_UTC = model_state["date_UTC"]
+        logger.info(f"Loading prior from model state on {cl.time(prior_date_UTC)} of {L2T_STARS_prior_filename}")
+        filenames = model_state["filenames"]
+        prior_NDVI_filename = filenames["NDVI"]
+        prior_NDVI_UQ_filename = filenames["NDVI.UQ"]
+        prior_NDVI_flag_filename = filenames["NDVI.flag"]
+        prior_NDVI_bias_filename = filenames["NDVI.bias"]
+        prior_NDVI_bias_UQ_filename = filenames["NDVI.bias.UQ"]
+        prior_albedo_filename = filenames["albedo"]
+        prior_albedo_UQ_filename = filenames["albedo.UQ"]
+        prior_albedo_flag_filename = filenames["albedo.flag"]
+        prior_albedo_bias_filename = filenames["albedo.bias"]
+        prior_albedo_bias_UQ_filename = filenames["albedo.bias.UQ"]
+        using_prior = True
+    # Otherwise check if a prior L2T_STARS product is specified and exists
+    elif L2T_STARS_prior_filename is not None and exists(L2T_STARS_prior_filename):
         logger.info(f"Loading prior L2T STARS product: {L2T_STARS_prior_filename}")
         try:
             # Initialize L2TSTARS object from the prior product
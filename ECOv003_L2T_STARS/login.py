@@ -10,6 +10,14 @@ __author__ = "Evan Davis"
 
 _AUTH = None
 
+
+def skip_earthdata_login() -> bool:
+    """
+    Checks whether Earthdata authentication is disabled for testing or for a stand-in server.
+    """
+    return os.environ.get("SKIP_EARTHDATA_LOGIN", "").lower() in ("true", "1", "yes")
+
+
 def login() -> earthaccess.Auth:
     """
     Login to Earthdata using environment variables if available, falling back to netrc credentials, then interactive login.
@@ -20,7 +28,7 @@ def login() -> earthaccess.Auth:
         return _AUTH
 
     # Check if we're in a testing environment where authentication should be skipped
-    if os.environ.get("SKIP_EARTHDATA_LOGIN", "").lower() in ("true", "1", "yes"):
+    if skip_earthdata_login():
         # Return a mock auth object for testing
         class MockAuth:
             def __init__(self):
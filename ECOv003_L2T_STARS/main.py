@@ -89,6 +89,12 @@ def main():
         default=CALIBRATE_FINE,
         help=f"Calibrate fine resolution HLS data to coarse resolution VIIRS data. Defaults to {'True' if CALIBRATE_FINE else 'False'}.",
     )
+    parser.add_argument(
+        "--pooled-calibration",
+        action="store_true",
+        default=POOLED_CALIBRATION,
+        help=f"Calibrate dates with too few valid pixels by a fit pooled over the window. Defaults to {'True' if POOLED_CALIBRATION else 'False'}.",
+    )
     parser.add_argument(
         "--sources-only",
         action="store_true",
@@ -140,6 +146,18 @@ def main():
         action="store_true",
         help="Reproduce the output files even if they already exist.",
     )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Serve VIIRS granule searches only from the local CMR cache, skip Earthdata login and HLS searches, and require every fine image to be staged.",
+    )
+    parser.add_argument(
+        "--hls-giveup-days",
+        type=int,
+        default=HLS_GIVEUP_DAYS,
+        help=f"Days after acquisition when missing HLS data is recorded as permanently unavailable. Defaults to {HLS_GIVEUP_DAYS} days.",
+        metavar="DAYS"
+    )
     parser.add_argument(
         "--version",
         action="version",
@@ -159,6 +177,7 @@ def main():
         albedo_resolution=args.albedo_resolution,
         use_VNP43NRT=args.use_vnp43nrt,
         calibrate_fine=args.calibrate_fine,
+        pooled_calibration=args.pooled_calibration,
         sources_only=args.sources_only,
         remove_input_staging=args.remove_input_staging,
         remove_prior=args.remove_prior,
@@ -167,6 +186,8 @@ def main():
         threads=args.threads,
         num_workers=args.num_workers,
         overwrite=args.overwrite, # Pass the new overwrite argument
+        offline=args.offline,
+        HLS_giveup_days=args.hls_giveup_days,
     )
 
     sys.exit(exit_code)
@@ -0,0 +1,66 @@
+from datetime import date
+from os.path import exists
+from typing import List
+import logging
+
+import colored_logging as cl
+
+from .daterange import date_range
+from .generate_downsampled_filename import generate_downsampled_filename
+from .negative_cache import NegativeCache
+
+logger = logging.getLogger(__name__)
+
+
+def missing_fine_dates(
+    tile: str,
+    HLS_start_date: date,
+    HLS_end_date: date,
+    target_resolution: int,
+    downsampled_directory: str,
+    negative_cache: NegativeCache = None,
+) -> List[date]:
+    """
+    Finds the dates of a run whose fine NDVI or albedo images still have to be produced from HLS.
+
+    A fine image is produced by `generate_STARS_inputs` unless it is already staged
+    or HLS was recorded as unavailable for its product, tile and date.
+
+    Args:
+        tile (str): The HLS tile ID.
+        HLS_start_date (date): The first fine HLS date of the run.
+        HLS_end_date (date): The last fine HLS date of the run.
+        target_resolution (int): The resolution of the fine images.
+        downsampled_directory (str): Directory of staged coarse and fine images.
+        negative_cache (NegativeCache, optional): The record of unavailable sources.
+
+    Returns:
+        List[date]: The dates with a fine image still to be produced.
+    """
+    missing_dates = []
+
+    for processing_date in date_range(HLS_start_date, HLS_end_date):
+        for variable in ("NDVI", "albedo"):
+            fine_filename = generate_downsampled_filename(
+                directory=downsampled_directory,
+                variable=variable,
+                date_UTC=processing_date,
+                tile=tile,
+                cell_size=target_resolution
+            )
+
+            if exists(fine_filename):
+                continue
+
+            if negative_cache is not None and negative_cache.unavailable(f"HLS_{variable}", tile, processing_date):
+                continue
+
+            missing_dates.append(processing_date)
+            break
+
+    logger.info(
+        f"fine images of tile {cl.place(tile)} are still to be produced on {cl.val(len(missing_dates))} dates "
+        f"from {cl.time(HLS_start_date)} to {cl.time(HLS_end_date)}"
+    )
+
+    return missing_dates
@@ -0,0 +1,195 @@
+import logging
+import os
+import shutil
+import threading
+from datetime import date
+from os import makedirs, remove
+from os.path import abspath, basename, exists, expanduser, isdir, join, relpath, samefile
+from typing import Dict, Union
+
+import colored_logging as cl
+
+from .atomic_file import read_JSON, temporary_filename, write_JSON
+from .constants import MODEL_STATE_DIRECTORY
+from .daterange import get_date
+from .file_lock import FileLock
+from .generate_filename import generate_filename
+from .generate_model_state_tile_date_directory import generate_model_state_tile_date_directory
+from .process_cache import ProcessCache
+from .write_STARS_product import STARS_LAYERS
+
+logger = logging.getLogger(__name__)
+
+# posterior variables making up the model state of a tile
+MODEL_STATE_VARIABLES = [variable for layer, variable, cmap, posterior_cmap in STARS_LAYERS]
+
+# process-wide model state stores keyed by model directory
+_MODEL_STATE_STORES = ProcessCache()
+
+
+def _link(source: str, destination: str):
+    # hard links share the posterior's disk space, copies are only made where links are not supported
+    temporary_link_filename = temporary_filename(destination)
+
+    try:
+        os.link(source, temporary_link_filename)
+    except OSError:
+        shutil.copyfile(source, temporary_link_filename)
+
+    os.replace(temporary_link_filename, destination)
+
+
+class ModelStateStore:
+    """
+    Keeps the latest posterior of each tile as the GeoTIFFs written by the Julia fusion,
+    so that the next run reads its prior from them instead of decoding the previous product zip
+    and re-encoding its layers into the model directory.
+
+    The state of a tile on a date is kept in `{model_directory}/{tile}/latest/{date}` as hard links to the posterior,
+    with a manifest in `{model_directory}/{tile}/latest` recording its date, its cell size and the product made from it,
+    which is matched against the prior product named in the run-config.
+    Readers link the state into the tile's date directory of the model directory while holding the tile's lock,
+    so saving a new state of a tile, which removes the states it replaces, never removes files a run is reading.
+    """
+
+    def __init__(self, model_directory: str):
+        self.model_directory = abspath(expanduser(model_directory))
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"ModelStateStore({self.model_directory})"
+
+    def directory(self, tile: str) -> str:
+        return join(self.model_directory, tile, MODEL_STATE_DIRECTORY)
+
+    def state_directory(self, tile: str, date_UTC: Union[date, str]) -> str:
+        return join(self.directory(tile), get_date(date_UTC).isoformat())
+
+    def manifest_filename(self, tile: str) -> str:
+        return join(self.directory(tile), "state.json")
+
+    def _read(self, tile: str) -> Union[dict, None]:
+        return read_JSON(self.manifest_filename(tile), "model state")
+
+    def load(self, tile: str, L2T_STARS_filename: str, cell_size: int) -> Union[dict, None]:
+        """
+        Retrieves the model state of a tile if it is the posterior of the given product at the given cell size,
+        linking its files into the tile's date directory of the model directory, where the prior is read from.
+
+        Returns:
+            Union[dict, None]: The date of the state and the filename of each posterior variable,
+                               or None if the tile has no such complete state.
+        """
+        with self._lock:
+            with FileLock(self.manifest_filename(tile)):
+                manifest = self._read(tile)
+
+                if manifest is None:
+                    return None
+
+                if manifest.get("L2T_STARS_filename") != basename(L2T_STARS_filename) or manifest.get("cell_size") != cell_size:
+                    logger.info(f"model state of tile {cl.place(tile)} is not the posterior of {basename(L2T_STARS_filename)}")
+                    return None
+
+                state_filenames = {
+                    variable: join(self.directory(tile), filename)
+                    for variable, filename in manifest.get("filenames", {}).items()
+                }
+
+                if sorted(state_filenames) != sorted(MODEL_STATE_VARIABLES) or not all(exists(f) for f in state_filenames.values()):
+                    logger.warning(f"ignoring incomplete model state of tile {tile}")
+                    return None
+
+                date_UTC = get_date(manifest["date_UTC"])
+                directory = generate_model_state_tile_date_directory(self.model_directory, tile, date_UTC)
+                filenames = {}
+
+                for variable, state_filename in state_filenames.items():
+                    filename = generate_filename(
+                        directory=directory,
+                        variable=variable,
+                        date_UTC=date_UTC,
+                        tile=tile,
+                        cell_size=cell_size,
+                    )
+
+                    # the posterior of the state is still there when it was kept by the run that made it
+                    if not (exists(filename) and samefile(filename, state_filename)):
+                        _link(state_filename, filename)
+
+                    filenames[variable] = filename
+
+        return {"date_UTC": date_UTC, "filenames": filenames}
+
+    def save(
+            self,
+            tile: str,
+            date_UTC: Union[date, str],
+            cell_size: int,
+            L2T_STARS_filename: str,
+            posterior_filenames: Dict[str, str],
+            move: bool = False):
+        """
+        Keeps the posterior of a tile as its model state, replacing its previous state.
+
+        Args:
+            tile (str): The HLS tile ID.
+            date_UTC (Union[date, str]): The date of the posterior.
+            cell_size (int): The cell size of the posterior.
+            L2T_STARS_filename (str): The product zip made from the posterior.
+            posterior_filenames (Dict[str, str]): The posterior file of each variable in `MODEL_STATE_VARIABLES`.
+            move (bool, optional): If True, move the posterior files into the store instead of linking them,
+                                   for a posterior that would otherwise be removed.
+        """
+        date_UTC = get_date(date_UTC)
+        state_directory = self.state_directory(tile, date_UTC)
+        manifest_filename = self.manifest_filename(tile)
+        logger.info(f"saving model state of tile {cl.place(tile)} on {cl.time(date_UTC)}: {cl.dir(state_directory)}")
+
+        with self._lock:
+            with FileLock(manifest_filename):
+                makedirs(state_directory, exist_ok=True)
+                filenames = {}
+
+                for variable in MODEL_STATE_VARIABLES:
+                    filename = generate_filename(
+                        directory=state_directory,
+                        variable=variable,
+                        date_UTC=date_UTC,
+                        tile=tile,
+                        cell_size=cell_size,
+                    )
+
+                    if move:
+                        os.replace(posterior_filenames[variable], filename)
+                    else:
+                        _link(posterior_filenames[variable], filename)
+
+                    filenames[variable] = relpath(filename, self.directory(tile))
+
+                manifest = {
+                    "date_UTC": date_UTC.isoformat(),
+                    "cell_size": int(cell_size),
+                    "L2T_STARS_filename": basename(L2T_STARS_filename),
+                    "filenames": filenames
+                }
+
+                write_JSON(manifest_filename, manifest, indent=1)
+
+                # readers link the state out under the lock, so the replaced states are no longer read
+                for filename in os.listdir(self.directory(tile)):
+                    if filename == basename(state_directory):
+                        continue
+
+                    if isdir(join(self.directory(tile), filename)):
+                        shutil.rmtree(join(self.directory(tile), filename))
+                    elif filename.endswith(".tif"):
+                        remove(join(self.directory(tile), filename))
+
+
+def get_model_state_store(model_directory: str) -> ModelStateStore:
+    """
+    Retrieves the process-wide model state store for a model directory.
+    """
+    model_directory = abspath(expanduser(model_directory))
+    return _MODEL_STATE_STORES.get(model_directory, lambda: ModelStateStore(model_directory))
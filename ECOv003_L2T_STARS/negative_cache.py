@@ -0,0 +1,141 @@
+import logging
+import threading
+from datetime import date, datetime, timedelta
+from os.path import abspath, expanduser, join
+from typing import Dict, Tuple
+
+import colored_logging as cl
+
+from .atomic_file import read_JSON, update_JSON
+from .constants import HLS_GIVEUP_DAYS, UNAVAILABLE_RECENT_TTL_HOURS, VIIRS_GIVEUP_DAYS
+from .daterange import get_date
+from .process_cache import ProcessCache
+
+logger = logging.getLogger(__name__)
+
+# process-wide negative caches keyed by directory
+_NEGATIVE_CACHES = ProcessCache()
+
+
+class NegativeCache:
+    """
+    Persistent record of the (source, tile, date) combinations found to be unavailable,
+    so that sliding-window runs do not repeat lookups that failed the day before.
+
+    Sources are named after their family, such as "HLS_NDVI" or "VIIRS_VNP09GA".
+    A record made after the family's give-up window has passed for its date is permanent.
+    A record made within the window expires after `recent_TTL`, because the data may still be published.
+    The HLS window is the latency horizon of the run, and the VIIRS window is VIIRS_GIVEUP_DAYS.
+    Records are stored as one JSON file per source and tile.
+    """
+
+    def __init__(
+            self,
+            directory: str,
+            HLS_giveup_days: int = HLS_GIVEUP_DAYS,
+            VIIRS_giveup_days: int = VIIRS_GIVEUP_DAYS,
+            recent_TTL: timedelta = timedelta(hours=UNAVAILABLE_RECENT_TTL_HOURS)):
+        self.directory = abspath(expanduser(directory))
+        # days after acquisition when a source's absence becomes final, by source family
+        self.giveup_days = {
+            "HLS": HLS_giveup_days,
+            "VIIRS": VIIRS_giveup_days,
+        }
+        self.recent_TTL = recent_TTL
+        # records by (source, tile), then by ISO date
+        self._records: Dict[Tuple[str, str], Dict[str, dict]] = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"NegativeCache({self.directory})"
+
+    def filename(self, source: str, tile: str) -> str:
+        return join(self.directory, source, f"{tile}.json")
+
+    def source_giveup_days(self, source: str) -> int:
+        family = source.split("_")[0]
+
+        if family not in self.giveup_days:
+            raise ValueError(f"no give-up window for source: {source}")
+
+        return self.giveup_days[family]
+
+    def _read(self, source: str, tile: str) -> Dict[str, dict]:
+        records = read_JSON(self.filename(source, tile), "unavailability records")
+        return {} if records is None else records
+
+    def _records_for(self, source: str, tile: str) -> Dict[str, dict]:
+        key = (source, tile)
+
+        if key not in self._records:
+            self._records[key] = self._read(source, tile)
+
+        return self._records[key]
+
+    def _write(self, source: str, tile: str, update):
+        records = update_JSON(self.filename(source, tile), update, "unavailability records", indent=1)
+        self._records[(source, tile)] = records
+
+    def permanent(self, source: str, date_UTC: date, recorded: datetime) -> bool:
+        return recorded.date() > get_date(date_UTC) + timedelta(days=self.source_giveup_days(source))
+
+    def unavailable(self, source: str, tile: str, date_UTC: date, now: datetime = None) -> bool:
+        """
+        Checks whether a source was recently, or permanently, found unavailable at a tile on a date.
+        """
+        if now is None:
+            now = datetime.utcnow()
+
+        date_UTC = get_date(date_UTC)
+
+        with self._lock:
+            record = self._records_for(source, tile).get(date_UTC.isoformat())
+
+        if record is None:
+            return False
+
+        recorded = datetime.fromisoformat(record["recorded"])
+
+        if self.permanent(source, date_UTC, recorded) or now - recorded < self.recent_TTL:
+            logger.info(
+                f"{cl.name(source)} is known to be unavailable at {cl.place(tile)} on {cl.time(date_UTC)}: "
+                f"{record.get('reason', '')}"
+            )
+            return True
+
+        return False
+
+    def record(self, source: str, tile: str, date_UTC: date, reason: str = ""):
+        """
+        Records that a source is unavailable at a tile on a date.
+        """
+        self.source_giveup_days(source)
+        date_UTC = get_date(date_UTC)
+        entry = {"recorded": datetime.utcnow().isoformat(), "reason": str(reason)}
+
+        with self._lock:
+            self._write(source, tile, lambda records: records.update({date_UTC.isoformat(): entry}))
+
+    def discard(self, source: str, tile: str, date_UTC: date):
+        """
+        Removes the record for a source that has become available.
+        """
+        key = get_date(date_UTC).isoformat()
+
+        with self._lock:
+            if key not in self._records_for(source, tile):
+                return
+
+            self._write(source, tile, lambda records: records.pop(key, None))
+
+
+def get_negative_cache(directory: str, HLS_giveup_days: int = HLS_GIVEUP_DAYS) -> NegativeCache:
+    """
+    Retrieves the process-wide negative cache for a directory and HLS latency horizon.
+    """
+    directory = abspath(expanduser(directory))
+
+    return _NEGATIVE_CACHES.get(
+        (directory, HLS_giveup_days),
+        lambda: NegativeCache(directory, HLS_giveup_days=HLS_giveup_days)
+    )
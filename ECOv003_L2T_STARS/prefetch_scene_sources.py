@@ -0,0 +1,163 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, timedelta
+from typing import Dict, List, Tuple
+import logging
+
+import colored_logging as cl
+from modland import find_modland_tiles
+from rasters import RasterGeometry
+
+from harmonized_landsat_sentinel import (
+    HLSSentinelNotAvailable,
+    HLSLandsatNotAvailable,
+    HLSTileNotAvailable,
+)
+
+from .constants import HLS_DOWNLOAD_WORKERS, SPINUP_DAYS
+from .daterange import date_range
+from .retrieve_STARS_sources import HLS_SENSORS, HLS_lookup_lock, retrieve_HLS_sensor
+from .STARS_connections import STARSConnections
+
+logger = logging.getLogger(__name__)
+
+
+def scene_source_windows(
+        tile_geometries: Dict[str, RasterGeometry],
+        tile_dates: Dict[str, date],
+        spinup_days: int = SPINUP_DAYS,
+        VIIRS_input_days: int = 16) -> Tuple[List[str], date, date, Dict[str, Tuple[date, date]]]:
+    """
+    Combines the source windows of the tiles of a scene.
+
+    Args:
+        tile_geometries (Dict[str, RasterGeometry]): Geometry of each Sentinel tile.
+        tile_dates (Dict[str, date]): Overpass date of each Sentinel tile.
+        spinup_days (int, optional): Days of coarse VIIRS images before each overpass date.
+        VIIRS_input_days (int, optional): Days of VNP09GA needed before the first coarse VIIRS date.
+
+    Returns:
+        Tuple: The MODLAND tiles covering any Sentinel tile, the first and last VNP09GA dates,
+               and the HLS date window of each Sentinel tile.
+    """
+    MODLAND_tiles = set()
+    HLS_windows = {}
+
+    for tile, geometry in tile_geometries.items():
+        MODLAND_tiles.update(find_modland_tiles(geometry.boundary_latlon.geometry))
+        HLS_windows[tile] = (tile_dates[tile] - timedelta(days=spinup_days), tile_dates[tile])
+
+    VIIRS_start_date = min(start for start, end in HLS_windows.values()) - timedelta(days=VIIRS_input_days)
+    VIIRS_end_date = max(end for start, end in HLS_windows.values())
+
+    return sorted(MODLAND_tiles), VIIRS_start_date, VIIRS_end_date, HLS_windows
+
+
+def prefetch_scene_sources(
+        tile_geometries: Dict[str, RasterGeometry],
+        tile_dates: Dict[str, date],
+        connections: STARSConnections,
+        spinup_days: int = SPINUP_DAYS,
+        workers: int = HLS_DOWNLOAD_WORKERS):
+    """
+    Downloads the HLS and VNP09GA source data of every tile of a scene once, before the per-tile runs.
+
+    Neighbouring Sentinel tiles share most of their MODLAND tiles, so VIIRS is searched once for the MODLAND tiles
+    over the union of the tiles' date windows, and each granule is downloaded once: VNP09GA granules are also
+    staged for VNP43NRT, and without VNP43NRT the VNP43IA4 and VNP43MA3 granules are downloaded from the data pool.
+    HLS is listed once per tile over its window, and its granules are looked up one at a time through the shared
+    connection and downloaded concurrently.
+    HLS windows start `spinup_days` before each overpass, because a prior can only shorten them.
+
+    Failures are logged and left to the per-tile runs, which retry and report them with their exit codes.
+
+    Args:
+        tile_geometries (Dict[str, RasterGeometry]): Geometry of each Sentinel tile.
+        tile_dates (Dict[str, date]): Overpass date of each Sentinel tile.
+        connections (STARSConnections): The connections shared with the per-tile runs.
+        spinup_days (int, optional): Days of coarse VIIRS images before each overpass date.
+        workers (int, optional): Number of HLS granules downloaded concurrently.
+    """
+    if len(tile_geometries) == 0:
+        return
+
+    VIIRS_input_days = connections.NDVI_VIIRS_connection.INPUT_DAYS if connections.use_VNP43NRT else 0
+
+    MODLAND_tiles, VIIRS_start_date, VIIRS_end_date, HLS_windows = scene_source_windows(
+        tile_geometries=tile_geometries,
+        tile_dates=tile_dates,
+        spinup_days=spinup_days,
+        VIIRS_input_days=VIIRS_input_days
+    )
+
+    HLS_connection = connections.HLS_connection
+    negative_cache = connections.negative_cache
+    retrievals = []
+
+    # listing fills the connection's granule table, so it is done once per tile before the concurrent downloads
+    for tile, (start_date, end_date) in sorted(HLS_windows.items()):
+        try:
+            with HLS_lookup_lock(HLS_connection):
+                HLS_connection.listing(tile=tile, start_UTC=start_date, end_UTC=end_date)
+        except Exception as e:
+            logger.warning(f"unable to list HLS at tile {tile}, leaving it to its run: {e}")
+            continue
+
+        for processing_date in date_range(start_date, end_date):
+            for sensor in HLS_SENSORS:
+                if not negative_cache.unavailable(f"HLS_{sensor}", tile, processing_date):
+                    retrievals.append((tile, processing_date, sensor))
+
+    logger.info(
+        f"prefetching {cl.val(len(retrievals))} HLS tile-dates for {cl.val(len(HLS_windows))} tiles "
+        f"and VIIRS for {cl.val(len(MODLAND_tiles))} MODLAND tiles "
+        f"from {cl.time(VIIRS_start_date)} to {cl.time(VIIRS_end_date)}"
+    )
+
+    with ThreadPoolExecutor(max_workers=max(1, workers) + 2, thread_name_prefix="scene_sources") as executor:
+        if connections.use_VNP43NRT:
+            VIIRS_futures = {
+                executor.submit(
+                    connections.NDVI_VIIRS_connection.prefetch_VNP09GA,
+                    start_date=VIIRS_start_date,
+                    end_date=VIIRS_end_date,
+                    tiles=MODLAND_tiles
+                ): "VNP09GA"
+            }
+        else:
+            VIIRS_futures = {
+                executor.submit(
+                    connection.prefetch_granules,
+                    start_date=VIIRS_start_date,
+                    end_date=VIIRS_end_date,
+                    tiles=MODLAND_tiles
+                ): product
+                for product, connection in (
+                    ("VNP43IA4", connections.NDVI_VIIRS_connection),
+                    ("VNP43MA3", connections.albedo_VIIRS_connection)
+                )
+            }
+
+        futures = {
+            executor.submit(retrieve_HLS_sensor, HLS_connection, tile, processing_date, sensor):
+                (tile, processing_date, sensor)
+            for tile, processing_date, sensor in retrievals
+        }
+
+        for future in as_completed(futures):
+            tile, processing_date, sensor = futures[future]
+
+            try:
+                future.result()
+            except (HLSTileNotAvailable, HLSSentinelNotAvailable, HLSLandsatNotAvailable) as e:
+                logger.warning(e)
+
+                if not isinstance(e, HLSTileNotAvailable):
+                    negative_cache.record(f"HLS_{sensor}", tile, processing_date, e)
+            except Exception as e:
+                logger.warning(f"unable to prefetch HLS {sensor} at tile {tile} on {processing_date}: {e}")
+
+        for VIIRS_future, product in VIIRS_futures.items():
+            try:
+                VIIRS_future.result()
+            except Exception as e:
+                logger.warning(f"unable to prefetch {product} for scene: {e}")
@@ -2,7 +2,7 @@ import logging
 import shutil
 from datetime import datetime, date
 from os import remove
-from os.path import basename, exists
+from os.path import exists
 from typing import Union
 import logging
 
@@ -13,7 +13,7 @@ from rasters import Raster
 
 from harmonized_landsat_sentinel import HLS2Connection
 
-from ECOv003_granules import L2TSTARS, NDVI_COLORMAP, ALBEDO_COLORMAP
+from ECOv003_granules import L2TSTARS
 from ECOv003_exit_codes import BlankOutput
 
 from .constants import *
@@ -21,9 +21,12 @@ from .VIIRS import VIIRSDownloaderNDVI, VIIRSDownloaderAlbedo
 from .generate_model_state_tile_date_directory import generate_model_state_tile_date_directory
 from .generate_STARS_inputs import generate_STARS_inputs
 from .generate_filename import generate_filename
+from .negative_cache import NegativeCache
+from .model_state_store import get_model_state_store
 from .process_julia_data_fusion import process_julia_data_fusion
 
 from .prior import Prior
+from .write_STARS_product import write_STARS_product
 
 logger = logging.getLogger(__name__)
 
@@ -79,12 +82,15 @@ def process_STARS_product(
     albedo_VIIRS_connection: VIIRSDownloaderAlbedo,
     using_prior: bool = False,
     calibrate_fine: bool = False,
+    pooled_calibration: bool = False,
     remove_input_staging: bool = True,
     remove_prior: bool = REMOVE_PRIOR,
     remove_posterior: bool = REMOVE_POSTERIOR,
     initialize_julia: bool = False,
     threads: Union[int, str] = "auto",
     num_workers: int = 4,
+    negative_cache: NegativeCache = None,
+    indices_directory: str = None,
 ):
     """
     Orchestrates the generation of the L2T_STARS product for a given tile and date.
@@ -121,6 +127,8 @@ def process_STARS_product(
         using_prior (bool, optional): If True, use the prior product in fusion. Defaults to False.
         calibrate_fine (bool, optional): If True, calibrate fine images to coarse images.
                                          Defaults to False.
+        pooled_calibration (bool, optional): If True, calibrate dates with too few valid pixels
+                                             by a fit pooled over the window. Defaults to False.
         remove_input_staging (bool, optional): If True, remove the input staging directory
                                                 after processing. Defaults to True.
         remove_prior (bool, optional): If True, remove prior intermediate files after use.
@@ -133,6 +141,8 @@ def process_STARS_product(
                                             Defaults to "auto".
         num_workers (int, str): Number of Julia workers for distributed processing.
                                      Defaults to 4.
+        negative_cache (NegativeCache, optional): Record of HLS dates found unavailable by earlier runs.
+        indices_directory (str, optional): Directory holding the per-grid index files.
 
     Raises:
         BlankOutput: If any of the final fused output rasters (NDVI, albedo, UQ, flag) are empty.
@@ -167,6 +177,9 @@ def process_STARS_product(
         NDVI_VIIRS_connection=NDVI_VIIRS_connection,
         albedo_VIIRS_connection=albedo_VIIRS_connection,
         calibrate_fine=calibrate_fine,
+        negative_cache=negative_cache,
+        indices_directory=indices_directory,
+        pooled_calibration=pooled_calibration,
     )
 
     # --- Process NDVI Data Fusion ---
@@ -429,85 +442,52 @@ def process_STARS_product(
         process_count=product_counter,
     )
 
-    # Add the generated layers to the granule object
-    granule.add_layer("NDVI", NDVI, cmap=NDVI_COLORMAP)
-    granule.add_layer("NDVI-UQ", NDVI_UQ, cmap="jet")
-    granule.add_layer("NDVI-bias", NDVI_bias, cmap="viridis")
-    granule.add_layer("NDVI-bias-UQ", NDVI_bias_UQ, cmap="viridis")
-    granule.add_layer("NDVI-flag", NDVI_flag, cmap="jet")
-    granule.add_layer("albedo", albedo, cmap=ALBEDO_COLORMAP)
-    granule.add_layer("albedo-UQ", albedo_UQ, cmap="jet")
-    granule.add_layer("albedo-bias", albedo_bias, cmap="viridis")
-    granule.add_layer("albedo-bias-UQ", albedo_bias_UQ, cmap="viridis")
-    granule.add_layer("albedo-flag", albedo_flag, cmap="jet")
-
-    # Update metadata and write to the granule
-    metadata["StandardMetadata"]["BuildID"] = build
-    metadata["StandardMetadata"]["LocalGranuleID"] = basename(L2T_STARS_zip_filename)
-    metadata["StandardMetadata"]["SISName"] = "Level 2 STARS Product Specification Document"
-    granule.write_metadata(metadata)
-
-    # Write the zipped product and browse image
-    logger.info(f"Writing L2T STARS product zip: {cl.file(L2T_STARS_zip_filename)}")
-    granule.write_zip(L2T_STARS_zip_filename)
-    logger.info(f"Writing L2T STARS browse image: {cl.file(L2T_STARS_browse_filename)}")
-    granule.write_browse_image(PNG_filename=L2T_STARS_browse_filename)
-    logger.info(
-        f"Removing L2T STARS tile granule directory: {cl.dir(L2T_STARS_granule_directory)}"
-    )
-    shutil.rmtree(L2T_STARS_granule_directory)
-
-    # Re-check and regenerate browse image if it somehow didn't generate (e.g. if the granule dir was already deleted)
-    if not exists(L2T_STARS_browse_filename):
-        logger.info(
-            f"Browse image not found after initial creation attempt. Regenerating: {cl.file(L2T_STARS_browse_filename)}"
-        )
-        # Re-load granule from zip to create browse image if necessary
-        granule_for_browse = L2TSTARS(L2T_STARS_zip_filename)
-        granule_for_browse.write_browse_image(PNG_filename=L2T_STARS_browse_filename)
-
-    # Re-write posterior files (often done to ensure proper compression/color maps after processing)
-    # This step might be redundant if Julia already writes them correctly, but ensures consistency.
-    logger.info(f"Re-writing posterior NDVI: {posterior_NDVI_filename}")
-    Raster.open(posterior_NDVI_filename, cmap=NDVI_COLORMAP).to_geotiff(
-        posterior_NDVI_filename
-    )
-    logger.info(f"Re-writing posterior NDVI UQ: {posterior_NDVI_UQ_filename}")
-    Raster.open(posterior_NDVI_UQ_filename, cmap="jet").to_geotiff(
-        posterior_NDVI_UQ_filename
-    )
-    logger.info(f"Re-writing posterior NDVI flag: {posterior_NDVI_flag_filename}")
-    Raster.open(posterior_NDVI_flag_filename, cmap="jet").to_geotiff(
-        posterior_NDVI_flag_filename
-    )
-    logger.info(f"Re-writing posterior NDVI bias: {posterior_NDVI_bias_filename}")
-    Raster.open(posterior_NDVI_bias_filename, cmap=NDVI_COLORMAP).to_geotiff(
-        posterior_NDVI_bias_filename
-    )
-    logger.info(f"Re-writing posterior NDVI bias UQ: {posterior_NDVI_bias_UQ_filename}")
-    Raster.open(posterior_NDVI_bias_UQ_filename, cmap=NDVI_COLORMAP).to_geotiff(
-        posterior_NDVI_bias_UQ_filename
+    posterior_filenames = {
+        "NDVI": posterior_NDVI_filename,
+        "NDVI.UQ": posterior_NDVI_UQ_filename,
+        "NDVI.bias": posterior_NDVI_bias_filename,
+        "NDVI.bias.UQ": posterior_NDVI_bias_UQ_filename,
+        "NDVI.flag": posterior_NDVI_flag_filename,
+        "albedo": posterior_albedo_filename,
+        "albedo.UQ": posterior_albedo_UQ_filename,
+        "albedo.bias": posterior_albedo_bias_filename,
+        "albedo.bias.UQ": posterior_albedo_bias_UQ_filename,
+        "albedo.flag": posterior_albedo_flag_filename,
+    }
+
+    # Write the granule, zip, browse image and kept posterior files once each from the fused layers
+    write_STARS_product(
+        granule=granule,
+        layers={
+            "NDVI": NDVI,
+            "NDVI-UQ": NDVI_UQ,
+            "NDVI-bias": NDVI_bias,
+            "NDVI-bias-UQ": NDVI_bias_UQ,
+            "NDVI-flag": NDVI_flag,
+            "albedo": albedo,
+            "albedo-UQ": albedo_UQ,
+            "albedo-bias": albedo_bias,
+            "albedo-bias-UQ": albedo_bias_UQ,
+            "albedo-flag": albedo_flag,
+        },
+        metadata=metadata,
+        build=build,
+        L2T_STARS_granule_directory=L2T_STARS_granule_directory,
+        L2T_STARS_zip_filename=L2T_STARS_zip_filename,
+        L2T_STARS_browse_filename=L2T_STARS_browse_filename,
+        # the posterior is only re-encoded when it is kept
+        posterior_filenames=None if remove_posterior else posterior_filenames,
     )
 
-    logger.info(f"Re-writing posterior albedo: {posterior_albedo_filename}")
-    Raster.open(posterior_albedo_filename, cmap=ALBEDO_COLORMAP).to_geotiff(
-        posterior_albedo_filename
-    )
-    logger.info(f"Re-writing posterior albedo UQ: {posterior_albedo_UQ_filename}")
-    Raster.open(posterior_albedo_UQ_filename, cmap="jet").to_geotiff(
-        posterior_albedo_UQ_filename
-    )
-    logger.info(f"Re-writing posterior albedo flag: {posterior_albedo_flag_filename}")
-    Raster.open(posterior_albedo_flag_filename, cmap="jet").to_geotiff(
-        posterior_albedo_flag_filename
-    )
-    logger.info(f"Re-writing posterior albedo bias: {posterior_albedo_bias_filename}")
-    Raster.open(posterior_albedo_bias_filename, cmap=ALBEDO_COLORMAP).to_geotiff(
-        posterior_albedo_bias_filename
-    )
-    logger.info(f"Re-writing posterior albedo bias UQ: {posterior_albedo_bias_UQ_filename}")
-    Raster.open(posterior_albedo_bias_UQ_filename, cmap=ALBEDO_COLORMAP).to_geotiff(
-        posterior_albedo_bias_UQ_filename
+    # Keep the posterior of the written product as the model state the next run reads its prior from,
+    # moving it into the store when it would otherwise be removed
+    get_model_state_store(model_directory).save(
+        tile=tile,
+        date_UTC=date_UTC,
+        cell_size=target_resolution,
+        L2T_STARS_filename=L2T_STARS_zip_filename,
+        posterior_filenames=posterior_filenames,
+        move=remove_posterior,
     )
 
     # --- Cleanup ---
@@ -0,0 +1,72 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class ProcessCache:
+    """
+    Process-wide cache of values built once per key, such as per-grid indices or per-directory stores.
+
+    A value is built outside the lock guarding the cache, under a lock of its own key,
+    so building one value does not hold up lookups of any other.
+    With a size, the least recently used values are evicted beyond it.
+    """
+
+    def __init__(self, size: int = None):
+        self.size = size
+        self._values = OrderedDict()
+        # locks of the keys whose values are being built
+        self._building = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._values)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._values
+
+    def _lookup(self, key: Hashable):
+        # caller holds self._lock
+        self._values.move_to_end(key)
+        return self._values[key]
+
+    def get(self, key: Hashable, build: Callable[[], T]) -> T:
+        """
+        Retrieves the value of a key, building it with `build` if it is not cached.
+        """
+        with self._lock:
+            if key in self._values:
+                return self._lookup(key)
+
+            key_lock = self._building.setdefault(key, threading.Lock())
+
+        with key_lock:
+            with self._lock:
+                if key in self._values:
+                    return self._lookup(key)
+
+            try:
+                value = build()
+            except BaseException:
+                with self._lock:
+                    self._building.pop(key, None)
+
+                raise
+
+            with self._lock:
+                self._values[key] = value
+                self._values.move_to_end(key)
+                self._building.pop(key, None)
+
+                while self.size is not None and len(self._values) > self.size:
+                    self._values.popitem(last=False)
+
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
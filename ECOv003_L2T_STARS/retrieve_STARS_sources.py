@@ -1,11 +1,16 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import date
+from os.path import abspath, expanduser
 import logging
+import threading
+import weakref
 
 from dateutil.rrule import rrule, DAILY
 
 from rasters import RasterGeometry
 
 import colored_logging as cl
+import earthaccess
 
 from harmonized_landsat_sentinel import HLS2Connection
 
@@ -19,11 +24,64 @@ from harmonized_landsat_sentinel import (
 
 from ECOv003_exit_codes import *
 
+from .constants import HLS_DOWNLOAD_WORKERS
 from .daterange import get_date
 from .VNP43NRT import VNP43NRT
+from .negative_cache import NegativeCache
 
 logger = logging.getLogger(__name__)
 
+# HLS sensors retrieved for each date
+HLS_SENSORS = ("Sentinel", "Landsat")
+
+# locks serializing the granule lookups made through each HLS connection
+_HLS_LOOKUP_LOCKS = weakref.WeakKeyDictionary()
+_HLS_LOOKUP_LOCKS_LOCK = threading.Lock()
+
+
+def HLS_lookup_lock(HLS_connection: HLS2Connection) -> threading.Lock:
+    """
+    Retrieves the lock held while looking up granules through an HLS connection.
+
+    HLS2Connection updates its listing and unavailable-date tables without locking,
+    so lookups through one connection are made one at a time.
+    """
+    with _HLS_LOOKUP_LOCKS_LOCK:
+        if HLS_connection not in _HLS_LOOKUP_LOCKS:
+            _HLS_LOOKUP_LOCKS[HLS_connection] = threading.Lock()
+
+        return _HLS_LOOKUP_LOCKS[HLS_connection]
+
+
+def retrieve_HLS_sensor(HLS_connection: HLS2Connection, tile: str, processing_date: date, sensor: str):
+    """
+    Retrieves the HLS granule of one sensor at a tile on a date.
+
+    The granule is looked up through the connection under its lookup lock, as `HLS2Connection.sentinel`
+    and `HLS2Connection.landsat` do, and only its transfer runs concurrently with other retrievals.
+
+    Raises:
+        HLSSentinelNotAvailable: If Sentinel is not available at the tile on the date.
+        HLSLandsatNotAvailable: If Landsat is not available at the tile on the date.
+        HLSDownloadFailed: If the granule cannot be downloaded.
+    """
+    logger.info(f"Retrieving HLS {sensor} at tile {cl.place(tile)} on date {cl.time(processing_date)}")
+
+    with HLS_lookup_lock(HLS_connection):
+        if sensor == "Sentinel":
+            granule = HLS_connection.sentinel_granule(tile=tile, date_UTC=processing_date)
+            directory = HLS_connection.sentinel_directory(granule, date_UTC=processing_date)
+        elif sensor == "Landsat":
+            granule = HLS_connection.landsat_granule(tile=tile, date_UTC=processing_date)
+            directory = HLS_connection.landsat_directory(granule, tile=tile, date_UTC=processing_date)
+        else:
+            raise ValueError(f"unrecognized HLS sensor: {sensor}")
+
+    for download_file_path in earthaccess.download(granule, abspath(expanduser(directory))):
+        if isinstance(download_file_path, Exception):
+            raise HLSDownloadFailed(f"Error when downloading HLS2 files to {directory}") from download_file_path
+
+
 def retrieve_STARS_sources(
     tile: str,
     geometry: RasterGeometry,
@@ -32,7 +90,9 @@ def retrieve_STARS_sources(
     VIIRS_start_date: date,
     VIIRS_end_date: date,
     HLS_connection: HLS2Connection,
-    VIIRS_connection: VNP43NRT):
+    VIIRS_connection: VNP43NRT,
+    negative_cache: NegativeCache = None,
+    workers: int = HLS_DOWNLOAD_WORKERS):
     """
     Retrieves necessary Harmonized Landsat Sentinel (HLS) and VIIRS source data.
 
@@ -40,6 +100,10 @@ def retrieve_STARS_sources(
     data for the specified tile and date ranges. It includes error handling for
     download failures and data unavailability.
 
+    HLS granules are retrieved concurrently over (date, sensor) pairs, and their outcomes are
+    handled in date and sensor order once all retrievals have finished. Landsat is retrieved on a date
+    even when Sentinel is not available on it, and a failed download is raised once every retrieval has finished.
+
     Args:
         tile (str): The HLS tile ID.
         geometry (RasterGeometry): The spatial geometry of the area of interest.
@@ -50,6 +114,9 @@ def retrieve_STARS_sources(
         HLS_connection (HLS2Connection): An initialized HLS data connection object.
         VIIRS_connection (VNP43NRT): An initialized VIIRS data connection object
                                       (can be VNP43NRT, VNP43IA4, or VNP43MA3).
+        negative_cache (NegativeCache, optional): Record of HLS dates found unavailable, which are skipped
+                                                  and to which newly unavailable dates are added.
+        workers (int, optional): Number of HLS granules retrieved concurrently.
 
     Raises:
         DownloadFailed: If an HLS download fails.
@@ -58,36 +125,58 @@ def retrieve_STARS_sources(
     logger.info(
         f"Retrieving HLS sources for tile {cl.place(tile)} from {cl.time(HLS_start_date)} to {cl.time(HLS_end_date)}"
     )
-    # Iterate through each day in the HLS date range to retrieve Sentinel and Landsat data
-    for processing_date in [
-        get_date(dt) for dt in rrule(DAILY, dtstart=HLS_start_date, until=HLS_end_date)
-    ]:
-        try:
-            logger.info(
-                f"Retrieving HLS Sentinel at tile {cl.place(tile)} on date {cl.time(processing_date)}"
-            )
-            # Attempt to download HLS Sentinel data
-            HLS_connection.sentinel(tile=tile, date_UTC=processing_date)
-            logger.info(
-                f"Retrieving HLS Landsat at tile {cl.place(tile)} on date {cl.time(processing_date)}"
-            )
-            # Attempt to download HLS Landsat data
-            HLS_connection.landsat(tile=tile, date_UTC=processing_date)
-        except HLSDownloadFailed as e:
-            logger.exception(e)
+
+    # Listing the whole window first fills the connection's granule table once,
+    # so the lookups of the retrievals below only read it
+    try:
+        with HLS_lookup_lock(HLS_connection):
+            HLS_connection.listing(tile=tile, start_UTC=HLS_start_date, end_UTC=HLS_end_date)
+    except Exception as e:
+        logger.warning(f"unable to list HLS at tile {tile}, retrieving dates one at a time: {e}")
+        workers = 1
+
+    # Skip sensors found unavailable on each date by earlier runs
+    retrievals = [
+        (processing_date, sensor)
+        for processing_date in [
+            get_date(dt) for dt in rrule(DAILY, dtstart=HLS_start_date, until=HLS_end_date)
+        ]
+        for sensor in HLS_SENSORS
+        if negative_cache is None or not negative_cache.unavailable(f"HLS_{sensor}", tile, processing_date)
+    ]
+
+    # Retrieve HLS Sentinel and Landsat concurrently, collecting each outcome by date and sensor
+    outcomes = {}
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="HLS_retrieval") as executor:
+        futures = {
+            executor.submit(retrieve_HLS_sensor, HLS_connection, tile, processing_date, sensor):
+                (processing_date, sensor)
+            for processing_date, sensor in retrievals
+        }
+
+        for future in as_completed(futures):
+            outcomes[futures[future]] = future.exception()
+
+    # Handle outcomes in date and sensor order, so that warnings, records and the raised failure do not
+    # depend on which download finished first
+    for processing_date, sensor in retrievals:
+        e = outcomes[(processing_date, sensor)]
+
+        if e is None:
+            continue
+        elif isinstance(e, HLSDownloadFailed):
+            logger.error(e, exc_info=e)
             raise AuxiliaryDownloadFailed(e)
-        except (
-            HLSTileNotAvailable,
-            HLSSentinelNotAvailable,
-            HLSLandsatNotAvailable,
-        ) as e:
+        elif isinstance(e, (HLSTileNotAvailable, HLSSentinelNotAvailable, HLSLandsatNotAvailable)):
             # Log warnings for data not being available, but continue processing
             logger.warning(e)
-        except Exception as e:
-            # Catch other unexpected exceptions during HLS retrieval
-            logger.warning("Exception raised while retrieving HLS tiles")
-            logger.exception(e)
-            continue  # Continue to the next date even if one HLS retrieval fails
+
+            if negative_cache is not None and not isinstance(e, HLSTileNotAvailable):
+                negative_cache.record(f"HLS_{sensor}", tile, processing_date, e)
+        else:
+            # Other unexpected exceptions during HLS retrieval do not stop the remaining dates
+            logger.warning("Exception raised while retrieving HLS tiles", exc_info=e)
 
     logger.info(
         f"Retrieving VIIRS sources for tile {cl.place(tile)} from {cl.time(VIIRS_start_date)} to {cl.time(VIIRS_end_date)}"
@@ -0,0 +1,215 @@
+from concurrent.futures import ThreadPoolExecutor
+from glob import glob
+from os.path import basename, exists, join, splitext
+from typing import Dict, List, Tuple, Union
+import logging
+import os
+import shutil
+import warnings
+import zipfile
+
+import colored_logging as cl
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib.colors import Colormap
+from rasters import Raster
+
+from ECOv003_granules import L2TSTARS, NDVI_COLORMAP, ALBEDO_COLORMAP
+
+from .constants import BROWSE_OVERVIEW_FACTOR, LAYER_ENCODING_WORKERS
+
+logger = logging.getLogger(__name__)
+
+# granule layer, posterior variable, granule layer colormap, posterior preview colormap
+STARS_LAYERS: List[Tuple[str, str, Union[Colormap, str], Union[Colormap, str]]] = [
+    ("NDVI", "NDVI", NDVI_COLORMAP, NDVI_COLORMAP),
+    ("NDVI-UQ", "NDVI.UQ", "jet", "jet"),
+    ("NDVI-bias", "NDVI.bias", "viridis", NDVI_COLORMAP),
+    ("NDVI-bias-UQ", "NDVI.bias.UQ", "viridis", NDVI_COLORMAP),
+    ("NDVI-flag", "NDVI.flag", "jet", "jet"),
+    ("albedo", "albedo", ALBEDO_COLORMAP, ALBEDO_COLORMAP),
+    ("albedo-UQ", "albedo.UQ", "jet", "jet"),
+    ("albedo-bias", "albedo.bias", "viridis", ALBEDO_COLORMAP),
+    ("albedo-bias-UQ", "albedo.bias.UQ", "viridis", ALBEDO_COLORMAP),
+    ("albedo-flag", "albedo.flag", "jet", "jet"),
+]
+
+
+def browse_overview(
+        array: np.ndarray,
+        shape: Tuple[int, int],
+        max_factor: int = BROWSE_OVERVIEW_FACTOR) -> np.ndarray:
+    """
+    Reduces a layer to the shape of its browse image, block-averaging it by the largest factor up to `max_factor`
+    that keeps the overview at least as large as the browse image, then sampling the nearest overview pixels.
+
+    Args:
+        array (np.ndarray): The full-resolution layer.
+        shape (Tuple[int, int]): The rows and columns of the browse image.
+        max_factor (int, optional): The largest block-average reduction.
+
+    Returns:
+        np.ndarray: The layer at the shape of the browse image.
+    """
+    rows, cols = array.shape
+    factor = max(1, min(max_factor, rows // shape[0], cols // shape[1]))
+
+    if factor > 1:
+        overview_rows = rows // factor
+        overview_cols = cols // factor
+        blocks = array[:overview_rows * factor, :overview_cols * factor].reshape(
+            overview_rows, factor, overview_cols, factor)
+
+        # blocks without valid pixels stay NaN
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            array = np.nanmean(blocks, axis=(1, 3))
+
+    rows, cols = array.shape
+    row_indices = ((np.arange(shape[0]) + 0.5) * rows / shape[0]).astype(int)
+    col_indices = ((np.arange(shape[1]) + 0.5) * cols / shape[1]).astype(int)
+
+    return array[np.ix_(row_indices, col_indices)]
+
+
+def write_browse_image(granule: L2TSTARS, image: Raster, PNG_filename: str):
+    """
+    Renders the browse image of a granule from a reduced-resolution overview of its primary layer in memory,
+    instead of reading the layer back from the granule and resampling it at full resolution
+    as `L2TSTARS.write_browse_image` does.
+
+    Args:
+        granule (L2TSTARS): The granule whose preview colormap, shape and quality are used.
+        image (Raster): The granule's primary layer.
+        PNG_filename (str): The browse image file to write.
+    """
+    shape = granule.granule_preview_shape
+    cmap = granule.granule_preview_cmap
+
+    if isinstance(cmap, str):
+        cmap = plt.get_cmap(cmap)
+
+    overview = image.contain(
+        array=browse_overview(np.array(image, dtype=np.float32), shape),
+        geometry=image.geometry.resize(shape)
+    )
+
+    browse_image = overview.percentilecut.to_pillow(cmap=cmap, mode="RGB")
+    browse_image.save(PNG_filename, format="png", quality=granule.granule_preview_quality)
+
+    if not exists(PNG_filename):
+        raise IOError(f"unable to create PNG browse image: {PNG_filename}")
+
+
+def write_STARS_product(
+        granule: L2TSTARS,
+        layers: Dict[str, Raster],
+        metadata: dict,
+        build: str,
+        L2T_STARS_granule_directory: str,
+        L2T_STARS_zip_filename: str,
+        L2T_STARS_browse_filename: str,
+        posterior_filenames: Dict[str, str] = None,
+        workers: int = LAYER_ENCODING_WORKERS):
+    """
+    Writes the L2T STARS product from the fused layers in memory, encoding each output once.
+
+    The granule layers are encoded concurrently with their final colormaps, since GDAL compression releases the GIL,
+    and each is added to the zip as soon as it and the layers before it are finished, so the zip is assembled
+    while the remaining layers encode and the granule directory is removed once it is complete.
+    The browse image is rendered from an overview of the NDVI layer in memory alongside the layers.
+    The posterior files kept as the model state of the next run are re-encoded once from the same layers
+    with their preview colormaps, and not at all when they are about to be removed.
+
+    Args:
+        granule (L2TSTARS): The granule to write the layers to.
+        layers (Dict[str, Raster]): The fused rasters by granule layer name, as listed in `STARS_LAYERS`.
+        metadata (dict): The product metadata, whose standard metadata is completed here.
+        build (str): The build ID of the PGE.
+        L2T_STARS_granule_directory (str): The granule directory, removed once zipped.
+        L2T_STARS_zip_filename (str): The product zip file to write.
+        L2T_STARS_browse_filename (str): The browse image file to write.
+        posterior_filenames (Dict[str, str], optional): The posterior file of each posterior variable
+                                                        to re-encode, or None if the posterior is removed.
+        workers (int, optional): Number of layers encoded concurrently.
+    """
+    # the XML writer of the granule library is not exported by its package
+    from ECOv003_granules.write_XML_metadata import write_XML_metadata
+
+    # Update metadata and write to the granule
+    metadata["StandardMetadata"]["BuildID"] = build
+    metadata["StandardMetadata"]["LocalGranuleID"] = basename(L2T_STARS_zip_filename)
+    metadata["StandardMetadata"]["SISName"] = "Level 2 STARS Product Specification Document"
+    granule.write_metadata(metadata)
+
+    directory_name = splitext(basename(L2T_STARS_zip_filename))[0]
+    zipped = set()
+
+    def add_to_zip(zip_file: zipfile.ZipFile, filename: str):
+        if filename in zipped or not exists(filename):
+            return
+
+        zip_file.write(filename=filename, arcname=join(directory_name, basename(filename)))
+        zipped.add(filename)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="STARS_product") as executor:
+        browse_future = executor.submit(
+            write_browse_image,
+            granule,
+            layers[granule.primary_variable],
+            L2T_STARS_browse_filename
+        )
+
+        # Add the generated layers to the granule object
+        layer_futures = [
+            executor.submit(granule.add_layer, layer, layers[layer], cmap=cmap)
+            for layer, variable, cmap, posterior_cmap in STARS_LAYERS
+        ]
+
+        # Re-encode the kept posterior files with compression and colormapped previews
+        posterior_futures = []
+
+        if posterior_filenames is not None:
+            for layer, variable, cmap, posterior_cmap in STARS_LAYERS:
+                posterior_filename = posterior_filenames[variable]
+                logger.info(f"Re-writing posterior {variable}: {posterior_filename}")
+                posterior_futures.append(
+                    executor.submit(layers[layer].to_geotiff, posterior_filename, cmap=posterior_cmap))
+
+        # Write the zipped product as the layers finish, in layer order, into a temporary file
+        # that only takes the product's name once every output is written, since an existing product is not redone
+        logger.info(f"Writing L2T STARS product zip: {cl.file(L2T_STARS_zip_filename)}")
+        temporary_zip_filename = f"{L2T_STARS_zip_filename}.tmp"
+
+        try:
+            with zipfile.ZipFile(temporary_zip_filename, "w") as zip_file:
+                for future in layer_futures:
+                    layer_filename = future.result()
+                    add_to_zip(zip_file, layer_filename)
+                    add_to_zip(zip_file, layer_filename.replace(".tif", ".jpeg"))
+
+                for filename in sorted(glob(join(granule.product_directory, "*"))):
+                    add_to_zip(zip_file, filename)
+
+            XML_metadata_filename = L2T_STARS_zip_filename.replace(".zip", ".zip.xml")
+            logger.info(f"writing XML metadata file: {cl.file(XML_metadata_filename)}")
+            write_XML_metadata(metadata["StandardMetadata"], XML_metadata_filename)
+
+            logger.info(f"Writing L2T STARS browse image: {cl.file(L2T_STARS_browse_filename)}")
+            browse_future.result()
+
+            for future in posterior_futures:
+                future.result()
+
+            os.replace(temporary_zip_filename, L2T_STARS_zip_filename)
+        finally:
+            if exists(temporary_zip_filename):
+                os.remove(temporary_zip_filename)
+
+        if not exists(L2T_STARS_zip_filename):
+            raise IOError(f"unable to create tiled product zip: {L2T_STARS_zip_filename}")
+
+        logger.info(
+            f"Removing L2T STARS tile granule directory: {cl.dir(L2T_STARS_granule_directory)}"
+        )
+        shutil.rmtree(L2T_STARS_granule_directory)
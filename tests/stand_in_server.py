@@ -0,0 +1,478 @@
+"""
+Local stand-in for the CMR search API, the LP DAAC data pool and granule downloads.
+
+The server replays recorded or synthetic CMR UMM JSON, data pool directory listings, XML granule metadata
+and granule payloads over HTTP, with configurable latency, bandwidth and failure injection,
+so that searches, download concurrency, retries and caching can be exercised without network access.
+Searches and downloads are redirected to it through the environment variables in `ECOv003_L2T_STARS.endpoints`.
+It is a test fixture, imported by the tests once their missing dependencies are mocked, and is not shipped with the package.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import posixpath
+import random
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime
+from fnmatch import fnmatch
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from os import makedirs
+from os.path import abspath, expanduser, join
+from time import sleep
+from typing import Dict, List, Union
+from urllib.parse import parse_qs, urlparse
+
+from dateutil import parser
+
+from ECOv003_L2T_STARS.cksum import cksum
+from ECOv003_L2T_STARS.endpoints import CMR_SEARCH_URL_VARIABLE, LPDAAC_REMOTE_VARIABLE
+
+logger = logging.getLogger(__name__)
+
+CMR_ROUTE = "/search/"
+LPDAAC_ROUTE = "/lpdaac"
+DATA_ROUTE = "/data"
+RESPONSE_CHUNK_SIZE = 2 ** 16
+
+MANIFEST_FILENAME = "manifest.json"
+
+LPDAAC_XML_TEMPLATE = """<?xml version="1.0" encoding="UTF-8"?>
+<GranuleMetaDataFile>
+  <GranuleURMetaData>
+    <GranuleUR>{name}</GranuleUR>
+    <DataFiles>
+      <DataFileContainer>
+        <DistributedFileName>{name}</DistributedFileName>
+        <FileSize>{size}</FileSize>
+        <ChecksumType>{checksum_type}</ChecksumType>
+        <Checksum>{checksum}</Checksum>
+      </DataFileContainer>
+    </DataFiles>
+  </GranuleURMetaData>
+</GranuleMetaDataFile>
+"""
+
+
+def _parse_time(text: str) -> datetime:
+    return parser.parse(text).replace(tzinfo=None)
+
+
+class StandInServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server replaying CMR searches, LP DAAC listings and metadata, and granule payloads.
+
+    Routes:
+        /search/granules.umm_json: CMR granule search filtered by concept ID, temporal range and granule name.
+        /lpdaac/...: data pool directories, served as HTML listings, and files with `.xml` metadata.
+        /data/...: granule payloads referenced by synthetic CMR records, with Range support.
+
+    Spatial filters in CMR searches are not evaluated, so every record of a concept matches any point or polygon.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+            self,
+            host: str = "127.0.0.1",
+            port: int = 0,
+            latency_seconds: float = 0,
+            bytes_per_second: float = None,
+            failure_rate: float = 0,
+            seed: int = None):
+        super().__init__((host, port), StandInHandler)
+        self.latency_seconds = latency_seconds
+        self.bytes_per_second = bytes_per_second
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        # CMR UMM records by concept ID
+        self.records: Dict[str, List[dict]] = {}
+        # file contents by URL path
+        self.files: Dict[str, bytes] = {}
+        # (path pattern, remaining count) pairs of requests answered with 503
+        self.failures: List[List] = []
+        # (method, path, Range header) of every request received
+        self.requests: List[tuple] = []
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def __repr__(self):
+        return f"StandInServer(URL={self.URL}, records={sum(map(len, self.records.values()))}, files={len(self.files)})"
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    @property
+    def URL(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def CMR_search_URL(self) -> str:
+        return f"{self.URL}{CMR_ROUTE}"
+
+    @property
+    def LPDAAC_remote(self) -> str:
+        return f"{self.URL}{LPDAAC_ROUTE}"
+
+    @property
+    def environment(self) -> Dict[str, str]:
+        """
+        Environment variables that point this package's connections at the server.
+        """
+        return {
+            CMR_SEARCH_URL_VARIABLE: self.CMR_search_URL,
+            LPDAAC_REMOTE_VARIABLE: self.LPDAAC_remote,
+            "SKIP_EARTHDATA_LOGIN": "true",
+        }
+
+    @contextmanager
+    def configure(self):
+        """
+        Sets the environment variables of `environment` for the duration of a block.
+        """
+        previous = {key: os.environ.get(key) for key in self.environment}
+        os.environ.update(self.environment)
+
+        try:
+            yield self
+        finally:
+            for key, value in previous.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
+
+    def start(self) -> "StandInServer":
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.serve_forever, args=(0.1,), daemon=True, name="stand-in-server")
+            self._thread.start()
+            logger.info(f"stand-in server listening at {self.URL}")
+
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self.shutdown()
+            self._thread.join()
+            self._thread = None
+
+        self.server_close()
+
+    def fail_next(self, count: int = 1, pattern: str = "*"):
+        """
+        Answers the next `count` requests for paths matching a glob pattern with 503 Service Unavailable.
+        """
+        with self._lock:
+            self.failures.append([pattern, count])
+
+    def _should_fail(self, path: str) -> bool:
+        with self._lock:
+            for failure in self.failures:
+                if failure[1] > 0 and fnmatch(path, failure[0]):
+                    failure[1] -= 1
+                    return True
+
+            return self.failure_rate > 0 and self.random.random() < self.failure_rate
+
+    def add_file(self, path: str, content: Union[bytes, str]) -> str:
+        """
+        Serves content at a URL path and returns its URL.
+        """
+        if isinstance(content, str):
+            content = content.encode()
+
+        path = "/" + path.lstrip("/")
+
+        with self._lock:
+            self.files[path] = content
+
+        return f"{self.URL}{path}"
+
+    def add_CMR_record(self, concept_id: str, record: dict):
+        """
+        Adds a recorded CMR UMM granule record to the search results of a concept.
+        """
+        with self._lock:
+            self.records.setdefault(concept_id, []).append(record)
+
+    def add_CMR_response(self, concept_id: str, response: Union[str, dict]):
+        """
+        Adds every granule of a recorded CMR `granules.umm_json` response to the search results of a concept.
+        """
+        if isinstance(response, str):
+            response = json.loads(response)
+
+        for record in response["items"]:
+            self.add_CMR_record(concept_id, record)
+
+    def add_granule(
+            self,
+            concept_id: str,
+            name: str,
+            date_UTC: Union[date, str],
+            content: bytes) -> dict:
+        """
+        Synthesizes a CMR record for a granule payload served by this server, with its size and SHA-256 checksum.
+
+        Returns:
+            dict: The CMR UMM record.
+        """
+        if isinstance(date_UTC, str):
+            date_UTC = parser.parse(date_UTC).date()
+
+        URL = self.add_file(posixpath.join(DATA_ROUTE, concept_id, name), content)
+
+        record = {
+            "meta": {
+                "concept-id": f"G{int(hashlib.sha1(f'{concept_id}/{name}'.encode()).hexdigest()[:8], 16)}-STANDIN",
+                "collection-concept-id": concept_id,
+                "native-id": name,
+            },
+            "umm": {
+                "GranuleUR": name,
+                "TemporalExtent": {
+                    "RangeDateTime": {
+                        "BeginningDateTime": f"{date_UTC:%Y-%m-%d}T00:00:00.000Z",
+                        "EndingDateTime": f"{date_UTC:%Y-%m-%d}T23:59:59.999Z",
+                    }
+                },
+                "RelatedUrls": [{"URL": URL, "Type": "GET DATA"}],
+                "DataGranule": {
+                    "ArchiveAndDistributionInformation": [
+                        {
+                            "Name": name,
+                            "SizeInBytes": len(content),
+                            "Checksum": {"Value": hashlib.sha256(content).hexdigest(), "Algorithm": "SHA-256"},
+                        }
+                    ]
+                },
+            },
+        }
+
+        self.add_CMR_record(concept_id, record)
+
+        return record
+
+    def add_LPDAAC_file(self, path: str, content: bytes, checksum_type: str = "CKSUM") -> str:
+        """
+        Serves a data pool file with its `.xml` granule metadata, listed in its parent directories.
+
+        Args:
+            path (str): Path under the data pool root, such as "VIIRS/VNP43IA4.001/2024.01.01/name.h5".
+            content (bytes): File content.
+            checksum_type (str, optional): "CKSUM" or "MD5".
+
+        Returns:
+            str: The URL of the file.
+        """
+        if checksum_type == "CKSUM":
+            checksum = str(int(cksum(content)))
+        elif checksum_type == "MD5":
+            checksum = hashlib.md5(content).hexdigest()
+        else:
+            raise ValueError(f"unsupported checksum type: {checksum_type}")
+
+        path = posixpath.join(LPDAAC_ROUTE, path.lstrip("/"))
+        name = posixpath.basename(path)
+
+        self.add_file(f"{path}.xml", LPDAAC_XML_TEMPLATE.format(
+            name=name,
+            size=len(content),
+            checksum_type=checksum_type,
+            checksum=checksum
+        ))
+
+        return self.add_file(path, content)
+
+    def listing(self, directory: str) -> List[str]:
+        """
+        Names of the files and subdirectories served under a directory path, with subdirectories ending in a slash.
+        """
+        directory = "/" + directory.strip("/") + "/"
+        names = set()
+
+        with self._lock:
+            paths = list(self.files)
+
+        for path in paths:
+            if path.startswith(directory):
+                remainder = path[len(directory):]
+
+                if "/" in remainder:
+                    names.add(remainder.split("/")[0] + "/")
+                else:
+                    names.add(remainder)
+
+        return sorted(names)
+
+    def search(self, query: Dict[str, List[str]]) -> List[dict]:
+        """
+        Filters the CMR records by the concept ID, temporal range and readable granule name of a search.
+        """
+        def values(name: str) -> List[str]:
+            return query.get(name, []) + query.get(f"{name}[]", [])
+
+        concept_ids = values("concept_id") or list(self.records)
+        temporal = values("temporal")
+        names = values("readable_granule_name")
+        results = []
+
+        with self._lock:
+            records = [record for concept_id in concept_ids for record in self.records.get(concept_id, [])]
+
+        for record in records:
+            umm = record["umm"]
+
+            if names and not any(fnmatch(umm["GranuleUR"], name) for name in names):
+                continue
+
+            if temporal:
+                start_text, end_text = temporal[0].split(",")[:2]
+                extent = umm["TemporalExtent"]["RangeDateTime"]
+                granule_start = _parse_time(extent["BeginningDateTime"])
+                granule_end = _parse_time(extent.get("EndingDateTime", extent["BeginningDateTime"]))
+
+                if start_text and granule_end < _parse_time(start_text):
+                    continue
+
+                if end_text and granule_start > _parse_time(end_text):
+                    continue
+
+            results.append(record)
+
+        return results
+
+    def save(self, directory: str):
+        """
+        Writes the records and files to a recording directory that `load` replays.
+        """
+        directory = abspath(expanduser(directory))
+        makedirs(join(directory, "files"), exist_ok=True)
+
+        with self._lock:
+            files = dict(self.files)
+            records = {concept_id: list(records) for concept_id, records in self.records.items()}
+
+        manifest = {"records": records, "files": {}}
+
+        for index, (path, content) in enumerate(sorted(files.items())):
+            filename = f"{index:06d}_{posixpath.basename(path)}"
+            manifest["files"][path] = filename
+
+            with open(join(directory, "files", filename), "wb") as file:
+                file.write(content)
+
+        with open(join(directory, MANIFEST_FILENAME), "w") as file:
+            json.dump(manifest, file, indent=2)
+
+    def load(self, directory: str):
+        """
+        Replays a recording directory written by `save`.
+        """
+        directory = abspath(expanduser(directory))
+
+        with open(join(directory, MANIFEST_FILENAME), "r") as file:
+            manifest = json.load(file)
+
+        for concept_id, records in manifest["records"].items():
+            for record in records:
+                self.add_CMR_record(concept_id, record)
+
+        for path, filename in manifest["files"].items():
+            with open(join(directory, "files", filename), "rb") as file:
+                self.add_file(path, file.read())
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args):
+        logger.debug(f"stand-in server: {format % args}")
+
+    def do_HEAD(self):
+        self.respond(body=False)
+
+    def do_GET(self):
+        self.respond(body=True)
+
+    def respond(self, body: bool):
+        server: StandInServer = self.server
+        URL = urlparse(self.path)
+        path = URL.path
+
+        with server._lock:
+            server.requests.append((self.command, path, self.headers.get("Range")))
+
+        if server.latency_seconds > 0:
+            sleep(server.latency_seconds)
+
+        if server._should_fail(path):
+            self.send_error(503, "stand-in failure")
+            return
+
+        if path.startswith(CMR_ROUTE) and path.endswith("granules.umm_json"):
+            records = server.search(parse_qs(URL.query))
+            content = json.dumps({"hits": len(records), "items": records}).encode()
+            self.send_content(content, "application/json", body)
+            return
+
+        with server._lock:
+            content = server.files.get(path)
+
+        if content is not None:
+            self.send_content(content, "application/octet-stream", body, ranged=True)
+            return
+
+        listing = server.listing(path)
+
+        if listing:
+            links = "\n".join(f'<a href="{name}">{name}</a><br>' for name in listing)
+            self.send_content(f"<html><body>\n{links}\n</body></html>".encode(), "text/html", body)
+            return
+
+        self.send_error(404)
+
+    def send_content(self, content: bytes, content_type: str, body: bool, ranged: bool = False):
+        start = 0
+        range_header = self.headers.get("Range")
+
+        if ranged and range_header and range_header.startswith("bytes="):
+            start = int(range_header[len("bytes="):].split("-")[0] or 0)
+
+            if start >= len(content):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(content)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(content) - 1}/{len(content)}")
+        else:
+            self.send_response(200)
+
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(content) - start))
+
+        if ranged:
+            self.send_header("Accept-Ranges", "bytes")
+
+        self.end_headers()
+
+        if not body:
+            return
+
+        bytes_per_second = self.server.bytes_per_second
+
+        for offset in range(start, len(content), RESPONSE_CHUNK_SIZE):
+            chunk = content[offset:offset + RESPONSE_CHUNK_SIZE]
+            self.wfile.write(chunk)
+
+            if bytes_per_second:
+                sleep(len(chunk) / bytes_per_second)
@@ -0,0 +1,158 @@
+import importlib
+import sys
+import threading
+import pytest
+import numpy as np
+from datetime import date, datetime
+from unittest.mock import Mock
+from affine import Affine
+
+# Mock all the missing dependencies before importing
+missing_modules = [
+    'harmonized_landsat_sentinel',
+    'ECOv003_exit_codes',
+    'ECOv002_CMR',
+    'ECOv002_granules',
+    'ECOv003_granules',
+    'GEOS5FP',
+    'modland',
+    'sentinel_tiles',
+    'earthaccess',
+    'colored_logging',
+    'untangle',
+]
+
+for module in missing_modules:
+    sys.modules[module] = Mock()
+
+from rasters import Raster, RasterGrid
+
+from ECOv003_L2T_STARS.AOT_provider import AOTProvider
+
+VNP43MA3 = importlib.import_module("ECOv003_L2T_STARS.VIIRS.VNP43MA3")
+
+SINUSOIDAL = "+proj=sinu +lon_0=0 +x_0=0 +y_0=0 +R=6371007.181 +units=m +no_defs"
+
+
+@pytest.fixture
+def grid():
+    return RasterGrid.from_affine(
+        Affine(926.625433, 0, -11119505.197665555, 0, -926.625433, 4447802.079066221),
+        20,
+        30,
+        crs=SINUSOIDAL
+    )
+
+
+@pytest.fixture
+def connection(grid):
+    connection = Mock()
+    connection.AOT.side_effect = lambda time_UTC, geometry, resampling: Raster(
+        np.full(geometry.shape, time_UTC.day / 100, dtype=np.float64),
+        geometry=geometry
+    )
+
+    return connection
+
+
+class TestAOTProvider:
+    """Tests for the shared GEOS-5 FP AOT cache."""
+
+    def test_memory_cache(self, grid, connection):
+        """Test that repeated requests for the same field are served from memory."""
+        provider = AOTProvider(GEOS5FP_connection=connection)
+        time_UTC = datetime(2024, 6, 1, 10, 30)
+
+        first = provider.AOT(time_UTC, grid, "cubic")
+        second = provider.AOT(time_UTC, grid, "cubic")
+
+        assert connection.AOT.call_count == 1
+        assert first.dtype == np.float32
+        np.testing.assert_array_equal(first.array, second.array)
+
+    def test_cached_field_not_modified_by_callers(self, grid, connection):
+        """Test that modifying a served raster in place leaves the cached field intact."""
+        provider = AOTProvider(GEOS5FP_connection=connection)
+        time_UTC = datetime(2024, 6, 1, 10, 30)
+        AOT = provider.AOT(time_UTC, grid, "cubic")
+
+        try:
+            AOT.array[:] = 99
+        except ValueError:
+            pass
+
+        np.testing.assert_allclose(provider.AOT(time_UTC, grid, "cubic").array, 0.01)
+        assert not provider._retrieve(time_UTC, grid, "cubic").flags.writeable
+
+    def test_concurrent_requests_retrieve_once(self, grid, connection):
+        """Test that concurrent requests for a field retrieve it once and leave no lock behind."""
+        provider = AOTProvider(GEOS5FP_connection=connection)
+        time_UTC = datetime(2024, 6, 1, 10, 30)
+        threads = [threading.Thread(target=provider.AOT, args=(time_UTC, grid, "cubic")) for _ in range(8)]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        assert connection.AOT.call_count == 1
+        assert provider._cache._building == {}
+
+    def test_disk_cache_shared_between_providers(self, tmp_path, grid, connection):
+        """Test that fields written by one provider are loaded by another without GEOS-5 FP."""
+        time_UTC = datetime(2024, 6, 2, 10, 30)
+        AOTProvider(GEOS5FP_connection=connection, AOT_directory=str(tmp_path)).AOT(time_UTC, grid, "cubic")
+
+        other_connection = Mock()
+        AOT = AOTProvider(GEOS5FP_connection=other_connection, AOT_directory=str(tmp_path)).AOT(time_UTC, grid, "cubic")
+
+        other_connection.AOT.assert_not_called()
+        np.testing.assert_allclose(AOT.array, 0.02)
+
+    def test_prefetch_reports_failures(self, grid, connection):
+        """Test that prefetch retrieves each field once and returns the requests that failed."""
+        good_time = datetime(2024, 6, 3, 10, 30)
+        bad_time = datetime(2024, 6, 4, 10, 30)
+        retrieve = connection.AOT.side_effect
+
+        def AOT(time_UTC, geometry, resampling):
+            if time_UTC == bad_time:
+                raise IOError("GEOS-5 FP unavailable")
+
+            return retrieve(time_UTC, geometry, resampling)
+
+        connection.AOT.side_effect = AOT
+        provider = AOTProvider(GEOS5FP_connection=connection)
+
+        failed = provider.prefetch([(good_time, grid), (bad_time, grid), (good_time, grid)], resampling="cubic")
+
+        assert failed == [(bad_time, grid)]
+        provider.AOT(good_time, grid, "cubic")
+        assert connection.AOT.call_count == 2
+
+
+class TestVNP43MA3PrefetchAOT:
+    """Tests for prefetching the AOT of the VNP43MA3 granules an albedo window still needs."""
+
+    def test_produced_and_unavailable_granules_skipped(self, tmp_path, monkeypatch):
+        """Test that granules with their albedo produced, or known to be unavailable, are not prefetched."""
+        monkeypatch.setattr(VNP43MA3, "find_modland_tiles", lambda geometry: ["h08v05"])
+        monkeypatch.setattr(VNP43MA3, "parsehv", lambda tile: (8, 5))
+        monkeypatch.setattr(VNP43MA3, "generate_modland_grid", lambda h, v, size: f"h{h:02d}v{v:02d}")
+
+        produced_directory = tmp_path / "albedo" / "2024.06.01"
+        produced_directory.mkdir(parents=True)
+        (produced_directory / "VNP43MA3.A2024153.h08v05.002.2024160000000_albedo.tif").touch()
+
+        connection = Mock()
+        connection.products_directory = str(tmp_path)
+        connection.albedo_product_exists = lambda date_UTC, tile: VNP43MA3.VNP43MA3.albedo_product_exists(
+            connection, date_UTC, tile)
+        connection.negative_cache.unavailable = lambda source, tile, date_UTC: date_UTC == date(2024, 6, 2)
+        connection.AOT_provider.prefetch.return_value = []
+
+        VNP43MA3.VNP43MA3.prefetch_AOT(connection, [date(2024, 6, 3), "2024-06-02", date(2024, 6, 1)], Mock())
+
+        requests = connection.AOT_provider.prefetch.call_args[0][0]
+        assert requests == [(datetime(2024, 6, 3, 10, 30), "h08v05")]
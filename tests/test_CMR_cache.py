@@ -0,0 +1,105 @@
+import sys
+import pytest
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+from unittest.mock import Mock
+
+# Mock all the missing dependencies before importing
+missing_modules = [
+    'harmonized_landsat_sentinel',
+    'ECOv003_exit_codes',
+    'ECOv002_CMR',
+    'ECOv002_granules',
+    'ECOv003_granules',
+    'GEOS5FP',
+    'modland',
+    'sentinel_tiles',
+    'earthaccess',
+    'colored_logging',
+    'untangle',
+]
+
+for module in missing_modules:
+    sys.modules[module] = Mock()
+
+from ECOv003_L2T_STARS import CMR_cache
+from ECOv003_L2T_STARS.CMR_cache import CMRCache
+
+
+def make_granule(date_UTC: date, tile: str) -> dict:
+    return {
+        "meta": {"native-id": f"VNP09GA.A{date_UTC:%Y%j}.{tile}.002"},
+        "umm": {"TemporalExtent": {"RangeDateTime": {"BeginningDateTime": f"{date_UTC:%Y-%m-%d}T00:00:00.000Z"}}},
+    }
+
+
+@pytest.fixture(autouse=True)
+def data_granule(monkeypatch):
+    earthaccess = SimpleNamespace(search=SimpleNamespace(DataGranule=lambda granule, cloud_hosted: granule))
+    monkeypatch.setattr(CMR_cache, "earthaccess", earthaccess)
+
+
+@pytest.fixture
+def query():
+    def search(start_date, end_date, target_geometry=None, tile=None):
+        dates = [start_date + timedelta(days=days) for days in range((end_date - start_date).days + 1)]
+        return [make_granule(date_UTC, tile or "h08v05") for date_UTC in dates if date_UTC.day % 2 == 0]
+
+    return Mock(side_effect=search)
+
+
+class TestCMRCache:
+    """Tests for the persistent CMR search cache."""
+
+    def test_overlapping_ranges_query_missing_dates(self, tmp_path, query):
+        """Test that a second search only queries CMR for the dates not already cached."""
+        cache = CMRCache(str(tmp_path), "C0-TEST", query)
+
+        first = cache.search(date(2024, 1, 1), date(2024, 1, 10), tile="h08v05")
+        second = cache.search(date(2024, 1, 5), date(2024, 1, 14), tile="h08v05")
+
+        assert query.call_count == 2
+        assert query.call_args.args == (date(2024, 1, 11), date(2024, 1, 14))
+        assert len(first) == 5
+        assert [granule["meta"]["native-id"] for granule in second] == [
+            make_granule(date(2024, 1, day), "h08v05")["meta"]["native-id"] for day in (6, 8, 10, 12, 14)
+        ]
+
+    def test_offline_serves_only_cache(self, tmp_path, query):
+        """Test that offline mode never queries CMR and skips uncached dates."""
+        CMRCache(str(tmp_path), "C0-TEST", query).search(date(2024, 1, 1), date(2024, 1, 4), tile="h08v05")
+        offline = CMRCache(str(tmp_path), "C0-TEST", query, offline=True)
+
+        granules = offline.search(date(2024, 1, 1), date(2024, 1, 8), tile="h08v05")
+
+        assert query.call_count == 1
+        assert len(granules) == 2
+
+    def test_expired_entries_used_when_unreachable(self, tmp_path, query):
+        """Test that expired entries are served when CMR cannot be reached."""
+        cache = CMRCache(str(tmp_path), "C0-TEST", query, past_TTL=timedelta(0))
+        cache.search(date(2024, 1, 1), date(2024, 1, 4), tile="h08v05")
+        query.side_effect = IOError("CMR unreachable")
+
+        assert len(cache.search(date(2024, 1, 1), date(2024, 1, 4), tile="h08v05")) == 2
+
+        with pytest.raises(IOError):
+            cache.search(date(2024, 1, 1), date(2024, 1, 6), tile="h08v05")
+
+    def test_recent_dates_use_short_TTL(self, tmp_path, query):
+        """Test that dates within the give-up window use the recent TTL."""
+        cache = CMRCache(str(tmp_path), "C0-TEST", query, giveup_days=4)
+        now = datetime(2024, 1, 10, 12)
+
+        assert cache.TTL(date(2024, 1, 8), now) == cache.recent_TTL
+        assert cache.TTL(date(2024, 1, 1), now) == cache.past_TTL
+
+    def test_geometry_search_caches_tiles(self, tmp_path, query):
+        """Test that a geometry search also answers later tile searches for the tiles it found."""
+        cache = CMRCache(str(tmp_path), "C0-TEST", query, tile_function=lambda granule: "h08v05")
+        cache.search(date(2024, 1, 1), date(2024, 1, 4), target_geometry=Mock(wkt="POINT (0 0)", spec=["wkt"]))
+
+        offline = CMRCache(str(tmp_path), "C0-TEST", query, offline=True)
+
+        assert len(offline.search(date(2024, 1, 2), date(2024, 1, 2), tile="h08v05")) == 1
+        assert query.call_count == 1
@@ -0,0 +1,114 @@
+import importlib
+import sys
+import pytest
+from datetime import date
+from types import SimpleNamespace
+from unittest.mock import Mock
+
+# Mock all the missing dependencies before importing
+missing_modules = [
+    'harmonized_landsat_sentinel',
+    'ECOv003_exit_codes',
+    'ECOv002_CMR',
+    'ECOv002_granules',
+    'ECOv003_granules',
+    'GEOS5FP',
+    'modland',
+    'sentinel_tiles',
+    'earthaccess',
+    'colored_logging',
+    'untangle',
+]
+
+for module in missing_modules:
+    sys.modules[module] = Mock()
+
+fine = importlib.import_module("ECOv003_L2T_STARS.HLS_fine_images")
+
+
+class HLSNotAvailable(Exception):
+    pass
+
+
+class HLSSentinelNotAvailable(Exception):
+    pass
+
+
+class HLSLandsatNotAvailable(Exception):
+    pass
+
+
+class HLSBandNotAcquired(Exception):
+    pass
+
+
+@pytest.fixture(autouse=True)
+def exceptions(monkeypatch):
+    for exception in (HLSNotAvailable, HLSSentinelNotAvailable, HLSLandsatNotAvailable, HLSBandNotAcquired):
+        monkeypatch.setattr(fine, exception.__name__, exception)
+
+
+class Image:
+    """Stands in for a raster, recording the resampling applied to it."""
+
+    def __init__(self, value):
+        self.value = value
+        self.resampling = None
+
+    def to_geometry(self, geometry, resampling):
+        self.resampling = resampling
+        return self
+
+
+def connection(sentinel, target_resolution=70):
+    def landsat(tile, date_UTC):
+        raise HLSLandsatNotAvailable(f"Landsat is not available at {tile} on {date_UTC}")
+
+    return SimpleNamespace(
+        target_resolution=target_resolution,
+        grid=Mock(),
+        sentinel=Mock(side_effect=sentinel),
+        landsat=Mock(side_effect=landsat),
+    )
+
+
+class TestHLSFineImages:
+    """Tests for deriving fine NDVI and albedo from the same HLS granules."""
+
+    def test_granules_opened_once(self):
+        """Test that NDVI and albedo on the same date share one retrieval of each sensor's granule."""
+        granule = SimpleNamespace(NDVI=Image(0.5), albedo=Image(0.2))
+        HLS_connection = connection(lambda tile, date_UTC: granule)
+        images = fine.HLSFineImages(HLS_connection)
+
+        NDVI = images.NDVI(tile="11SPS", date_UTC=date(2024, 6, 1))
+        albedo = images.albedo(tile="11SPS", date_UTC="2024-06-01")
+
+        assert NDVI.value == 0.5 and NDVI.resampling == "average"
+        assert albedo.value == 0.2
+        assert HLS_connection.sentinel.call_count == 1
+        assert HLS_connection.landsat.call_count == 1
+
+    def test_band_not_acquired(self):
+        """Test that a product whose bands one sensor did not acquire is not available, without affecting the other."""
+        class Granule:
+            NDVI = Image(0.5)
+
+            @property
+            def albedo(self):
+                raise HLSBandNotAcquired("no file found for band B05")
+
+        images = fine.HLSFineImages(connection(lambda tile, date_UTC: Granule()))
+
+        assert images.NDVI(tile="11SPS", date_UTC=date(2024, 6, 1)).value == 0.5
+
+        with pytest.raises(HLSNotAvailable):
+            images.albedo(tile="11SPS", date_UTC=date(2024, 6, 1))
+
+    def test_no_sensor(self):
+        """Test that a date without either sensor is not available."""
+        def sentinel(tile, date_UTC):
+            raise HLSSentinelNotAvailable(f"Sentinel is not available at {tile} on {date_UTC}")
+
+        with pytest.raises(HLSNotAvailable):
+            fine.HLSFineImages(connection(sentinel)).NDVI(tile="11SPS", date_UTC=date(2024, 6, 1))
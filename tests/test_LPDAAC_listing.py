@@ -0,0 +1,108 @@
+import sys
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import Mock
+
+# Mock all the missing dependencies before importing
+missing_modules = [
+    'harmonized_landsat_sentinel',
+    'ECOv003_exit_codes',
+    'ECOv002_CMR',
+    'ECOv002_granules',
+    'ECOv003_granules',
+    'GEOS5FP',
+    'modland',
+    'sentinel_tiles',
+    'earthaccess',
+    'colored_logging',
+    'untangle',
+]
+
+for module in missing_modules:
+    sys.modules[module] = Mock()
+
+from ECOv003_L2T_STARS.LPDAAC.LPDAACDataPool import LPDAACDataPool, extract_hrefs
+from stand_in_server import StandInServer
+
+PRODUCT_DIRECTORY = "VIIRS/VNP43IA4.001"
+
+
+@pytest.fixture
+def server():
+    with StandInServer() as server:
+        for day in (1, 2, 3):
+            for tile in ("h08v05", "h09v05"):
+                server.add_LPDAAC_file(
+                    f"{PRODUCT_DIRECTORY}/2024.01.0{day}/VNP43IA4.A202400{day}.{tile}.001.h5",
+                    b"VNP43IA4",
+                    "MD5"
+                )
+
+        yield server
+
+
+def listing_requests(server) -> list:
+    return [request for request in server.requests if request[1].endswith("/")]
+
+
+class TestLPDAACListing:
+    """Tests for the LP DAAC directory listing cache."""
+
+    def test_extract_hrefs(self):
+        """Test that anchor targets are extracted in document order."""
+        text = '<html><body><a href="2024.01.01/">2024.01.01/</a><A HREF="2024.01.02/">x</A><a name="top"></a></body></html>'
+
+        assert extract_hrefs(text) == ["2024.01.01/", "2024.01.02/"]
+
+    def test_listing_cached_on_disk(self, server, tmp_path):
+        """Test that a second connection reads a listing from disk instead of the data pool."""
+        URL = f"{server.LPDAAC_remote}/{PRODUCT_DIRECTORY}/2024.01.01/"
+        first = LPDAACDataPool(remote=server.LPDAAC_remote, listing_directory=str(tmp_path)).get_HTTP_listing(URL, "*.h5")
+        second = LPDAACDataPool(remote=server.LPDAAC_remote, listing_directory=str(tmp_path)).get_HTTP_listing(URL, "*.h5")
+
+        assert first == second == ["VNP43IA4.A2024001.h08v05.001.h5", "VNP43IA4.A2024001.h09v05.001.h5"]
+        assert len(listing_requests(server)) == 1
+
+    def test_listing_TTL_by_date(self):
+        """Test that only date directories past the give-up window get the long TTL."""
+        pool = LPDAACDataPool(remote="http://localhost")
+        now = datetime(2024, 1, 10, 12)
+
+        assert pool.listing_TTL(f"http://localhost/{PRODUCT_DIRECTORY}/2024.01.01", now) >= timedelta(days=1)
+        assert pool.listing_TTL(f"http://localhost/{PRODUCT_DIRECTORY}/2024.01.09", now) < timedelta(days=1)
+        assert pool.listing_TTL(f"http://localhost/{PRODUCT_DIRECTORY}", now) < timedelta(days=1)
+
+    def test_expired_listing_used_when_unreachable(self, server, tmp_path):
+        """Test that an expired listing is served when the data pool cannot be reached."""
+        URL = f"{server.LPDAAC_remote}/{PRODUCT_DIRECTORY}/2024.01.02/"
+        LPDAACDataPool(remote=server.LPDAAC_remote, listing_directory=str(tmp_path)).get_HTTP_listing(URL)
+
+        pool = LPDAACDataPool(remote=server.LPDAAC_remote, listing_directory=str(tmp_path))
+        pool.listing_TTL = lambda URL: timedelta(0)
+        server.fail_next(1, "*/2024.01.02/")
+
+        assert len(pool.get_HTTP_listing(URL, "*.h5")) == 2
+
+    def test_concurrent_listings(self, server, tmp_path):
+        """Test that a range of date directories is listed once per directory."""
+        pool = LPDAACDataPool(remote=server.LPDAAC_remote, listing_directory=str(tmp_path))
+        URLs = [f"{server.LPDAAC_remote}/{PRODUCT_DIRECTORY}/2024.01.0{day}/" for day in (1, 2, 3, 1)]
+
+        listings = pool.get_HTTP_listings(URLs)
+
+        assert list(listings) == URLs[:3]
+        assert all(len([item for item in listing if item.endswith(".h5")]) == 2 for listing in listings.values())
+        assert len(listing_requests(server)) == 3
+
+    def test_cached_listing_needs_no_connection(self, server, tmp_path):
+        """Test that a strict connection reaches the data pool only when a listing is not cached."""
+        URL = f"{server.LPDAAC_remote}/{PRODUCT_DIRECTORY}/2024.01.03/"
+        LPDAACDataPool(remote=server.LPDAAC_remote, listing_directory=str(tmp_path)).get_HTTP_listing(URL)
+        server.stop()
+
+        pool = LPDAACDataPool(remote=server.LPDAAC_remote, offline_ok=False, listing_directory=str(tmp_path))
+
+        assert len(pool.get_HTTP_listing(URL, "*.h5")) == 2
+
+        with pytest.raises(ConnectionError):
+            pool.get_HTTP_listing(f"{server.LPDAAC_remote}/{PRODUCT_DIRECTORY}/")
@@ -0,0 +1,253 @@
+import importlib
+import os
+import sys
+import threading
+import pytest
+from unittest.mock import Mock
+
+# Mock all the missing dependencies before importing
+missing_modules = [
+    'harmonized_landsat_sentinel',
+    'ECOv003_exit_codes',
+    'ECOv002_CMR',
+    'ECOv002_granules',
+    'ECOv003_granules',
+    'GEOS5FP',
+    'modland',
+    'sentinel_tiles',
+    'earthaccess',
+    'colored_logging',
+    'untangle',
+]
+
+for module in missing_modules:
+    sys.modules[module] = Mock()
+
+from ECOv003_L2T_STARS.exceptions import CMRServerUnreachable, VIIRSUnavailableError
+
+# the modules are shadowed by the functions and classes of the same name
+STARS_connections = importlib.import_module("ECOv003_L2T_STARS.STARS_connections")
+login_module = importlib.import_module("ECOv003_L2T_STARS.login")
+VNP09GA_module = importlib.import_module("ECOv003_L2T_STARS.VIIRS.VNP09GA")
+
+from ECOv003_L2T_STARS.STARS_connections import LazyHLS2Connection, STARSConnections
+
+
+class AuxiliaryServerUnreachable(Exception):
+    pass
+
+
+@pytest.fixture
+def server_unreachable(monkeypatch):
+    """Substitute real exception classes for the mocked exit codes and HLS package."""
+    monkeypatch.setattr(STARS_connections, "CMRServerUnreachable", CMRServerUnreachable)
+    monkeypatch.setattr(STARS_connections, "AuxiliaryServerUnreachable", AuxiliaryServerUnreachable)
+    monkeypatch.setattr(VNP09GA_module, "AuxiliaryServerUnreachable", AuxiliaryServerUnreachable)
+
+
+class FakeHLS2Connection:
+    """Records each connection made, standing in for the Earthdata login of HLS2Connection."""
+
+    def __init__(self, connections: list, **kwargs):
+        self.kwargs = kwargs
+        connections.append(self)
+
+    def listing(self, tile, start_UTC, end_UTC):
+        return f"listing of {tile}"
+
+
+@pytest.fixture
+def HLS_connections(monkeypatch):
+    connections = []
+    monkeypatch.setattr(
+        STARS_connections,
+        "HLS2Connection",
+        lambda **kwargs: FakeHLS2Connection(connections, **kwargs)
+    )
+
+    return connections
+
+
+@pytest.fixture
+def logins(monkeypatch):
+    logins = []
+
+    def login():
+        logins.append(object())
+        return logins[-1]
+
+    monkeypatch.delenv("SKIP_EARTHDATA_LOGIN", raising=False)
+    monkeypatch.setattr(VNP09GA_module, "login", login)
+
+    return logins
+
+
+def lazy_connection(tmp_path) -> LazyHLS2Connection:
+    return LazyHLS2Connection(
+        working_directory=str(tmp_path),
+        download_directory=str(tmp_path / "HLS2_download"),
+        target_resolution=70
+    )
+
+
+class FakeVNP09GAGranule(dict):
+    """A CMR search result for a VNP09GA granule."""
+
+    def __init__(self, URL: str, date_UTC: str):
+        super().__init__(umm={"TemporalExtent": {"RangeDateTime": {"BeginningDateTime": date_UTC}}})
+        self.URL = URL
+
+    def data_links(self):
+        return [self.URL]
+
+
+class TestLazyHLS2Connection:
+    """Test that the HLS connection logs in only when an operation needs it."""
+
+    def test_construction_does_not_connect(self, HLS_connections, tmp_path):
+        """Test that constructing the connection and computing tile grids do not log in."""
+        connection = lazy_connection(tmp_path)
+        connection.grid("11SPS", cell_size=70)
+
+        assert not connection.connected
+        assert HLS_connections == []
+
+    def test_attribute_access_connects_once(self, HLS_connections, tmp_path):
+        """Test that concurrent operations share a single connection made on first use."""
+        connection = lazy_connection(tmp_path)
+        listings = []
+
+        def list_tile():
+            listings.append(connection.listing(tile="11SPS", start_UTC=None, end_UTC=None))
+
+        threads = [threading.Thread(target=list_tile) for i in range(8)]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        assert listings == ["listing of 11SPS"] * 8
+        assert len(HLS_connections) == 1
+        assert HLS_connections[0].kwargs["download_directory"] == str(tmp_path / "HLS2_download")
+        assert connection.connected
+
+    def test_private_attribute_does_not_connect(self, HLS_connections, tmp_path):
+        """Test that attributes the connection does not define are only forwarded when public."""
+        connection = lazy_connection(tmp_path)
+
+        with pytest.raises(AttributeError):
+            connection._missing
+
+        assert HLS_connections == []
+
+    def test_missing_credentials_raise_on_first_use(self, monkeypatch, server_unreachable, tmp_path):
+        """Test that a failed login surfaces from the first operation as an auxiliary server failure."""
+        def HLS2Connection(**kwargs):
+            raise CMRServerUnreachable("missing Earthdata credentials")
+
+        monkeypatch.setattr(STARS_connections, "HLS2Connection", HLS2Connection)
+        connection = lazy_connection(tmp_path)
+
+        with pytest.raises(AuxiliaryServerUnreachable):
+            connection.listing(tile="11SPS", start_UTC=None, end_UTC=None)
+
+        assert not connection.connected
+
+
+class TestSTARSConnections:
+    """Test that the connection context defers Earthdata login until a search or download."""
+
+    def connections(self, tmp_path, **kwargs) -> STARSConnections:
+        return STARSConnections(
+            working_directory=str(tmp_path / "working"),
+            sources_directory=str(tmp_path / "sources"),
+            use_VNP43NRT=True,
+            **kwargs
+        )
+
+    def test_construction_does_not_authenticate(self, HLS_connections, logins, tmp_path):
+        """Test that building every connection logs in to neither HLS nor VIIRS."""
+        connections = self.connections(tmp_path)
+
+        assert connections.NDVI_VIIRS_connection is connections.albedo_VIIRS_connection
+        assert not connections.HLS_connection.connected
+        assert HLS_connections == []
+        assert logins == []
+
+    def test_HLS_giveup_days_reach_negative_cache(self, tmp_path):
+        """Test that the HLS latency horizon of the run decides when HLS records become permanent."""
+        connections = self.connections(tmp_path, HLS_giveup_days=3)
+
+        assert connections.negative_cache.source_giveup_days("HLS_NDVI") == 3
+
+    def test_authenticates_once(self, logins, tmp_path):
+        """Test that concurrent searches share a single Earthdata login."""
+        VNP09GA = self.connections(tmp_path).NDVI_VIIRS_connection.vnp09ga
+        threads = [threading.Thread(target=VNP09GA.authenticate) for i in range(8)]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        assert len(logins) == 1
+        assert VNP09GA.auth is logins[0]
+
+    def test_offline_does_not_authenticate(self, logins, tmp_path):
+        """Test that offline runs never log in to Earthdata."""
+        VNP09GA = self.connections(tmp_path, offline=True).NDVI_VIIRS_connection.vnp09ga
+
+        assert VNP09GA.authenticate() is None
+        assert logins == []
+
+    def test_missing_credentials_raise_on_first_use(self, monkeypatch, server_unreachable, tmp_path):
+        """Test that missing Earthdata credentials raise AuxiliaryServerUnreachable on first use, not on construction."""
+        monkeypatch.delenv("SKIP_EARTHDATA_LOGIN", raising=False)
+        monkeypatch.delenv("EARTHDATA_USERNAME", raising=False)
+        monkeypatch.delenv("EARTHDATA_PASSWORD", raising=False)
+        monkeypatch.delenv("NETRC", raising=False)
+        monkeypatch.setenv("HOME", str(tmp_path))
+        monkeypatch.setattr(login_module, "_AUTH", None)
+        monkeypatch.setattr(
+            login_module,
+            "earthaccess",
+            Mock(login=Mock(side_effect=Exception("no Earthdata credentials")))
+        )
+
+        VNP09GA = self.connections(tmp_path).NDVI_VIIRS_connection.vnp09ga
+
+        with pytest.raises(AuxiliaryServerUnreachable):
+            VNP09GA.authenticate()
+
+    def test_unreachable_search_raises_auxiliary_error(self, monkeypatch, logins, server_unreachable, tmp_path):
+        """Test that a failed CMR search is reported as an auxiliary server failure."""
+        def VIIRS_CMR_query(*args, **kwargs):
+            raise CMRServerUnreachable("CMR search server is down")
+
+        monkeypatch.setattr(VNP09GA_module, "VIIRS_CMR_query", VIIRS_CMR_query)
+        VNP09GA = self.connections(tmp_path).NDVI_VIIRS_connection.vnp09ga
+
+        with pytest.raises(AuxiliaryServerUnreachable):
+            VNP09GA._query_CMR()
+
+    def test_offline_does_not_download(self, monkeypatch, tmp_path):
+        """Test that offline runs serve granules from disk and treat the others as unavailable."""
+        VNP09GA = self.connections(tmp_path, offline=True).NDVI_VIIRS_connection.vnp09ga
+        downloads = []
+        monkeypatch.setattr(VNP09GA, "_download_scheduler", Mock(submit=lambda **kwargs: downloads.append(kwargs)))
+        URL = "https://data.lpdaac.earthdatacloud.nasa.gov/VNP09GA.A2025001.h08v05.002.2025002000000.h5"
+        granule = FakeVNP09GAGranule(URL, "2025-01-01T00:00:00Z")
+
+        with pytest.raises(VIIRSUnavailableError):
+            VNP09GA.submit_granule(granule)
+
+        filename = VNP09GA.granule_filename(granule)
+        os.makedirs(os.path.dirname(filename))
+        open(filename, "w").close()
+        VNP09GA.submit_granule(granule)
+
+        assert len(downloads) == 1
+        assert downloads[0]["filename"] == filename
@@ -0,0 +1,56 @@
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import Mock
+
+# Mock all the missing dependencies before importing
+missing_modules = [
+    'harmonized_landsat_sentinel',
+    'ECOv003_exit_codes',
+    'ECOv002_CMR',
+    'ECOv002_granules',
+    'ECOv003_granules',
+    'GEOS5FP',
+    'modland',
+    'sentinel_tiles',
+    'earthaccess',
+    'colored_logging',
+    'untangle',
+]
+
+for module in missing_modules:
+    sys.modules[module] = Mock()
+
+from ECOv003_L2T_STARS.atomic_file import read_JSON, update_JSON, write_JSON
+
+
+class TestAtomicFile:
+    """Tests for the JSON files shared by concurrent processes."""
+
+    def test_write_and_read(self, tmp_path):
+        """Test that a written file is read back, with no temporary file left behind."""
+        filename = str(tmp_path / "records" / "11SPS.json")
+        write_JSON(filename, {"2024-06-01": {"pixels": 120}}, indent=1)
+
+        assert read_JSON(filename) == {"2024-06-01": {"pixels": 120}}
+        assert os.listdir(tmp_path / "records") == ["11SPS.json"]
+
+    def test_unreadable_file_ignored(self, tmp_path):
+        """Test that a missing or corrupt file reads as None."""
+        filename = tmp_path / "corrupt.json"
+        filename.write_text("{\"truncated\": ")
+
+        assert read_JSON(str(filename)) is None
+        assert read_JSON(str(tmp_path / "missing.json")) is None
+
+    def test_concurrent_updates_kept(self, tmp_path):
+        """Test that concurrent updates of the same file each keep their record."""
+        filename = str(tmp_path / "records.json")
+
+        def update(index: int):
+            update_JSON(filename, lambda records: records.update({str(index): index}))
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(update, range(8)))
+
+        assert read_JSON(filename) == {str(index): index for index in range(8)}
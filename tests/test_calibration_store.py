@@ -0,0 +1,213 @@
+import importlib
+import sys
+import numpy as np
+from datetime import date
+from os.path import join
+from unittest.mock import Mock
+
+# Mock all the missing dependencies before importing
+missing_modules = [
+    'harmonized_landsat_sentinel',
+    'ECOv003_exit_codes',
+    'ECOv002_CMR',
+    'ECOv002_granules',
+    'ECOv003_granules',
+    'GEOS5FP',
+    'modland',
+    'sentinel_tiles',
+    'earthaccess',
+    'colored_logging',
+    'untangle',
+]
+
+for module in missing_modules:
+    sys.modules[module] = Mock()
+
+calibration = importlib.import_module("ECOv003_L2T_STARS.calibrate_fine_to_coarse")
+generate_STARS_inputs = importlib.import_module("ECOv003_L2T_STARS.generate_STARS_inputs")
+from ECOv003_L2T_STARS.calibration_store import CalibrationStore
+from ECOv003_L2T_STARS.constants import CALIBRATION_DIRECTORY
+from ECOv003_L2T_STARS.generate_downsampled_filename import generate_downsampled_filename
+
+
+class FakeImage:
+    """Stand-in for a raster image that records the values written to its file."""
+
+    def __init__(self, array):
+        self.array = np.asarray(array, dtype=np.float64)
+
+    def __array__(self, dtype=None, copy=None):
+        return self.array if dtype is None else self.array.astype(dtype)
+
+    def __mul__(self, other):
+        return FakeImage(self.array * other)
+
+    def __add__(self, other):
+        return FakeImage(self.array + other)
+
+    def to_geotiff(self, filename):
+        with open(filename, "wb") as file:
+            np.save(file, self.array)
+
+
+class TestCalibrationStore:
+    """Tests for the persistent record of calibration coefficients."""
+
+    def test_record_persists(self, tmp_path):
+        """Test that recorded coefficients are found by a new store over the same directory."""
+        CalibrationStore(str(tmp_path)).record("11SPS", "NDVI", date(2024, 6, 1), 1.1, -0.02, 0.9, 120)
+        CalibrationStore(str(tmp_path)).record("11SPS", "NDVI", "2024-06-02", 0.9, 0.01, 0.8, 12, pooled=True)
+        store = CalibrationStore(str(tmp_path))
+
+        assert store.get("11SPS", "NDVI", "2024-06-01")["slope"] == 1.1
+        assert store.get("11SPS", "NDVI", date(2024, 6, 2))["pooled"]
+        assert store.get("11SPS", "albedo", date(2024, 6, 1)) is None
+
+    def test_samples_persist(self, tmp_path):
+        """Test that the values a date was fitted on are found by a new store over the same directory."""
+        CalibrationStore(str(tmp_path)).record_samples("11SPS", "NDVI", date(2024, 6, 1), np.arange(4), np.ones(4))
+        store = CalibrationStore(str(tmp_path))
+        x, y = store.samples("11SPS", "NDVI", "2024-06-01")
+
+        np.testing.assert_array_equal(x, np.arange(4))
+        np.testing.assert_array_equal(y, np.ones(4))
+        assert store.samples("11SPS", "NDVI", date(2024, 6, 2)) is None
+
+
+class TestPooledCalibrationWindow:
+    """Tests for the pooled calibration of the staging loop over a window partly fitted by an earlier run."""
+
+    def test_recorded_dates_enter_pool(self, tmp_path, monkeypatch):
+        """Test that a sparse date is calibrated by a fit pooled with the dates recorded by an earlier run."""
+        tile = "11SPS"
+        recorded_date = date(2024, 6, 1)
+        sparse_date = date(2024, 6, 2)
+        downsampled_directory = str(tmp_path)
+        store = generate_STARS_inputs.get_calibration_store(join(downsampled_directory, CALIBRATION_DIRECTORY))
+
+        # the earlier run fitted and staged the first date of the window
+        recorded_x = np.linspace(0, 1, 100)
+        store.record(tile, "NDVI", recorded_date, 2, 1, 1, 100)
+        store.record_samples(tile, "NDVI", recorded_date, recorded_x, 2 * recorded_x + 1)
+
+        for variable, resolution in (("NDVI", 30), ("albedo", 30)):
+            open(generate_downsampled_filename(downsampled_directory, variable, recorded_date, tile, resolution), "wb").close()
+
+        # the second date has too few valid pixels to be fitted alone
+        sparse_fine = np.full(100, np.nan)
+        sparse_fine[:5] = np.linspace(0, 1, 5)
+
+        monkeypatch.setattr(generate_STARS_inputs, "HLSFineImages", Mock())
+        monkeypatch.setattr(generate_STARS_inputs, "generate_NDVI_coarse_image",
+                            lambda **kwargs: FakeImage(2 * sparse_fine + 1))
+        monkeypatch.setattr(generate_STARS_inputs, "generate_albedo_coarse_image",
+                            lambda **kwargs: FakeImage(np.full(100, np.nan)))
+        monkeypatch.setattr(generate_STARS_inputs, "generate_NDVI_fine_image", lambda **kwargs: FakeImage(sparse_fine))
+        monkeypatch.setattr(generate_STARS_inputs, "generate_albedo_fine_image",
+                            lambda **kwargs: FakeImage(np.full(100, np.nan)))
+        monkeypatch.setattr(generate_STARS_inputs, "aggregate_fine_to_coarse",
+                            lambda fine_image, coarse_image, indices_directory: np.array(fine_image))
+
+        generate_STARS_inputs.generate_STARS_inputs(
+            tile=tile,
+            date_UTC=sparse_date,
+            HLS_start_date=recorded_date,
+            HLS_end_date=sparse_date,
+            VIIRS_start_date=recorded_date,
+            VIIRS_end_date=sparse_date,
+            NDVI_resolution=490,
+            albedo_resolution=980,
+            target_resolution=30,
+            NDVI_coarse_geometry=None,
+            albedo_coarse_geometry=None,
+            downsampled_directory=downsampled_directory,
+            HLS_connection=None,
+            NDVI_VIIRS_connection=None,
+            albedo_VIIRS_connection=None,
+            calibrate_fine=True,
+            pooled_calibration=True,
+        )
+
+        coefficients = store.get(tile, "NDVI", sparse_date)
+
+        assert coefficients["pooled"]
+        assert coefficients["pixels"] == 105
+        assert np.isclose(coefficients["slope"], 2) and np.isclose(coefficients["intercept"], 1)
+
+        sparse_fine_filename = generate_downsampled_filename(downsampled_directory, "NDVI", sparse_date, tile, 30)
+        np.testing.assert_allclose(np.load(sparse_fine_filename)[:5], 2 * sparse_fine[:5] + 1)
+
+
+class TestFitCalibrations:
+    """Tests for the vectorized per-date and pooled calibration fits."""
+
+    def test_per_date_fits(self):
+        """Test that each row is fitted as linear regression would, and sparse rows are left unfitted."""
+        rng = np.random.default_rng(0)
+        x = rng.uniform(0, 1, (3, 100))
+        y = x * np.array([[1.2], [0.8], [1.0]]) + np.array([[0.1], [-0.05], [0.0]])
+        x[2, 20:] = np.nan
+
+        slope, intercept, r_squared, pixels = calibration.fit_calibrations(x, y)
+
+        np.testing.assert_allclose(slope[:2], [1.2, 0.8])
+        np.testing.assert_allclose(intercept[:2], [0.1, -0.05], atol=1e-12)
+        np.testing.assert_allclose(r_squared[:2], [1.0, 1.0])
+        assert list(pixels) == [100, 100, 20]
+        assert np.isnan(slope[2]) and np.isnan(intercept[2])
+
+    def test_pooled_fit(self):
+        """Test that the pooled fit combines the valid pairs of every date."""
+        x = np.array([np.linspace(0, 1, 20), np.linspace(1, 2, 20)])
+        y = 2 * x + 1
+
+        slope, intercept, r_squared, pixels = calibration.fit_pooled_calibration(x, y)
+
+        assert pixels == 40
+        assert np.isclose(slope, 2) and np.isclose(intercept, 1)
+
+    def test_unreadable_samples_saved_uncalibrated(self, tmp_path, monkeypatch):
+        """Test that deferred fine images are saved uncalibrated when no date of the window has readable samples."""
+        tile = "11SPS"
+        sparse_date = date(2024, 6, 2)
+        downsampled_directory = str(tmp_path)
+        sparse_fine = np.full(100, np.nan)
+        sparse_fine[:5] = np.linspace(0, 1, 5)
+
+        monkeypatch.setattr(CalibrationStore, "samples", lambda self, tile, product, date_UTC: None)
+        monkeypatch.setattr(generate_STARS_inputs, "HLSFineImages", Mock())
+        monkeypatch.setattr(generate_STARS_inputs, "generate_NDVI_coarse_image",
+                            lambda **kwargs: FakeImage(2 * sparse_fine + 1))
+        monkeypatch.setattr(generate_STARS_inputs, "generate_albedo_coarse_image",
+                            lambda **kwargs: FakeImage(np.full(100, np.nan)))
+        monkeypatch.setattr(generate_STARS_inputs, "generate_NDVI_fine_image", lambda **kwargs: FakeImage(sparse_fine))
+        monkeypatch.setattr(generate_STARS_inputs, "generate_albedo_fine_image",
+                            lambda **kwargs: FakeImage(np.full(100, np.nan)))
+        monkeypatch.setattr(generate_STARS_inputs, "aggregate_fine_to_coarse",
+                            lambda fine_image, coarse_image, indices_directory: np.array(fine_image))
+
+        generate_STARS_inputs.generate_STARS_inputs(
+            tile=tile,
+            date_UTC=sparse_date,
+            HLS_start_date=sparse_date,
+            HLS_end_date=sparse_date,
+            VIIRS_start_date=sparse_date,
+            VIIRS_end_date=sparse_date,
+            NDVI_resolution=490,
+            albedo_resolution=980,
+            target_resolution=30,
+            NDVI_coarse_geometry=None,
+            albedo_coarse_geometry=None,
+            downsampled_directory=downsampled_directory,
+            HLS_connection=None,
+            NDVI_VIIRS_connection=None,
+            albedo_VIIRS_connection=None,
+            calibrate_fine=True,
+            pooled_calibration=True,
+        )
+
+        store = generate_STARS_inputs.get_calibration_store(join(downsampled_directory, CALIBRATION_DIRECTORY))
+        sparse_fine_filename = generate_downsampled_filename(downsampled_directory, "NDVI", sparse_date, tile, 30)
+
+        assert store.get(tile, "NDVI", sparse_date) is None
+        np.testing.assert_allclose(np.load(sparse_fine_filename), sparse_fine)
@@ -0,0 +1,90 @@
+import sys
+import pytest
+from datetime import date, timedelta
+from types import SimpleNamespace
+from unittest.mock import Mock
+
+# Mock all the missing dependencies before importing
+missing_modules = [
+    'harmonized_landsat_sentinel',
+    'ECOv003_exit_codes',
+    'ECOv002_CMR',
+    'ECOv002_granules',
+    'ECOv003_granules',
+    'GEOS5FP',
+    'modland',
+    'sentinel_tiles',
+    'earthaccess',
+    'colored_logging',
+    'untangle',
+]
+
+for module in missing_modules:
+    sys.modules[module] = Mock()
+
+from ECOv003_L2T_STARS import check_VIIRS_availability as preflight
+from ECOv003_L2T_STARS.generate_downsampled_filename import generate_downsampled_filename
+
+TODAY = date(2024, 6, 20)
+
+
+class AuxiliaryLatency(Exception):
+    pass
+
+
+@pytest.fixture(autouse=True)
+def latency(monkeypatch):
+    monkeypatch.setattr(preflight, "AuxiliaryLatency", AuxiliaryLatency)
+
+
+def make_connection(input_days: int, missing: list):
+    return SimpleNamespace(
+        INPUT_DAYS=input_days,
+        missing_dates=Mock(side_effect=lambda start, end, geometry: [d for d in missing if start <= d <= end])
+    )
+
+
+def check(tmp_path, connection):
+    preflight.check_VIIRS_availability(
+        tile="11SPS",
+        geometry=None,
+        VIIRS_start_date=TODAY - timedelta(days=7),
+        VIIRS_end_date=TODAY,
+        NDVI_resolution=490,
+        albedo_resolution=980,
+        downsampled_directory=str(tmp_path),
+        NDVI_VIIRS_connection=connection,
+        albedo_VIIRS_connection=connection,
+        giveup_days=4,
+        today=TODAY,
+    )
+
+
+class TestCheckVIIRSAvailability:
+    """Tests for the VIIRS availability preflight."""
+
+    def test_recent_missing_input_raises(self, tmp_path):
+        """Test that a missing input within the give-up window raises before processing."""
+        connection = make_connection(16, [TODAY - timedelta(days=2)])
+
+        with pytest.raises(AuxiliaryLatency):
+            check(tmp_path, connection)
+
+        start_date, end_date, _ = connection.missing_dates.call_args.args
+        assert start_date == TODAY - timedelta(days=4)
+        assert end_date == TODAY
+
+    def test_old_missing_input_ignored(self, tmp_path):
+        """Test that inputs missing beyond the give-up window do not prevent the run."""
+        check(tmp_path, make_connection(16, [TODAY - timedelta(days=6)]))
+
+    def test_staged_dates_not_checked(self, tmp_path):
+        """Test that dates whose coarse images are already staged need no metadata lookup."""
+        for processing_date in [TODAY - timedelta(days=days) for days in range(8)]:
+            for variable, resolution in (("NDVI", 490), ("albedo", 980)):
+                open(generate_downsampled_filename(str(tmp_path), variable, processing_date, "11SPS", resolution), "w").close()
+
+        connection = make_connection(0, [TODAY])
+        check(tmp_path, connection)
+
+        assert connection.missing_dates.call_count == 0
@@ -0,0 +1,138 @@
+import sys
+import json
+import os
+import subprocess
+import threading
+import pytest
+from time import sleep
+from unittest.mock import Mock
+
+# Mock all the missing dependencies before importing
+missing_modules = [
+    'harmonized_landsat_sentinel',
+    'ECOv003_exit_codes',
+    'ECOv002_CMR',
+    'ECOv002_granules',
+    'ECOv003_granules',
+    'GEOS5FP',
+    'modland',
+    'sentinel_tiles',
+    'earthaccess',
+    'colored_logging',
+    'untangle',
+]
+
+for module in missing_modules:
+    sys.modules[module] = Mock()
+
+from ECOv003_L2T_STARS.file_lock import FileLock, LockTimeout
+
+
+class TestFileLock:
+    """Tests for advisory file locks on shared source directories."""
+
+    def test_waiter_reuses_result(self, tmp_path):
+        """Test that a thread finding work in flight waits and then sees the result."""
+        filename = str(tmp_path / "granule.tif")
+        produced = []
+
+        def produce():
+            with FileLock(filename, poll_seconds=0.01):
+                if os.path.exists(filename):
+                    return
+
+                sleep(0.2)
+                open(filename, "w").close()
+                produced.append(threading.get_ident())
+
+        threads = [threading.Thread(target=produce) for _ in range(4)]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        assert len(produced) == 1
+        assert not os.path.exists(f"{filename}.lock")
+
+    def test_lock_of_killed_process_released(self, tmp_path):
+        """Test that a lock held by a process that is killed is acquired without waiting for it to go stale."""
+        filename = str(tmp_path / "granule.tif")
+        lock_filename = FileLock(filename).lock_filename
+        process = subprocess.Popen(
+            [
+                sys.executable, "-c",
+                "import fcntl, json, os, time\n"
+                f"file = open({lock_filename!r}, 'w')\n"
+                "fcntl.flock(file, fcntl.LOCK_EX)\n"
+                "json.dump({'pid': os.getpid()}, file)\n"
+                "file.flush()\n"
+                "print('locked', flush=True)\n"
+                "time.sleep(60)\n"
+            ],
+            stdout=subprocess.PIPE,
+            text=True
+        )
+
+        try:
+            assert process.stdout.readline().strip() == "locked"
+            assert FileLock(filename).owner["pid"] == process.pid
+
+            with pytest.raises(LockTimeout):
+                FileLock(filename, timeout_seconds=0.05, poll_seconds=0.01).acquire()
+        finally:
+            process.kill()
+            process.wait()
+
+        lock = FileLock(filename, timeout_seconds=5, poll_seconds=0.01)
+
+        with lock:
+            assert lock.owner["pid"] == os.getpid()
+
+    def test_leftover_lock_file_acquired(self, tmp_path):
+        """Test that a lock file nobody holds does not block the next process."""
+        lock = FileLock(str(tmp_path / "granule.tif"), timeout_seconds=5, poll_seconds=0.01)
+
+        with open(lock.lock_filename, "w") as file:
+            json.dump({"host": "elsewhere", "pid": 1}, file)
+
+        assert not lock.acquire()
+        assert lock.owner["pid"] == os.getpid()
+        lock.release()
+        assert not os.path.exists(lock.lock_filename)
+
+    def test_release_during_wait_not_shared(self, tmp_path):
+        """Test that waiters racing for a released lock never hold it at the same time."""
+        filename = str(tmp_path / "granule.tif")
+        holders = []
+        overlaps = []
+
+        def work():
+            for _ in range(20):
+                with FileLock(filename, poll_seconds=0.001):
+                    holders.append(threading.get_ident())
+
+                    if len(holders) > 1:
+                        overlaps.append(list(holders))
+
+                    sleep(0.001)
+                    holders.remove(threading.get_ident())
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        assert overlaps == []
+
+    def test_timeout(self, tmp_path):
+        """Test that waiting on a live lock gives up after the timeout."""
+        filename = str(tmp_path / "granule.tif")
+
+        with FileLock(filename):
+            with pytest.raises(LockTimeout):
+                FileLock(filename, timeout_seconds=0.05, poll_seconds=0.01).acquire()
@@ -0,0 +1,162 @@
+import os
+import sys
+import pytest
+import numpy as np
+from unittest.mock import Mock
+from affine import Affine
+
+# Mock all the missing dependencies before importing
+missing_modules = [
+    'harmonized_landsat_sentinel',
+    'ECOv003_exit_codes',
+    'ECOv002_CMR',
+    'ECOv002_granules',
+    'ECOv003_granules',
+    'GEOS5FP',
+    'modland',
+    'sentinel_tiles',
+    'earthaccess',
+    'colored_logging',
+    'untangle',
+]
+
+for module in missing_modules:
+    sys.modules[module] = Mock()
+
+from rasters import Raster, RasterGrid
+
+from ECOv003_L2T_STARS.grid_indices import grid_key, grid_latlon, grid_row_latitude, get_aggregation_operator
+from ECOv003_L2T_STARS.calibrate_fine_to_coarse import aggregate_fine_to_coarse
+from ECOv003_L2T_STARS.BRDF.SZA import calculate_SZA, SZA_deg_from_lat_dec_hour, solar_dec_deg_from_day_angle_rad, \
+    day_angle_rad_from_doy
+
+SINUSOIDAL = "+proj=sinu +lon_0=0 +x_0=0 +y_0=0 +R=6371007.181 +units=m +no_defs"
+
+
+def sinusoidal_grid(rows: int = 120) -> RasterGrid:
+    cell_size = 1111950.5197665554 / rows
+    return RasterGrid.from_affine(
+        Affine(cell_size, 0, -11119505.197665555, 0, -cell_size, 4447802.079066221),
+        rows,
+        rows,
+        crs=SINUSOIDAL
+    )
+
+
+class TestGridIndices:
+    """Tests for the cached per-grid lat/lon indices."""
+
+    def test_grid_key_is_stable(self):
+        """Test that identical grids share a key and different grids do not."""
+        assert grid_key(sinusoidal_grid()) == grid_key(sinusoidal_grid())
+        assert grid_key(sinusoidal_grid()) != grid_key(sinusoidal_grid(60))
+
+    def test_latlon_written_and_memory_mapped(self, tmp_path):
+        """Test that lat/lon are stored once under the indices directory and opened memory-mapped."""
+        grid = sinusoidal_grid()
+        lat, lon = grid_latlon(grid, indices_directory=str(tmp_path))
+        grid_directory = tmp_path / grid_key(grid)
+
+        assert (grid_directory / "lat.npy").exists()
+        assert (grid_directory / "lon.npy").exists()
+        assert isinstance(lat, np.memmap)
+        np.testing.assert_allclose(lat, grid.lat)
+        np.testing.assert_allclose(lon, grid.lon)
+
+    def test_sinusoidal_row_latitude(self, tmp_path):
+        """Test that sinusoidal latitude is resolved as one value per row."""
+        grid = sinusoidal_grid()
+        row_lat = grid_row_latitude(grid, indices_directory=str(tmp_path))
+
+        assert row_lat.shape == (grid.rows,)
+        np.testing.assert_allclose(row_lat, grid.lat[:, 0])
+
+
+def UTM_grid(cell_size: float, size: int) -> RasterGrid:
+    return RasterGrid.from_affine(Affine(cell_size, 0, 600000, 0, -cell_size, 4000000), size, size, crs="EPSG:32611")
+
+
+class TestAggregationOperator:
+    """Tests for the cached fine-to-coarse aggregation operator."""
+
+    def test_aggregate_matches_block_mean(self, tmp_path):
+        """Test that aggregation averages the valid fine pixels of each coarse cell and is stored once."""
+        fine_grid = UTM_grid(70, 14)
+        coarse_grid = UTM_grid(490, 2)
+        fine = np.arange(14 * 14, dtype=np.float64).reshape(14, 14)
+        fine[:7, :7] = np.nan
+        fine[7, 7] = np.nan
+
+        operator = get_aggregation_operator(fine_grid, coarse_grid, indices_directory=str(tmp_path))
+        aggregated = operator.aggregate(fine)
+        blocks = fine.reshape(2, 7, 2, 7).transpose(0, 2, 1, 3).reshape(2, 2, 49)
+
+        assert np.isnan(aggregated[0, 0])
+
+        for row, col in ((0, 1), (1, 0), (1, 1)):
+            np.testing.assert_allclose(aggregated[row, col], np.nanmean(blocks[row, col]))
+
+        assert (tmp_path / grid_key(fine_grid) / f"aggregation_{grid_key(coarse_grid)}.npy").exists()
+
+    def test_pixels_outside_coarse_grid_ignored(self):
+        """Test that fine pixels whose centers lie outside the coarse grid are left out of the aggregation."""
+        operator = get_aggregation_operator(UTM_grid(70, 15), UTM_grid(490, 2))
+        fine = np.ones((15, 15))
+        # the last fine row and column lie outside the coarse grid
+        fine[14, :] = 100
+        fine[:, 14] = 100
+
+        np.testing.assert_allclose(operator.aggregate(fine), np.ones((2, 2)))
+
+    def test_different_projections_rejected(self):
+        """Test that grids in different projections have no aggregation operator."""
+        with pytest.raises(ValueError):
+            get_aggregation_operator(UTM_grid(70, 14), sinusoidal_grid())
+
+    def test_non_integral_ratio_rejected(self):
+        """Test that a coarse resolution that is not a multiple of the fine resolution has no aggregation operator."""
+        with pytest.raises(ValueError):
+            get_aggregation_operator(UTM_grid(70, 14), UTM_grid(500, 2))
+
+    def test_misaligned_origin_rejected(self, tmp_path):
+        """Test that a coarse grid offset by part of a fine pixel has no aggregation operator, even with a stored index."""
+        fine_grid = UTM_grid(70, 14)
+        coarse_grid = UTM_grid(490, 2)
+        get_aggregation_operator(fine_grid, coarse_grid, indices_directory=str(tmp_path))
+        misaligned_grid = RasterGrid.from_affine(
+            Affine(490, 0, 600035, 0, -490, 4000000), 2, 2, crs="EPSG:32611"
+        )
+
+        with pytest.raises(ValueError):
+            get_aggregation_operator(fine_grid, misaligned_grid, indices_directory=str(tmp_path))
+
+    def test_misaligned_grids_average_resampled(self):
+        """Test that calibration aggregates grids that are not nested with the average warp."""
+        fine_grid = UTM_grid(70, 14)
+        coarse_grid = RasterGrid.from_affine(Affine(490, 0, 600035, 0, -490, 4000000), 2, 2, crs="EPSG:32611")
+        fine_image = Raster(np.ones((14, 14), dtype=np.float32), geometry=fine_grid)
+        coarse_image = Raster(np.ones((2, 2), dtype=np.float32), geometry=coarse_grid)
+
+        aggregated = aggregate_fine_to_coarse(fine_image, coarse_image)
+
+        assert aggregated.shape == (2, 2)
+        np.testing.assert_allclose(aggregated[np.isfinite(aggregated)], 1)
+
+
+class TestCalculateSZA:
+    """Tests for the row-broadcast solar zenith angle."""
+
+    @pytest.mark.parametrize("indices_directory", [None, "indices"])
+    def test_matches_full_grid_calculation(self, tmp_path, indices_directory):
+        """Test that row-broadcast SZA matches the per-pixel calculation."""
+        grid = sinusoidal_grid()
+
+        if indices_directory is not None:
+            indices_directory = str(tmp_path / indices_directory)
+
+        SZA = calculate_SZA(172, 10.5, grid, indices_directory=indices_directory)
+        dec = solar_dec_deg_from_day_angle_rad(day_angle_rad_from_doy(172))
+        expected = SZA_deg_from_lat_dec_hour(grid.lat, dec, 10.5)
+
+        assert SZA.shape == grid.shape
+        np.testing.assert_allclose(np.array(SZA), expected, atol=1e-10)
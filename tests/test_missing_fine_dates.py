@@ -0,0 +1,70 @@
+import importlib
+import sys
+from datetime import date, timedelta
+from unittest.mock import Mock
+
+# Mock all the missing dependencies before importing
+missing_modules = [
+    'harmonized_landsat_sentinel',
+    'ECOv003_exit_codes',
+    'ECOv002_CMR',
+    'ECOv002_granules',
+    'ECOv003_granules',
+    'GEOS5FP',
+    'modland',
+    'sentinel_tiles',
+    'earthaccess',
+    'colored_logging',
+    'untangle',
+]
+
+for module in missing_modules:
+    sys.modules[module] = Mock()
+
+missing_fine_dates = importlib.import_module("ECOv003_L2T_STARS.missing_fine_dates")
+from ECOv003_L2T_STARS.generate_downsampled_filename import generate_downsampled_filename
+from ECOv003_L2T_STARS.negative_cache import NegativeCache
+
+START_DATE = date(2024, 6, 1)
+END_DATE = date(2024, 6, 3)
+
+
+def stage(tmp_path, variable, date_UTC):
+    open(generate_downsampled_filename(str(tmp_path), variable, date_UTC, "11SPS", 70), "wb").close()
+
+
+def find(tmp_path, negative_cache=None):
+    return missing_fine_dates.missing_fine_dates(
+        tile="11SPS",
+        HLS_start_date=START_DATE,
+        HLS_end_date=END_DATE,
+        target_resolution=70,
+        downsampled_directory=str(tmp_path),
+        negative_cache=negative_cache,
+    )
+
+
+class TestMissingFineDates:
+    """Tests for finding the dates whose fine images still have to be produced from HLS."""
+
+    def test_staged_dates_not_missing(self, tmp_path):
+        """Test that only dates without both fine images staged are missing."""
+        for variable in ("NDVI", "albedo"):
+            stage(tmp_path, variable, START_DATE)
+
+        stage(tmp_path, "NDVI", START_DATE + timedelta(days=1))
+
+        assert find(tmp_path) == [START_DATE + timedelta(days=1), END_DATE]
+
+    def test_unavailable_dates_not_missing(self, tmp_path):
+        """Test that dates recorded as unavailable in HLS are not produced again."""
+        negative_cache = NegativeCache(str(tmp_path / "unavailable"))
+
+        for processing_date in (START_DATE, START_DATE + timedelta(days=1)):
+            for variable in ("NDVI", "albedo"):
+                negative_cache.record(f"HLS_{variable}", "11SPS", processing_date, "no granules")
+
+        stage(tmp_path, "NDVI", END_DATE)
+        stage(tmp_path, "albedo", END_DATE)
+
+        assert find(tmp_path, negative_cache) == []
@@ -0,0 +1,108 @@
+import importlib
+import sys
+from os.path import exists, samefile
+from datetime import date
+from unittest.mock import Mock, patch
+
+# Mock all the missing dependencies before importing
+missing_modules = [
+    'harmonized_landsat_sentinel',
+    'ECOv003_exit_codes',
+    'ECOv002_CMR',
+    'ECOv002_granules',
+    'ECOv003_granules',
+    'GEOS5FP',
+    'modland',
+    'sentinel_tiles',
+    'earthaccess',
+    'colored_logging',
+    'untangle',
+]
+
+for module in missing_modules:
+    sys.modules[module] = Mock()
+
+store_module = importlib.import_module("ECOv003_L2T_STARS.model_state_store")
+load_prior_module = importlib.import_module("ECOv003_L2T_STARS.load_prior")
+
+PRODUCT = "ECOv003_L2T_STARS_11SPS_20240601_0700_01.zip"
+
+
+def posterior(tmp_path, date_UTC):
+    directory = tmp_path / "posterior" / date_UTC.isoformat()
+    directory.mkdir(parents=True)
+    filenames = {}
+
+    for variable in store_module.MODEL_STATE_VARIABLES:
+        filename = directory / f"{variable}.tif"
+        filename.write_text(f"{variable} {date_UTC}")
+        filenames[variable] = str(filename)
+
+    return filenames
+
+
+class TestModelStateStore:
+    """Tests for keeping the latest posterior of each tile as the prior of the next run."""
+
+    def test_save_and_load(self, tmp_path):
+        """Test that a saved posterior is loaded for its product only, and replaces the previous state."""
+        store = store_module.ModelStateStore(str(tmp_path / "model"))
+        first = posterior(tmp_path, date(2024, 5, 31))
+        second = posterior(tmp_path, date(2024, 6, 1))
+
+        store.save("11SPS", date(2024, 5, 31), 70, "previous.zip", first)
+        store.save("11SPS", date(2024, 6, 1), 70, f"/products/{PRODUCT}", second, move=True)
+        state = store.load("11SPS", PRODUCT, 70)
+
+        assert state["date_UTC"] == date(2024, 6, 1)
+        assert open(state["filenames"]["NDVI.bias"]).read() == "NDVI.bias 2024-06-01"
+        assert all(f.startswith(str(tmp_path / "model" / "11SPS" / "2024-06-01")) for f in state["filenames"].values())
+        assert not any(exists(f) for f in second.values())
+        assert [p.name for p in (tmp_path / "model" / "11SPS" / "latest").iterdir() if p.is_dir()] == ["2024-06-01"]
+        assert store.load("11SPS", "previous.zip", 70) is None
+        assert store.load("11SPS", PRODUCT, 30) is None
+        assert store.load("11SLT", PRODUCT, 70) is None
+
+    def test_kept_posterior_linked(self, tmp_path):
+        """Test that a kept posterior is linked into the store rather than copied."""
+        store = store_module.ModelStateStore(str(tmp_path / "model"))
+        filenames = posterior(tmp_path, date(2024, 6, 1))
+
+        store.save("11SPS", date(2024, 6, 1), 70, PRODUCT, filenames)
+        state_directory = tmp_path / "model" / "11SPS" / "latest" / "2024-06-01"
+
+        assert all(exists(f) for f in filenames.values())
+        assert all(
+            any(samefile(f, state_filename) for state_filename in state_directory.iterdir())
+            for f in filenames.values()
+        )
+
+    def test_loaded_prior_outlives_replaced_state(self, tmp_path):
+        """Test that a prior loaded by one run stays readable after another run replaces the state."""
+        store = store_module.ModelStateStore(str(tmp_path / "model"))
+        store.save("11SPS", date(2024, 5, 31), 70, PRODUCT, posterior(tmp_path, date(2024, 5, 31)), move=True)
+        state = store.load("11SPS", PRODUCT, 70)
+
+        store.save("11SPS", date(2024, 6, 1), 70, "next.zip", posterior(tmp_path, date(2024, 6, 1)), move=True)
+
+        assert not (tmp_path / "model" / "11SPS" / "latest" / "2024-05-31").exists()
+        assert open(state["filenames"]["albedo"]).read() == "albedo 2024-05-31"
+
+    @patch.object(load_prior_module, "L2TSTARS", side_effect=AssertionError("prior zip opened"))
+    def test_load_prior_from_model_state(self, mock_l2tstars, tmp_path):
+        """Test that the prior is read from the model state without opening the prior product."""
+        model_directory = str(tmp_path / "model")
+        store_module.get_model_state_store(model_directory).save(
+            "11SPS", date(2024, 6, 1), 70, PRODUCT, posterior(tmp_path, date(2024, 6, 1)))
+
+        prior = load_prior_module.load_prior(
+            tile="11SPS",
+            target_resolution=70,
+            model_directory=model_directory,
+            L2T_STARS_prior_filename=str(tmp_path / PRODUCT)
+        )
+
+        assert prior.using_prior is True
+        assert prior.prior_date_UTC == date(2024, 6, 1)
+        assert prior.prior_albedo_UQ_filename.endswith("STARS_albedo.UQ_2024-06-01_11SPS_70m.tif")
+        mock_l2tstars.assert_not_called()
@@ -0,0 +1,86 @@
+import sys
+import pytest
+from datetime import date, datetime, timedelta
+from unittest.mock import Mock
+
+# Mock all the missing dependencies before importing
+missing_modules = [
+    'harmonized_landsat_sentinel',
+    'ECOv003_exit_codes',
+    'ECOv002_CMR',
+    'ECOv002_granules',
+    'ECOv003_granules',
+    'GEOS5FP',
+    'modland',
+    'sentinel_tiles',
+    'earthaccess',
+    'colored_logging',
+    'untangle',
+]
+
+for module in missing_modules:
+    sys.modules[module] = Mock()
+
+from ECOv003_L2T_STARS.constants import HLS_GIVEUP_DAYS
+from ECOv003_L2T_STARS.negative_cache import NegativeCache, get_negative_cache
+
+
+class TestNegativeCache:
+    """Tests for the persistent record of unavailable source dates."""
+
+    def test_record_persists(self, tmp_path):
+        """Test that a record made by one cache is seen by another on the same directory."""
+        NegativeCache(str(tmp_path)).record("HLS_NDVI", "11SPS", date(2024, 1, 1), "no granules")
+
+        cache = NegativeCache(str(tmp_path))
+
+        assert cache.unavailable("HLS_NDVI", "11SPS", date(2024, 1, 1))
+        assert not cache.unavailable("HLS_NDVI", "11SPS", date(2024, 1, 2))
+        assert not cache.unavailable("HLS_albedo", "11SPS", date(2024, 1, 1))
+        assert not cache.unavailable("HLS_NDVI", "11SPT", date(2024, 1, 1))
+
+    def test_recent_record_expires(self, tmp_path):
+        """Test that a record made within the give-up window expires, and one made after it does not."""
+        cache = NegativeCache(str(tmp_path), VIIRS_giveup_days=4, recent_TTL=timedelta(hours=6))
+        today = datetime.utcnow()
+        recent_date = today.date() - timedelta(days=2)
+        past_date = today.date() - timedelta(days=10)
+        cache.record("VIIRS_VNP09GA", "h08v05", recent_date)
+        cache.record("VIIRS_VNP09GA", "h08v05", past_date)
+
+        assert cache.unavailable("VIIRS_VNP09GA", "h08v05", recent_date, now=today)
+        assert not cache.unavailable("VIIRS_VNP09GA", "h08v05", recent_date, now=today + timedelta(hours=7))
+        assert cache.unavailable("VIIRS_VNP09GA", "h08v05", past_date, now=today + timedelta(days=365))
+
+    def test_discard(self, tmp_path):
+        """Test that a discarded record no longer marks the date unavailable."""
+        cache = NegativeCache(str(tmp_path))
+        cache.record("HLS_Sentinel", "11SPS", date(2024, 1, 1))
+        cache.discard("HLS_Sentinel", "11SPS", date(2024, 1, 1))
+
+        assert not NegativeCache(str(tmp_path)).unavailable("HLS_Sentinel", "11SPS", date(2024, 1, 1))
+
+    def test_unknown_source_family(self, tmp_path):
+        """Test that a source without a give-up window is rejected."""
+        with pytest.raises(ValueError):
+            NegativeCache(str(tmp_path)).record("MODIS_MCD43A4", "h08v05", date(2024, 1, 1))
+
+    def test_HLS_giveup_days_configurable(self, tmp_path):
+        """Test that the HLS latency horizon decides when an HLS record becomes permanent."""
+        today = datetime.utcnow()
+        acquisition_date = today.date() - timedelta(days=5)
+        short_horizon = NegativeCache(str(tmp_path / "short"), HLS_giveup_days=3)
+        long_horizon = NegativeCache(str(tmp_path / "long"), HLS_giveup_days=20)
+
+        for cache in (short_horizon, long_horizon):
+            cache.record("HLS_NDVI", "11SPS", acquisition_date)
+
+        assert short_horizon.unavailable("HLS_NDVI", "11SPS", acquisition_date, now=today + timedelta(days=365))
+        assert not long_horizon.unavailable("HLS_NDVI", "11SPS", acquisition_date, now=today + timedelta(days=365))
+
+    def test_shared_cache_per_horizon(self, tmp_path):
+        """Test that runs with different HLS latency horizons do not share a process-wide cache."""
+        directory = str(tmp_path)
+
+        assert get_negative_cache(directory) is get_negative_cache(directory, HLS_giveup_days=HLS_GIVEUP_DAYS)
+        assert get_negative_cache(directory, HLS_giveup_days=3).source_giveup_days("HLS_NDVI") == 3
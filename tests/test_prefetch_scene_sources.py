@@ -0,0 +1,166 @@
+import importlib
+import sys
+import threading
+import pytest
+from datetime import date, datetime
+from types import SimpleNamespace
+from unittest.mock import Mock
+
+# Mock all the missing dependencies before importing
+missing_modules = [
+    'harmonized_landsat_sentinel',
+    'ECOv003_exit_codes',
+    'ECOv002_CMR',
+    'ECOv002_granules',
+    'ECOv003_granules',
+    'GEOS5FP',
+    'modland',
+    'sentinel_tiles',
+    'earthaccess',
+    'colored_logging',
+    'untangle',
+]
+
+for module in missing_modules:
+    sys.modules[module] = Mock()
+
+scene = importlib.import_module("ECOv003_L2T_STARS.prefetch_scene_sources")
+retrieval = importlib.import_module("ECOv003_L2T_STARS.retrieve_STARS_sources")
+from ECOv003_L2T_STARS.negative_cache import NegativeCache
+
+# MODLAND tiles covering each stand-in Sentinel tile geometry
+MODLAND_TILES = {
+    "11SPS": {"h08v05"},
+    "11SPT": {"h08v05", "h08v04"},
+}
+
+
+class HLSSentinelNotAvailable(Exception):
+    pass
+
+
+class HLSLandsatNotAvailable(Exception):
+    pass
+
+
+class HLSTileNotAvailable(Exception):
+    pass
+
+
+@pytest.fixture(autouse=True)
+def stand_ins(monkeypatch):
+    monkeypatch.setattr(scene, "find_modland_tiles", lambda geometry: MODLAND_TILES[geometry])
+    monkeypatch.setattr(scene, "HLSSentinelNotAvailable", HLSSentinelNotAvailable)
+    monkeypatch.setattr(scene, "HLSLandsatNotAvailable", HLSLandsatNotAvailable)
+    monkeypatch.setattr(scene, "HLSTileNotAvailable", HLSTileNotAvailable)
+
+
+class FakeHLSConnection:
+    """Stands in for HLS2Connection, on which Landsat is never available, recording its granule lookups."""
+
+    def __init__(self):
+        self.listing = Mock()
+        self.lookups = []
+        self._lock = threading.Lock()
+
+    def sentinel_granule(self, tile, date_UTC):
+        with self._lock:
+            self.lookups.append(("Sentinel", tile, date_UTC))
+
+        return f"HLS.Sentinel.{tile}.{date_UTC}"
+
+    def landsat_granule(self, tile, date_UTC):
+        with self._lock:
+            self.lookups.append(("Landsat", tile, date_UTC))
+
+        raise HLSLandsatNotAvailable(f"Landsat is not available at tile {tile} on {date_UTC}")
+
+    def sentinel_directory(self, granule, date_UTC):
+        return f"/HLS2/{granule}"
+
+
+@pytest.fixture
+def downloads(monkeypatch):
+    downloads = Mock(side_effect=lambda granule, directory: [f"{directory}/{granule}.tif"])
+    monkeypatch.setattr(retrieval, "earthaccess", Mock(download=downloads))
+
+    return downloads
+
+
+def geometry(tile: str):
+    return SimpleNamespace(boundary_latlon=SimpleNamespace(geometry=tile))
+
+
+class TestPrefetchSceneSources:
+    """Tests for downloading the sources of a scene once before its per-tile runs."""
+
+    def test_windows_combined(self):
+        """Test that MODLAND tiles and VNP09GA dates are the union over the scene's tiles."""
+        MODLAND_tiles, start_date, end_date, HLS_windows = scene.scene_source_windows(
+            tile_geometries={"11SPS": geometry("11SPS"), "11SPT": geometry("11SPT")},
+            tile_dates={"11SPS": date(2024, 6, 20), "11SPT": date(2024, 6, 21)},
+            spinup_days=7,
+            VIIRS_input_days=16,
+        )
+
+        assert MODLAND_tiles == ["h08v04", "h08v05"]
+        assert start_date == date(2024, 5, 28)
+        assert end_date == date(2024, 6, 21)
+        assert HLS_windows["11SPT"] == (date(2024, 6, 14), date(2024, 6, 21))
+
+    def test_each_source_retrieved_once(self, tmp_path, downloads):
+        """Test that VNP09GA is prefetched once for the scene and each HLS tile-date once per sensor."""
+        HLS_connection = FakeHLSConnection()
+        VIIRS_connection = SimpleNamespace(INPUT_DAYS=16, prefetch_VNP09GA=Mock())
+        negative_cache = NegativeCache(str(tmp_path))
+        negative_cache.record("HLS_Sentinel", "11SPS", date(2024, 6, 20))
+        connections = SimpleNamespace(
+            use_VNP43NRT=True,
+            HLS_connection=HLS_connection,
+            NDVI_VIIRS_connection=VIIRS_connection,
+            negative_cache=negative_cache,
+        )
+
+        scene.prefetch_scene_sources(
+            tile_geometries={"11SPS": geometry("11SPS"), "11SPT": geometry("11SPT")},
+            tile_dates={"11SPS": date(2024, 6, 20), "11SPT": date(2024, 6, 20)},
+            connections=connections,
+            spinup_days=1,
+        )
+
+        VIIRS_connection.prefetch_VNP09GA.assert_called_once_with(
+            start_date=date(2024, 6, 3),
+            end_date=date(2024, 6, 20),
+            tiles=["h08v04", "h08v05"],
+        )
+        assert HLS_connection.listing.call_count == 2
+        assert len([lookup for lookup in HLS_connection.lookups if lookup[0] == "Sentinel"]) == 3
+        assert len([lookup for lookup in HLS_connection.lookups if lookup[0] == "Landsat"]) == 4
+        assert downloads.call_count == 3
+        assert negative_cache.unavailable("HLS_Landsat", "11SPT", date(2024, 6, 19), now=datetime.utcnow())
+
+    def test_data_pool_granules_prefetched(self, tmp_path, downloads):
+        """Test that without VNP43NRT the VNP43IA4 and VNP43MA3 granules of the scene are prefetched once each."""
+        NDVI_connection = SimpleNamespace(prefetch_granules=Mock())
+        albedo_connection = SimpleNamespace(prefetch_granules=Mock())
+        connections = SimpleNamespace(
+            use_VNP43NRT=False,
+            HLS_connection=FakeHLSConnection(),
+            NDVI_VIIRS_connection=NDVI_connection,
+            albedo_VIIRS_connection=albedo_connection,
+            negative_cache=NegativeCache(str(tmp_path)),
+        )
+
+        scene.prefetch_scene_sources(
+            tile_geometries={"11SPS": geometry("11SPS"), "11SPT": geometry("11SPT")},
+            tile_dates={"11SPS": date(2024, 6, 20), "11SPT": date(2024, 6, 21)},
+            connections=connections,
+            spinup_days=1,
+        )
+
+        for connection in (NDVI_connection, albedo_connection):
+            connection.prefetch_granules.assert_called_once_with(
+                start_date=date(2024, 6, 19),
+                end_date=date(2024, 6, 21),
+                tiles=["h08v04", "h08v05"],
+            )
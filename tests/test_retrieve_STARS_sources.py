@@ -0,0 +1,184 @@
+import importlib
+import sys
+import threading
+import pytest
+from datetime import date
+from time import sleep
+from types import SimpleNamespace
+from unittest.mock import Mock
+
+# Mock all the missing dependencies before importing
+missing_modules = [
+    'harmonized_landsat_sentinel',
+    'ECOv003_exit_codes',
+    'ECOv002_CMR',
+    'ECOv002_granules',
+    'ECOv003_granules',
+    'GEOS5FP',
+    'modland',
+    'sentinel_tiles',
+    'earthaccess',
+    'colored_logging',
+    'untangle',
+]
+
+for module in missing_modules:
+    sys.modules[module] = Mock()
+
+retrieval = importlib.import_module("ECOv003_L2T_STARS.retrieve_STARS_sources")
+from ECOv003_L2T_STARS.negative_cache import NegativeCache
+
+
+class HLSDownloadFailed(Exception):
+    pass
+
+
+class HLSSentinelNotAvailable(Exception):
+    pass
+
+
+class HLSLandsatNotAvailable(Exception):
+    pass
+
+
+class HLSTileNotAvailable(Exception):
+    pass
+
+
+class AuxiliaryDownloadFailed(Exception):
+    pass
+
+
+@pytest.fixture(autouse=True)
+def exceptions(monkeypatch):
+    for exception in (
+            HLSDownloadFailed,
+            HLSSentinelNotAvailable,
+            HLSLandsatNotAvailable,
+            HLSTileNotAvailable,
+            AuxiliaryDownloadFailed):
+        monkeypatch.setattr(retrieval, exception.__name__, exception, raising=False)
+
+
+class FakeHLSConnection:
+    """Stands in for HLS2Connection, recording its granule lookups and whether any of them overlapped."""
+
+    def __init__(self, unavailable=()):
+        self.listing = Mock()
+        self.unavailable = set(unavailable)
+        self.lookups = []
+        self.overlapped = False
+        self._active = 0
+        self._lock = threading.Lock()
+
+    def _lookup(self, sensor: str, tile: str, date_UTC: date) -> str:
+        with self._lock:
+            self._active += 1
+            self.overlapped = self.overlapped or self._active > 1
+
+        sleep(0.005)
+
+        with self._lock:
+            self._active -= 1
+            self.lookups.append((sensor, date_UTC))
+
+        if (sensor, date_UTC) in self.unavailable:
+            exception = HLSSentinelNotAvailable if sensor == "Sentinel" else HLSLandsatNotAvailable
+            raise exception(f"{sensor} is not available at tile {tile} on {date_UTC}")
+
+        return f"HLS.{sensor}.{tile}.{date_UTC}"
+
+    def sentinel_granule(self, tile, date_UTC):
+        return self._lookup("Sentinel", tile, date_UTC)
+
+    def landsat_granule(self, tile, date_UTC):
+        return self._lookup("Landsat", tile, date_UTC)
+
+    def sentinel_directory(self, granule, date_UTC):
+        return f"/HLS2/{granule}"
+
+    def landsat_directory(self, granule, tile, date_UTC):
+        return f"/HLS2/{granule}"
+
+
+@pytest.fixture
+def transfers(monkeypatch):
+    """Records the granules transferred, failing those listed in `failures` and tracking concurrent transfers."""
+    transfers = SimpleNamespace(granules=[], failures=set(), delays={}, concurrent=0, most_concurrent=0)
+    lock = threading.Lock()
+
+    def download(granule, directory):
+        with lock:
+            transfers.concurrent += 1
+            transfers.most_concurrent = max(transfers.most_concurrent, transfers.concurrent)
+
+        sleep(transfers.delays.get(granule, 0.05))
+
+        with lock:
+            transfers.concurrent -= 1
+            transfers.granules.append(granule)
+
+        if granule in transfers.failures:
+            return [IOError(f"unable to download {granule}")]
+
+        return [f"{directory}/{granule}.tif"]
+
+    monkeypatch.setattr(retrieval, "earthaccess", Mock(download=download))
+
+    return transfers
+
+
+def retrieve(HLS_connection, negative_cache=None):
+    retrieval.retrieve_STARS_sources(
+        tile="11SPS",
+        geometry=None,
+        HLS_start_date=date(2024, 6, 1),
+        HLS_end_date=date(2024, 6, 4),
+        VIIRS_start_date=date(2024, 5, 16),
+        VIIRS_end_date=date(2024, 6, 4),
+        HLS_connection=HLS_connection,
+        VIIRS_connection=SimpleNamespace(prefetch_VNP09GA=Mock()),
+        negative_cache=negative_cache,
+        workers=4,
+    )
+
+
+class TestRetrieveSTARSSources:
+    """Tests for concurrent HLS retrieval over dates and sensors."""
+
+    def test_concurrent_transfers(self, transfers, tmp_path):
+        """Test that granules transfer concurrently while their lookups through the connection never overlap."""
+        HLS_connection = FakeHLSConnection(unavailable={("Sentinel", date(2024, 6, 2))})
+        negative_cache = NegativeCache(str(tmp_path))
+
+        retrieve(HLS_connection, negative_cache)
+
+        assert transfers.most_concurrent > 1
+        assert not HLS_connection.overlapped
+        assert len(HLS_connection.lookups) == 8
+        assert len(transfers.granules) == 7
+        assert negative_cache.unavailable("HLS_Sentinel", "11SPS", date(2024, 6, 2))
+        assert not negative_cache.unavailable("HLS_Landsat", "11SPS", date(2024, 6, 2))
+
+    def test_landsat_retrieved_without_sentinel(self, transfers):
+        """Test that Landsat is retrieved on a date on which Sentinel is not available."""
+        HLS_connection = FakeHLSConnection(unavailable={("Sentinel", date(2024, 6, 2))})
+
+        retrieve(HLS_connection)
+
+        assert "HLS.Landsat.11SPS.2024-06-02" in transfers.granules
+
+    def test_earliest_failure_raised(self, transfers):
+        """Test that the failure raised is the earliest one, whichever download finishes first."""
+        for day in (1, 2, 3, 4):
+            granule = f"HLS.Landsat.11SPS.2024-06-0{day}"
+            # later dates fail first
+            transfers.delays[granule] = 0.01 * (5 - day)
+
+            if day >= 2:
+                transfers.failures.add(granule)
+
+        with pytest.raises(AuxiliaryDownloadFailed, match="2024-06-02"):
+            retrieve(FakeHLSConnection())
+
+        assert len(transfers.granules) == 8
@@ -0,0 +1,109 @@
+import hashlib
+import sys
+import pytest
+import requests
+from unittest.mock import Mock
+
+# Mock all the missing dependencies before importing
+missing_modules = [
+    'harmonized_landsat_sentinel',
+    'ECOv003_exit_codes',
+    'ECOv002_CMR',
+    'ECOv002_granules',
+    'ECOv003_granules',
+    'GEOS5FP',
+    'modland',
+    'sentinel_tiles',
+    'earthaccess',
+    'colored_logging',
+    'untangle',
+]
+
+for module in missing_modules:
+    sys.modules[module] = Mock()
+
+from ECOv003_L2T_STARS.download_scheduler import DownloadScheduler
+from ECOv003_L2T_STARS.LPDAAC.LPDAACDataPool import LPDAACDataPool
+from stand_in_server import StandInServer
+
+CONCEPT = "C0000000000-STANDIN"
+PAYLOAD = bytes(range(256)) * 64
+
+
+@pytest.fixture
+def server():
+    with StandInServer(seed=0) as server:
+        server.add_granule(CONCEPT, "VNP09GA.A2024001.h08v05.002.2024002000000.h5", "2024-01-01", PAYLOAD)
+        server.add_granule(CONCEPT, "VNP09GA.A2024001.h09v05.002.2024002000000.h5", "2024-01-01", PAYLOAD[::-1])
+        server.add_granule(CONCEPT, "VNP09GA.A2024002.h08v05.002.2024003000000.h5", "2024-01-02", PAYLOAD)
+        yield server
+
+
+def search(server: StandInServer, **params) -> list:
+    response = requests.get(f"{server.CMR_search_URL}granules.umm_json", params=params)
+    response.raise_for_status()
+    return response.json()["items"]
+
+
+class TestStandInServer:
+    """Tests for the local CMR, LP DAAC and download stand-in."""
+
+    def test_CMR_search_filters(self, server):
+        """Test that CMR searches are filtered by concept, temporal range and granule name."""
+        assert len(search(server, **{"concept_id[]": CONCEPT})) == 3
+        assert len(search(server, **{"concept_id[]": "C1-OTHER"})) == 0
+
+        granules = search(server, **{
+            "concept_id[]": CONCEPT,
+            "temporal[]": "2024-01-01T00:00:00Z,2024-01-01T23:59:59Z",
+            "readable_granule_name[]": "*.h08v05.*",
+        })
+
+        assert [granule["meta"]["native-id"] for granule in granules] == [
+            "VNP09GA.A2024001.h08v05.002.2024002000000.h5"
+        ]
+
+    def test_download_with_failure_injection(self, server, tmp_path, monkeypatch):
+        """Test that injected failures are retried and the payload matches the synthesized checksum."""
+        from ECOv003_L2T_STARS import download_scheduler
+        monkeypatch.setattr(download_scheduler, "DownloadFailed", RuntimeError)
+
+        granule = search(server, **{"readable_granule_name[]": "*.A2024002.*"})[0]
+        URL = granule["umm"]["RelatedUrls"][0]["URL"]
+        checksum = granule["umm"]["DataGranule"]["ArchiveAndDistributionInformation"][0]["Checksum"]["Value"]
+        server.fail_next(2, "/data/*")
+
+        scheduler = DownloadScheduler(backoff_seconds=0, retries=3, timeout_seconds=10)
+        filename = scheduler.download(URL, str(tmp_path / "granule.h5"), checksum, "SHA-256", len(PAYLOAD))
+
+        assert open(filename, "rb").read() == PAYLOAD
+        assert checksum == hashlib.sha256(PAYLOAD).hexdigest()
+        assert len([request for request in server.requests if request[1].startswith("/data/")]) == 3
+
+    def test_LPDAAC_configuration(self, server):
+        """Test that the data pool connection follows the configured remote to listings and XML metadata."""
+        server.add_LPDAAC_file("VIIRS/VNP43IA4.001/2024.01.01/VNP43IA4.A2024001.h08v05.001.h5", b"granule")
+
+        with server.configure():
+            pool = LPDAACDataPool()
+
+        assert pool.remote == server.LPDAAC_remote
+        assert pool.dates("VIIRS", "VNP43IA4", "001")[0].isoformat() == "2024-01-01"
+
+        files = pool.files("VIIRS", "VNP43IA4", "2024-01-01", "001", pattern="*.h5")
+        metadata = pool.read_HTTP_XML(f"{pool.date_URL('VIIRS', 'VNP43IA4', '2024-01-01', '001')}/{files[0]}.xml")
+        container = metadata["GranuleMetaDataFile"]["GranuleURMetaData"]["DataFiles"]["DataFileContainer"]
+
+        assert files == ["VNP43IA4.A2024001.h08v05.001.h5"]
+        assert int(container["FileSize"]) == len(b"granule")
+
+    def test_recording_round_trip(self, server, tmp_path):
+        """Test that a saved recording is replayed by another server."""
+        server.save(str(tmp_path))
+
+        with StandInServer() as replay:
+            replay.load(str(tmp_path))
+            URL = search(replay, **{"concept_id[]": CONCEPT})[0]["umm"]["RelatedUrls"][0]["URL"]
+
+            assert len(search(replay, **{"concept_id[]": CONCEPT})) == 3
+            assert requests.get(URL.replace(server.URL, replay.URL)).content == PAYLOAD
@@ -1,3 +1,4 @@
+import importlib
 import os
 import sys
 import pytest
@@ -22,7 +23,8 @@ missing_modules = [
 for module in missing_modules:
     sys.modules[module] = Mock()
 
-from ECOv003_L2T_STARS.VNP43NRT.VNP43NRT import process_julia_BRDF
+VNP43NRT_module = importlib.import_module("ECOv003_L2T_STARS.VNP43NRT.VNP43NRT")
+from ECOv003_L2T_STARS.VNP43NRT.VNP43NRT import VNP43NRT, process_julia_BRDF
 
 
 class TestProcessJuliaBRDF:
@@ -141,3 +143,73 @@ class TestProcessJuliaBRDF:
         assert "nir" in command or "nir" in command_str
         assert "/tmp/reflectance" in command or "/tmp/reflectance" in command_str
         assert "/tmp/output" in command or "/tmp/output" in command_str
+
+
+class FakeRaster:
+    """Stand-in for a raster that writes its name to the file it is saved to."""
+
+    def __init__(self, name, fail=False):
+        self.name = name
+        self.fail = fail
+        self.geometry = None
+
+    def __sub__(self, other):
+        return FakeRaster(f"{self.name} - {other.name}")
+
+    def __abs__(self):
+        return self
+
+    def to_geotiff(self, filename, include_preview=True):
+        with open(filename, "w") as file:
+            file.write("partial")
+
+            if self.fail:
+                raise IOError(f"unable to write {self.name}")
+
+            file.seek(0)
+            file.write(self.name)
+
+
+class TestStageVNP09GA:
+    """Tests for staging VNP09GA granules as the inputs of the BRDF inversion."""
+
+    @pytest.fixture
+    def staging(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(VNP43NRT_module, "Raster", lambda array, geometry: array)
+        connection = Mock()
+        connection.generate_staging_filename = lambda tile, processing_date, variable: str(
+            tmp_path / f"{processing_date:%Y-%m-%d}_{variable}.tif")
+
+        return connection
+
+    def granule(self, fail: str = None):
+        return Mock(
+            band=lambda band: FakeRaster("reflectance", fail == "reflectance"),
+            solar_zenith=lambda band: FakeRaster("solar zenith", fail == "solar zenith"),
+            sensor_zenith=lambda band: FakeRaster("sensor zenith", fail == "sensor zenith"),
+            solar_azimuth=lambda band: FakeRaster("solar azimuth"),
+            sensor_azimuth=lambda band: FakeRaster("sensor azimuth"),
+        )
+
+    def test_stages_each_variable(self, staging, tmp_path):
+        """Test that each variable is staged under its own name, with no temporary files left behind."""
+        VNP43NRT.stage_VNP09GA(staging, self.granule(), "h08v05", date(2024, 6, 1), "I1")
+
+        assert sorted(os.listdir(tmp_path)) == [
+            "2024-06-01_I1.tif",
+            "2024-06-01_I_relative_azimuth.tif",
+            "2024-06-01_I_sensor_zenith.tif",
+            "2024-06-01_I_solar_zenith.tif",
+        ]
+        assert (tmp_path / "2024-06-01_I_relative_azimuth.tif").read_text() == "solar azimuth - sensor azimuth"
+
+    def test_failed_write_not_staged(self, staging, tmp_path):
+        """Test that a failed write leaves no partial file for a later run to take as staged."""
+        with pytest.raises(IOError):
+            VNP43NRT.stage_VNP09GA(staging, self.granule(fail="sensor zenith"), "h08v05", date(2024, 6, 1), "I1")
+
+        assert sorted(os.listdir(tmp_path)) == ["2024-06-01_I1.tif", "2024-06-01_I_solar_zenith.tif"]
+
+        VNP43NRT.stage_VNP09GA(staging, self.granule(), "h08v05", date(2024, 6, 1), "I1")
+
+        assert (tmp_path / "2024-06-01_I_sensor_zenith.tif").read_text() == "sensor zenith"
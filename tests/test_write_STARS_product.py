@@ -0,0 +1,166 @@
+import importlib
+import sys
+import threading
+import zipfile
+import numpy as np
+import pytest
+from time import sleep
+from unittest.mock import Mock
+
+# Mock all the missing dependencies before importing
+missing_modules = [
+    'harmonized_landsat_sentinel',
+    'ECOv003_exit_codes',
+    'ECOv002_CMR',
+    'ECOv002_granules',
+    'ECOv003_granules',
+    'GEOS5FP',
+    'modland',
+    'sentinel_tiles',
+    'earthaccess',
+    'colored_logging',
+    'untangle',
+]
+
+for module in missing_modules:
+    sys.modules[module] = Mock()
+
+writer = importlib.import_module("ECOv003_L2T_STARS.write_STARS_product")
+
+
+@pytest.fixture
+def browse(monkeypatch):
+    browse = Mock()
+    monkeypatch.setattr(writer, "write_browse_image", browse)
+    monkeypatch.setitem(sys.modules, "ECOv003_granules.write_XML_metadata", Mock())
+    return browse
+
+
+class Granule:
+    """Stands in for a granule directory, encoding later layers faster than earlier ones."""
+
+    def __init__(self, product_directory):
+        self.product_directory = str(product_directory)
+        self.primary_variable = "NDVI"
+        self.layers = []
+        self.active = 0
+        self.overlap = 0
+        self.lock = threading.Lock()
+
+    def add_layer(self, layer, image, cmap=None):
+        with self.lock:
+            self.active += 1
+            self.overlap = max(self.overlap, self.active)
+
+        order = [name for name, *_ in writer.STARS_LAYERS]
+        sleep(0.005 * (len(order) - order.index(layer)))
+        filename = f"{self.product_directory}/granule_{layer}.tif"
+
+        with open(filename, "w") as file:
+            file.write(layer)
+
+        with self.lock:
+            self.active -= 1
+            self.layers.append(layer)
+
+        return filename
+
+    def write_metadata(self, metadata):
+        with open(f"{self.product_directory}/granule.json", "w") as file:
+            file.write("{}")
+
+
+def write(tmp_path, posterior_filenames=None, granule=None):
+    granule_directory = tmp_path / "granule"
+    granule_directory.mkdir()
+    granule = (granule or Granule)(granule_directory)
+    layers = {layer: Mock(name=layer) for layer, variable, cmap, posterior_cmap in writer.STARS_LAYERS}
+
+    writer.write_STARS_product(
+        granule=granule,
+        layers=layers,
+        metadata={"StandardMetadata": {}},
+        build="0700",
+        L2T_STARS_granule_directory=str(granule_directory),
+        L2T_STARS_zip_filename=str(tmp_path / "product.zip"),
+        L2T_STARS_browse_filename=str(tmp_path / "product.png"),
+        posterior_filenames=posterior_filenames,
+    )
+
+    assert not granule_directory.exists()
+
+    return granule, layers
+
+
+class TestWriteSTARSProduct:
+    """Tests for writing the product outputs once each from the fused layers in memory."""
+
+    def test_posterior_written_once(self, tmp_path, browse):
+        """Test that layers are encoded concurrently and zipped in order, and each kept posterior file written once."""
+        posterior_filenames = {
+            variable: str(tmp_path / f"{variable}.tif")
+            for layer, variable, cmap, posterior_cmap in writer.STARS_LAYERS
+        }
+
+        granule, layers = write(tmp_path, posterior_filenames)
+
+        assert sorted(granule.layers) == sorted(layer for layer, *_ in writer.STARS_LAYERS)
+        assert granule.overlap > 1
+        assert browse.call_args.args[1] is layers["NDVI"]
+
+        with zipfile.ZipFile(tmp_path / "product.zip") as zip_file:
+            assert zip_file.namelist() == [
+                f"product/granule_{layer}.tif" for layer, *_ in writer.STARS_LAYERS
+            ] + ["product/granule.json"]
+
+        for layer, variable, cmap, posterior_cmap in writer.STARS_LAYERS:
+            layers[layer].to_geotiff.assert_called_once_with(posterior_filenames[variable], cmap=posterior_cmap)
+
+    def test_removed_posterior_not_encoded(self, tmp_path, browse):
+        """Test that the posterior is not re-encoded when it is about to be removed."""
+        granule, layers = write(tmp_path)
+
+        assert (tmp_path / "product.zip").exists()
+        assert browse.call_count == 1
+
+        for layer in layers.values():
+            layer.to_geotiff.assert_not_called()
+
+
+    def test_failed_layer_leaves_no_product(self, tmp_path, browse):
+        """Test that a layer failing to encode leaves neither a product zip nor its temporary file."""
+        class FailingGranule(Granule):
+            def add_layer(self, layer, image, cmap=None):
+                if layer == "albedo-UQ":
+                    raise IOError("unable to encode albedo-UQ")
+
+                return super().add_layer(layer, image, cmap=cmap)
+
+        with pytest.raises(IOError, match="albedo-UQ"):
+            write(tmp_path, granule=FailingGranule)
+
+        assert not (tmp_path / "product.zip").exists()
+        assert not (tmp_path / "product.zip.tmp").exists()
+
+
+class TestBrowseOverview:
+    """Tests for reducing a layer to its browse image shape."""
+
+    def test_block_average(self):
+        """Test that a layer is block-averaged by the largest factor keeping the overview no smaller than the browse image."""
+        array = np.arange(64 * 64, dtype=np.float32).reshape(64, 64)
+        array[:8, :8] = np.nan
+
+        overview = writer.browse_overview(array, (16, 16), max_factor=8)
+
+        assert overview.shape == (16, 16)
+        assert np.isnan(overview[0, 0]) and np.isnan(overview[1, 1])
+        assert overview[2, 3] == array[8:12, 12:16].mean()
+
+    def test_small_layer_sampled(self):
+        """Test that a layer smaller than the browse image is sampled without averaging."""
+        array = np.arange(4, dtype=np.float32).reshape(2, 2)
+
+        overview = writer.browse_overview(array, (4, 4))
+
+        assert overview.tolist() == [[0, 0, 1, 1], [0, 0, 1, 1], [2, 2, 3, 3], [2, 2, 3, 3]]